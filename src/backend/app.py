@@ -1,19 +1,68 @@
 import os
+import asyncio
+import secrets
 from pathlib import Path
-from fastapi import FastAPI, HTTPException
+from datetime import date
+from typing import Optional
+from dotenv import load_dotenv
+
+# 先加载 .env，各模块在导入时读取配置
+load_dotenv()
+
+from fastapi import FastAPI, HTTPException, Query, Header, Request
+from fastapi.responses import JSONResponse, Response, StreamingResponse
 from fastapi.staticfiles import StaticFiles
 from fastapi.middleware.cors import CORSMiddleware
-from sqlalchemy import select, delete, update, func
-from .db import Base, engine, SessionLocal
+from starlette.concurrency import run_in_threadpool
+from sqlalchemy import select, delete, update, func, case
+from .db import Base, engine, async_engine, AsyncSessionLocal, add_missing_columns
 from .models import WatchItem, ABSignalCache, StockQuoteCache
-from .schemas import WatchCreate, WatchItemOut, ABSignalOut, QuoteOut, ChartOut
-from .services.prices import get_quote, get_intraday_points, validate_symbol, get_symbol_info
-from .scheduler import create_scheduler
-from dotenv import load_dotenv
+from .schemas import WatchCreate, WatchItemOut, ABSignalOut, SignalEventOut, QuoteOut, ChartOut, DashboardRow
+from .services.prices import (
+    get_quote_async, get_quotes_async, get_chart_arrays_async, get_symbol_info_async,
+    peek_cached_quote, peek_cached_chart, chart_to_points, cache_stats, shutdown_background,
+    warm_quote_cache, downsample_chart, yf_executor,
+)
+from .services.signals import (
+    signal_to_dict, get_cached_signal_async, cache_signal, invalidate_signal, warm_signal_cache, store_signal,
+    backfill_signal_events, query_signal_events,
+)
+from .services.singleflight import AsyncSingleFlight
+from .services.views import record_view
+from .services.events import bus, format_sse
+from .services import parsepool, metrics, upstream
+from .services.timing import ServerTimingMiddleware, instrument_engine
+from .services.profiler import profiler
+from .routing import TimedRoute
+from .services.upstream import breaker_stats
+from .services.executor import ExecutorBusy
+from .services.backtest import DEFAULT_HORIZONS, MAX_HORIZON, run_backtest, sync_daily_bars, backtest_cache_stats
+from .services.watchlist import IMPORT_MAX_SYMBOLS, parse_import_body, start_import, get_import_job, shutdown_imports
+from .services.bars import query_bars_since_async
+from .services.market import last_open
+from .services.chart_codec import (
+    CHART_FORMATS, COLUMNAR_MEDIA_TYPE, BINARY_MEDIA_TYPE,
+    negotiate_format, encode_columnar, encode_binary,
+)
+from .scheduler import create_scheduler, planner
 
-load_dotenv()
+# 批量接口单次允许的最大股票数
+MAX_BULK_SYMBOLS = int(os.getenv("MAX_BULK_SYMBOLS", "500"))
+# 历史信号查询单次返回的最大条数
+EVENTS_MAX_LIMIT = int(os.getenv("SIGNAL_EVENTS_MAX_LIMIT", "5000"))
+# 仪表盘迷你曲线使用的图表参数和最大点数
+SPARK_PERIOD = "1d"
+SPARK_INTERVAL = "5m"
+SPARK_MAX_POINTS = int(os.getenv("SPARK_MAX_POINTS", "100"))
+# 实时流：没有事件时发送心跳的间隔（秒），以及断线后浏览器的重连间隔（毫秒）
+STREAM_HEARTBEAT_SEC = float(os.getenv("STREAM_HEARTBEAT_SEC", "15"))
+STREAM_RETRY_MS = int(os.getenv("STREAM_RETRY_MS", "5000"))
+# 管理接口（采样分析器）的令牌，未设置时管理接口不可用
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN", "")
 
 app = FastAPI(title="AB Watch Dashboard")
+# 记录接口函数和序列化耗时，写入 Server-Timing 头
+app.router.route_class = TimedRoute
 
 # 静态文件服务 - 前后端一体化 (在API路由之后挂载)
 FRONTEND_DIR = Path(__file__).parent.parent / "frontend"
@@ -26,129 +75,446 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+# 按路由记录请求耗时，供 /metrics 导出
+app.add_middleware(metrics.MetricsMiddleware)
+app.add_middleware(ServerTimingMiddleware)
+instrument_engine(engine)
+instrument_engine(async_engine.sync_engine)
 
 # 初始化 DB
 Base.metadata.create_all(bind=engine)
+add_missing_columns(engine)
 scheduler = create_scheduler()
 scheduler.start()
 
+@app.on_event("startup")
+def on_startup():
+    # 从持久化的缓存表预热内存缓存，重启后不会集中请求上游
+    warm_quote_cache()
+    warm_signal_cache()
+    backfill_signal_events()
+
 @app.on_event("shutdown")
-def on_shutdown():
+async def on_shutdown():
     scheduler.shutdown(wait=False)
+    shutdown_background()
+    parsepool.shutdown()
+    shutdown_imports()
+    await upstream.aclose()
+    await async_engine.dispose()
+
+@app.exception_handler(ExecutorBusy)
+async def executor_busy_handler(request: Request, exc: ExecutorBusy):
+    # 上游调用排队已满：让客户端稍后重试，而不是继续占用连接排队
+    return JSONResponse({"detail": str(exc)}, status_code=503, headers={"Retry-After": "5"})
 
 # ---- Watchlist CRUD ----
 @app.get("/api/watchlist", response_model=list[WatchItemOut])
-def list_watchlist():
-    db = SessionLocal()
-    try:
-        items = db.execute(select(WatchItem).order_by(WatchItem.display_order)).scalars().all()
+async def list_watchlist():
+    async with AsyncSessionLocal() as db:
+        items = (await db.execute(select(WatchItem).order_by(WatchItem.display_order))).scalars().all()
         return [{"symbol": w.symbol, "name": w.name} for w in items]
-    finally:
-        db.close()
 
 @app.post("/api/watchlist", response_model=WatchItemOut)
-def add_watch(item: WatchCreate):
+async def add_watch(item: WatchCreate):
     sym = item.symbol.upper().strip()
     if not sym:
         raise HTTPException(400, "symbol required")
     
-    # 使用AmericanBulls验证股票代码并获取公司名称
-    symbol_info = get_symbol_info(sym)
+    # 使用AmericanBulls验证股票代码并获取公司名称，同一个页面顺便解析出 AB 信号
+    symbol_info = await get_symbol_info_async(sym, with_signals=True)
+    if symbol_info.get("error"):
+        # 上游不可用，无法判断代码是否有效
+        raise HTTPException(503, f"Cannot validate '{sym}' now: {symbol_info['error']}")
     if not symbol_info.get("valid", False):
         raise HTTPException(400, f"Stock symbol '{sym}' not found on AmericanBulls")
     
     # 使用从AB获取的公司名称，如果用户没有提供的话
     company_name = item.name or symbol_info.get("name") or sym
+    signals = symbol_info.get("signals")
     
-    db = SessionLocal()
-    try:
-        exists = db.execute(select(WatchItem).where(WatchItem.symbol==sym)).scalar_one_or_none()
+    async with AsyncSessionLocal() as db:
+        exists = (await db.execute(select(WatchItem).where(WatchItem.symbol==sym))).scalar_one_or_none()
         if exists:
             # 如果存在但名称为空，更新名称
             if not exists.name and company_name:
                 exists.name = company_name
-                db.commit()
-            return {"symbol": exists.symbol, "name": exists.name}
-        
-        # 获取最大排序值
-        max_order = db.execute(select(func.max(WatchItem.display_order))).scalar() or 0
+            result = {"symbol": exists.symbol, "name": exists.name}
+        else:
+            # 获取最大排序值
+            max_order = (await db.execute(select(func.max(WatchItem.display_order)))).scalar() or 0
+            db.add(WatchItem(symbol=sym, name=company_name, display_order=max_order + 1))
+            result = {"symbol": sym, "name": company_name}
         
-        obj = WatchItem(symbol=sym, name=company_name, display_order=max_order + 1)
-        db.add(obj)
-        db.commit()
-        return {"symbol": sym, "name": company_name}
-    finally:
-        db.close()
+        # 监控项和 AB 信号在同一个事务里写入，详情页不需要再即时抓取
+        if signals:
+            await db.run_sync(store_signal, sym, signals)
+        await db.commit()
+    if signals:
+        invalidate_signal(sym)
+        data = await get_cached_signal_async(sym)
+        if data:
+            bus.publish("signal", sym, data)
+    return result
 
-@app.delete("/api/watchlist/{symbol}")
-def del_watch(symbol: str):
-    db = SessionLocal()
+@app.post("/api/watchlist/import", status_code=202)
+async def import_watchlist(request: Request):
+    """批量导入：JSON 代码列表或 CSV 文本，在后台验证和插入，返回任务状态"""
+    body = await request.body()
     try:
-        db.execute(delete(WatchItem).where(WatchItem.symbol==symbol.upper()))
-        db.execute(delete(ABSignalCache).where(ABSignalCache.symbol==symbol.upper()))
-        db.execute(delete(StockQuoteCache).where(StockQuoteCache.symbol==symbol.upper()))
-        db.commit()
-        return {"ok": True}
-    finally:
-        db.close()
+        entries = parse_import_body(body, request.headers.get("content-type", ""))
+    except ValueError as e:  # 包括 JSON 解析错误
+        raise HTTPException(400, f"invalid import body: {e}")
+    if not entries:
+        raise HTTPException(400, "symbols required")
+    if len(entries) > IMPORT_MAX_SYMBOLS:
+        raise HTTPException(400, f"too many symbols (max {IMPORT_MAX_SYMBOLS})")
+    
+    # 验证要逐个访问上游，大文件需要很久，不在请求里等待
+    return start_import(entries)
+
+@app.get("/api/watchlist/import/{job_id}")
+async def import_status(job_id: str):
+    """导入任务的进度；完成后包含 summary 和每个代码的结果"""
+    job = get_import_job(job_id)
+    if job is None:
+        raise HTTPException(404, "import job not found")
+    return job
+
+@app.delete("/api/watchlist/{symbol}")
+async def del_watch(symbol: str):
+    async with AsyncSessionLocal() as db:
+        await db.execute(delete(WatchItem).where(WatchItem.symbol==symbol.upper()))
+        await db.execute(delete(ABSignalCache).where(ABSignalCache.symbol==symbol.upper()))
+        await db.execute(delete(StockQuoteCache).where(StockQuoteCache.symbol==symbol.upper()))
+        await db.commit()
+    invalidate_signal(symbol)
+    bus.forget(symbol.upper())
+    return {"ok": True}
 
 @app.put("/api/watchlist/reorder")
-def reorder_watchlist(order_data: list[dict]):
+async def reorder_watchlist(order_data: list[dict]):
     """更新监控列表的显示顺序"""
-    db = SessionLocal()
-    try:
-        for item in order_data:
-            symbol = item.get("symbol", "").upper()
-            order = item.get("order", 0)
-            if symbol:
-                db.execute(
-                    update(WatchItem).where(WatchItem.symbol == symbol).values(display_order=order)
-                )
-        db.commit()
+    orders = {}
+    for item in order_data:
+        symbol = item.get("symbol", "").upper()
+        if symbol:
+            orders[symbol] = item.get("order", 0)
+    if not orders:
         return {"ok": True}
-    finally:
-        db.close()
+    
+    async with AsyncSessionLocal() as db:
+        # 一条 UPDATE ... SET display_order = CASE symbol WHEN ... END
+        await db.execute(
+            update(WatchItem)
+            .where(WatchItem.symbol.in_(list(orders)))
+            .values(display_order=case(orders, value=WatchItem.symbol))
+        )
+        await db.commit()
+    return {"ok": True}
 
 # ---- AB Signals ----
+_ab_flight = AsyncSingleFlight()
+
+async def _scrape_ab(symbol: str) -> dict:
+    """即时抓取一次并写入缓存（同一股票的并发请求只会抓一次）"""
+    query = select(ABSignalCache).where(ABSignalCache.symbol==symbol)
+    async with AsyncSessionLocal() as db:
+        obj = (await db.execute(query)).scalar_one_or_none()
+        if not obj:
+            # 抓取期间不占用数据库连接
+            await db.close()
+            from .services.americanbulls import fetch_ab_for_symbol_async
+            data = await fetch_ab_for_symbol_async(symbol)
+            await db.run_sync(store_signal, symbol, data)
+            await db.commit()
+            obj = (await db.execute(query)).scalar_one()
+        data = signal_to_dict(obj)
+    cache_signal(data)
+    # 与调度器一样推送给实时流的订阅者（内容没变时事件总线不会推送）
+    bus.publish("signal", symbol, data)
+    return data
+
 @app.get("/api/ab/{symbol}", response_model=ABSignalOut)
-def get_ab(symbol: str):
-    db = SessionLocal()
+async def get_ab(symbol: str):
+    symbol = symbol.upper()
+    record_view(symbol)
+    cached = await get_cached_signal_async(symbol)
+    if cached is not None:
+        return cached
+    
+    # 未缓存则尝试即时抓一次
+    return await _ab_flight.do(("ab", symbol), _scrape_ab, symbol)
+
+@app.get("/api/signals/events", response_model=list[SignalEventOut])
+async def api_signal_events(
+    symbols: str = Query("", description="逗号分隔的股票代码，为空时查询全部"),
+    signal: str = Query("", description="逗号分隔的信号类型，如 SELL,SHORT"),
+    start: Optional[date] = Query(None, description="起始日期（含），YYYY-MM-DD"),
+    end: Optional[date] = Query(None, description="结束日期（含），YYYY-MM-DD"),
+    latest: bool = Query(False, description="每个股票只看最新的一条信号"),
+    limit: int = Query(500, ge=1),
+):
+    wanted = [s.strip().upper() for s in symbols.split(",") if s.strip()]
+    if len(wanted) > MAX_BULK_SYMBOLS:
+        raise HTTPException(400, f"too many symbols (max {MAX_BULK_SYMBOLS})")
+    if start and end and start > end:
+        raise HTTPException(400, "start must not be after end")
+    signals = [s.strip().upper() for s in signal.split(",") if s.strip()]
+    async with AsyncSessionLocal() as db:
+        return await db.run_sync(
+            query_signal_events, wanted or None, signals or None, start, end, latest, min(limit, EVENTS_MAX_LIMIT),
+        )
+
+# ---- Backtest ----
+@app.get("/api/backtest")
+async def api_backtest(
+    symbols: str = Query("", description="逗号分隔的股票代码，为空时为整个监控列表"),
+    signal: str = Query("", description="逗号分隔的信号类型，为空时统计全部"),
+    horizons: str = Query(",".join(map(str, DEFAULT_HORIZONS)), description="逗号分隔的持有期（交易日）"),
+    start: Optional[date] = Query(None, description="信号起始日期（含）"),
+    end: Optional[date] = Query(None, description="信号结束日期（含）"),
+    events: bool = Query(False, description="是否返回逐条信号的结果"),
+    sync: bool = Query(False, description="先从上游补全日线（较慢）"),
+):
+    """用本地日线和历史信号回测 AB 信号之后的收益、命中率和回撤"""
+    wanted = list(dict.fromkeys(s.strip().upper() for s in symbols.split(",") if s.strip()))
+    if not wanted:
+        async with AsyncSessionLocal() as db:
+            wanted = (await db.execute(select(WatchItem.symbol).order_by(WatchItem.display_order))).scalars().all()
     try:
-        obj = db.execute(select(ABSignalCache).where(ABSignalCache.symbol==symbol.upper())).scalar_one_or_none()
-        if not obj:
-            # 未缓存则尝试即时抓一次
-            from .services.americanbulls import fetch_ab_for_symbol
-            data = fetch_ab_for_symbol(symbol)
-            obj = ABSignalCache(
-                symbol=symbol.upper(), 
-                suggestion=data.get("suggestion"),
-                signal_history=data.get("signal_history", []),
-                summary=data.get("summary"),
-                technical_indicators=data.get("technical_indicators", {}),
-                price_target=data.get("price_target")
-            )
-            db.add(obj); db.commit(); db.refresh(obj)
-        
-        return {
-            "symbol": obj.symbol,
-            "suggestion": obj.suggestion,
-            "signal_history": obj.signal_history or [],
-            "summary": obj.summary,
-            "technical_indicators": obj.technical_indicators or {},
-            "price_target": obj.price_target,
-            "updated_at": obj.updated_at.isoformat() if obj.updated_at else None
-        }
-    finally:
-        db.close()
+        steps = sorted({int(h) for h in horizons.split(",") if h.strip()})
+    except ValueError:
+        raise HTTPException(400, "horizons must be integers")
+    if not steps or steps[0] < 1 or steps[-1] > MAX_HORIZON:
+        raise HTTPException(400, f"horizons must be between 1 and {MAX_HORIZON}")
+    if start and end and start > end:
+        raise HTTPException(400, "start must not be after end")
+
+    if sync:
+        await yf_executor.run(sync_daily_bars, wanted)
+    signals = [s.strip().upper() for s in signal.split(",") if s.strip()]
+    # 读库和 numpy 计算放到线程池
+    return await run_in_threadpool(run_backtest, wanted, steps, signals or None, start, end, include_events=events)
 
 # ---- Quotes ----
 @app.get("/api/quote/{symbol}", response_model=QuoteOut)
-def api_quote(symbol: str):
-    return get_quote(symbol)
+async def api_quote(symbol: str):
+    record_view(symbol)
+    return await get_quote_async(symbol)
+
+@app.get("/api/quotes", response_model=list[QuoteOut])
+async def api_quotes(symbols: str = Query(..., description="逗号分隔的股票代码，如 AAPL,MSFT")):
+    wanted = list(dict.fromkeys(s.strip().upper() for s in symbols.split(",") if s.strip()))
+    if not wanted:
+        raise HTTPException(400, "symbols required")
+    if len(wanted) > MAX_BULK_SYMBOLS:
+        raise HTTPException(400, f"too many symbols (max {MAX_BULK_SYMBOLS})")
+    
+    quotes = await get_quotes_async(wanted)
+    empty = {"price": None, "change": None, "currency": None, "volume": None}
+    return [quotes.get(sym) or {"symbol": sym, **empty} for sym in wanted]
 
 @app.get("/api/chart/{symbol}", response_model=ChartOut)
-def api_chart(symbol: str, period: str="1d", interval: str="1m"):
-    return get_intraday_points(symbol, period=period, interval=interval)
+async def api_chart(symbol: str, response: Response, period: str="1d", interval: str="1m",
+              max_points: Optional[int] = Query(None, ge=3, description="LTTB 降采样后的最大点数"),
+              format: str = Query("", description="json（默认）/ columnar / binary，也可通过 Accept 头协商"),
+              accept: Optional[str] = Header(None)):
+    # 响应格式由 Accept 协商：所有响应（包括默认的 JSON 和格式错误）都要带 Vary，共享缓存才不会串格式
+    headers = {"Vary": "Accept"}
+    fmt = negotiate_format(format, accept)
+    if fmt not in CHART_FORMATS:
+        raise HTTPException(400, f"unsupported format '{fmt}'", headers=headers)
+    record_view(symbol)
+    chart = await get_chart_arrays_async(symbol, period=period, interval=interval)
+    if fmt == "json":
+        response.headers.update(headers)
+        return chart_to_points(chart, max_points)
+    
+    chart = downsample_chart(chart, max_points)
+    if fmt == "columnar":
+        return JSONResponse(encode_columnar(chart), media_type=COLUMNAR_MEDIA_TYPE, headers=headers)
+    
+    headers.update({
+        "X-Chart-Symbol": chart["symbol"],
+        "X-Chart-Stale": "1" if chart.get("stale") else "0",
+    })
+    if chart.get("age") is not None:
+        headers["X-Chart-Age"] = str(chart["age"])
+    return Response(encode_binary(chart), media_type=BINARY_MEDIA_TYPE, headers=headers)
+
+@app.get("/api/cache/stats")
+async def api_cache_stats():
+    return cache_stats() + [backtest_cache_stats()]
+
+@app.get("/api/scheduler/status")
+async def api_scheduler_status():
+    """各类刷新任务的股票数、当前到期数和最早的下次到期时间，以及解析进程池的状态"""
+    return {**planner.snapshot(), "parse_pool": parsepool.stats()}
+
+# ---- Metrics ----
+@metrics.register_collector
+def _runtime_metrics():
+    """缓存、熔断、解析进程池、实时流和刷新调度的当前状态，在抓取 /metrics 时读取"""
+    caches = cache_stats() + [backtest_cache_stats()]
+    for field in ("hits", "misses", "evictions"):
+        yield (f"cache_{field}", "counter", f"Cache {field}",
+               [({"cache": c["name"]}, c[field]) for c in caches])
+    yield "cache_entries", "gauge", "Cache entries", [({"cache": c["name"]}, c["size"]) for c in caches]
+
+    breakers = breaker_stats()
+    yield ("circuit_breaker_open", "gauge", "1 if the host circuit is open or half-open",
+           [({"host": b["host"]}, int(b["state"] != "closed")) for b in breakers])
+    yield ("circuit_breaker_failures", "gauge", "Consecutive failures per host",
+           [({"host": b["host"]}, b["failures"]) for b in breakers])
+
+    pool = parsepool.stats()
+    yield ("parse_pool_pages", "counter", "Pages parsed by mode",
+           [({"mode": "pool"}, pool["pooled"]), ({"mode": "inline"}, pool["inline"])])
+    yield "parse_pool_broken", "counter", "Parse pool crashes", [({}, pool["broken"])]
+
+    stream = bus.stats()
+    yield "stream_subscribers", "gauge", "Connected SSE clients", [({}, stream["subscribers"])]
+
+    executor = yf_executor.stats()
+    labels = {"executor": executor["name"]}
+    yield "executor_pending", "gauge", "Calls running or queued in a bounded executor", [(labels, executor["pending"])]
+    yield "executor_rejected", "counter", "Calls rejected because the executor queue was full", [(labels, executor["rejected"])]
+
+    status = planner.snapshot()
+    yield ("refresh_due_symbols", "gauge", "Symbols currently due for refresh",
+           [({"job": job}, status[job]["due_now"]) for job in ("quote", "ab")])
+
+@app.get("/metrics", include_in_schema=False)
+async def api_metrics():
+    return Response(metrics.render(), media_type=metrics.CONTENT_TYPE)
+
+# ---- Admin ----
+def _require_admin(request: Request):
+    if not ADMIN_TOKEN:
+        raise HTTPException(404, "admin endpoints disabled (ADMIN_TOKEN not set)")
+    token = request.headers.get("x-admin-token") or ""
+    auth = request.headers.get("authorization") or ""
+    if not token and auth.lower().startswith("bearer "):
+        token = auth[7:]
+    if not secrets.compare_digest(token.encode(), ADMIN_TOKEN.encode()):
+        raise HTTPException(401, "invalid admin token")
+
+@app.post("/api/admin/profile")
+async def api_profile_start(request: Request,
+                      seconds: float = Query(30, gt=0, description="采样时长（秒）"),
+                      interval_ms: float = Query(10, gt=0, description="采样间隔（毫秒）")):
+    """开始采样分析，结束后把 folded stacks 写入 PROFILE_DIR"""
+    _require_admin(request)
+    try:
+        return profiler.start(seconds, interval_ms)
+    except RuntimeError as e:
+        raise HTTPException(409, str(e))
+
+@app.get("/api/admin/profile")
+async def api_profile_status(request: Request):
+    _require_admin(request)
+    return profiler.status()
+
+@app.delete("/api/admin/profile")
+def api_profile_stop(request: Request):
+    """提前结束采样（已采集的部分照常保存）；要等采样线程退出，保留为同步接口"""
+    _require_admin(request)
+    profiler.stop()
+    return profiler.status()
+
+@app.get("/api/admin/profile/folded")
+async def api_profile_folded(request: Request):
+    """当前或上一次采样的 folded stacks，可直接生成火焰图"""
+    _require_admin(request)
+    if not profiler.samples:
+        raise HTTPException(404, "no profile collected")
+    return Response(profiler.folded(), media_type="text/plain; charset=utf-8")
+
+# ---- Live stream ----
+@app.get("/api/stream")
+async def api_stream(request: Request,
+                     symbols: str = Query("", description="逗号分隔的股票代码，为空时订阅全部")):
+    """SSE：推送报价（event: quote）和 AB 信号（event: signal）的变更，内容没变时不推送"""
+    wanted = {s.strip().upper() for s in symbols.split(",") if s.strip()}
+    if len(wanted) > MAX_BULK_SYMBOLS:
+        raise HTTPException(400, f"too many symbols (max {MAX_BULK_SYMBOLS})")
+    try:
+        sub = bus.subscribe(wanted or None)
+    except RuntimeError as e:
+        raise HTTPException(503, str(e))
+    
+    async def events():
+        try:
+            yield f"retry: {STREAM_RETRY_MS}\n\n"
+            while True:
+                try:
+                    event = await asyncio.wait_for(sub.queue.get(), STREAM_HEARTBEAT_SEC)
+                except asyncio.TimeoutError:
+                    if await request.is_disconnected():
+                        break
+                    # 注释行作为心跳，防止代理断开空闲连接
+                    yield ": ping\n\n"
+                    continue
+                yield format_sse(event)
+        finally:
+            bus.unsubscribe(sub)
+    
+    return StreamingResponse(
+        events(), media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+# ---- Dashboard ----
+@app.get("/api/dashboard", response_model=list[DashboardRow])
+async def api_dashboard():
+    """一次返回整个监控列表：缓存的报价、迷你曲线（含本地 K 线）和AB信号，不访问上游"""
+    async with AsyncSessionLocal() as db:
+        items = (await db.execute(select(WatchItem).order_by(WatchItem.display_order))).scalars().all()
+        symbols = [w.symbol for w in items]
+        quotes = {q.symbol: q for q in (await db.execute(
+            select(StockQuoteCache).where(StockQuoteCache.symbol.in_(symbols))
+        )).scalars()}
+        signals = {a.symbol: a for a in (await db.execute(
+            select(ABSignalCache).where(ABSignalCache.symbol.in_(symbols))
+        )).scalars()}
+        
+        # 内存里没有迷你曲线的股票，用本地存储的最近一个交易日的 5 分钟 K 线补上（一次查询）
+        charts = {}
+        for symbol in symbols:
+            chart = peek_cached_chart(symbol, SPARK_PERIOD, SPARK_INTERVAL)
+            if chart and len(chart["t"]):
+                charts[symbol] = chart
+        missing = [s for s in symbols if s not in charts]
+        if missing:
+            start_ms = int(last_open().timestamp() * 1000)
+            for symbol, (t, p) in (await query_bars_since_async(db, missing, SPARK_INTERVAL, start_ms)).items():
+                if len(t):
+                    charts[symbol] = {"symbol": symbol, "t": t, "p": p}
+
+        rows = []
+        for w in items:
+            # 内存缓存比持久化的报价更新，优先使用
+            quote = peek_cached_quote(w.symbol)
+            if quote is None and w.symbol in quotes:
+                q = quotes[w.symbol]
+                quote = {
+                    "symbol": w.symbol, "price": q.price, "change": q.change_pct,
+                    "currency": q.currency, "volume": q.volume,
+                }
+            
+            chart = charts.get(w.symbol)
+            sparkline = chart_to_points(chart, SPARK_MAX_POINTS)["points"] if chart else None
+            
+            ab = signals.get(w.symbol)
+            rows.append({
+                "symbol": w.symbol,
+                "name": w.name,
+                "quote": quote,
+                "sparkline": sparkline,
+                "ab": signal_to_dict(ab) if ab else None,
+            })
+        return rows
 
 # 在所有API路由定义完成后挂载静态文件
 app.mount("/assets", StaticFiles(directory=FRONTEND_DIR / "assets"), name="assets")
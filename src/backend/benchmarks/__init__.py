@@ -0,0 +1,4 @@
+"""离线基准测试：用保存的 AB 页面和合成 OHLCV 数据测量解析、报价整理和序列化的性能
+
+在 src 目录下运行：python -m backend.benchmarks --help
+"""
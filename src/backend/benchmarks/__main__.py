@@ -0,0 +1,49 @@
+import argparse
+import json
+import sys
+from pathlib import Path
+from .runner import MIN_SECONDS, compare, format_table, load_baseline, measure, save_baseline
+from .stages import all_stages
+
+DEFAULT_BASELINE = Path(__file__).parent / "baseline.json"
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m backend.benchmarks", description="离线性能基准")
+    parser.add_argument("-k", "--filter", default="", help="只运行名称包含该字符串的阶段")
+    parser.add_argument("--baseline", type=Path, default=DEFAULT_BASELINE, help="基线文件路径")
+    parser.add_argument("--save-baseline", action="store_true", help="把本次结果保存为基线")
+    parser.add_argument("--threshold", type=float, default=0.2, help="比基线慢多少视为回归（默认 0.2 即 20%%）")
+    parser.add_argument("--min-seconds", type=float, default=MIN_SECONDS, help="每个阶段最少运行的秒数")
+    parser.add_argument("--json", action="store_true", help="以 JSON 输出结果")
+    args = parser.parse_args(argv)
+
+    results = [
+        measure(name, fn, items, min_seconds=args.min_seconds)
+        for name, fn, items in all_stages()
+        if args.filter in name
+    ]
+    if not results:
+        print(f"No stage matches '{args.filter}'", file=sys.stderr)
+        return 2
+
+    regressions = []
+    if args.save_baseline:
+        save_baseline(args.baseline, results)
+    else:
+        baseline = load_baseline(args.baseline)
+        if baseline is not None:
+            compare(results, baseline, args.threshold)
+            regressions = [r["name"] for r in results if r["regression"]]
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        print(format_table(results))
+        if args.save_baseline:
+            print(f"\nBaseline saved to {args.baseline}")
+        elif regressions:
+            print(f"\n{len(regressions)} stage(s) slower than baseline by more than {args.threshold:.0%}")
+    return 1 if regressions else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,79 @@
+import gc
+import json
+import time
+import tracemalloc
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+
+# 单个阶段最少运行的时间和次数
+MIN_SECONDS = 0.5
+MIN_ROUNDS = 5
+
+def measure(name: str, fn: Callable[[], Any], items: int = 1,
+            min_seconds: float = MIN_SECONDS, min_rounds: int = MIN_ROUNDS) -> Dict[str, Any]:
+    """重复运行 fn，返回耗时、吞吐量和峰值内存；items 为每次调用处理的条目数"""
+    fn()  # 预热：导入、正则编译、首次分配
+    gc.collect()
+
+    # 峰值内存单独跑一次，tracemalloc 会拖慢计时
+    tracemalloc.start()
+    try:
+        fn()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    times: List[float] = []
+    deadline = time.perf_counter() + min_seconds
+    while len(times) < min_rounds or time.perf_counter() < deadline:
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+
+    times.sort()
+    median = times[len(times) // 2]
+    return {
+        "name": name,
+        "rounds": len(times),
+        "median_ms": round(median * 1000, 4),
+        "min_ms": round(times[0] * 1000, 4),
+        "items_per_sec": round(items / median, 1) if median > 0 else None,
+        "peak_kb": round(peak / 1024, 1),
+    }
+
+def load_baseline(path: Path) -> Optional[Dict[str, Dict[str, Any]]]:
+    if not path.exists():
+        return None
+    with path.open(encoding="utf-8") as f:
+        return {r["name"]: r for r in json.load(f)["results"]}
+
+def save_baseline(path: Path, results: List[Dict[str, Any]]):
+    with path.open("w", encoding="utf-8") as f:
+        json.dump({"created_at": time.strftime("%Y-%m-%dT%H:%M:%S"), "results": results}, f, indent=2)
+
+def compare(results: List[Dict[str, Any]], baseline: Dict[str, Dict[str, Any]],
+            threshold: float) -> List[Dict[str, Any]]:
+    """给每个结果加上相对基线的耗时比例，超过 1+threshold 记为回归"""
+    for r in results:
+        base = baseline.get(r["name"])
+        if not base or not base.get("median_ms"):
+            r["ratio"] = None
+            r["regression"] = False
+            continue
+        r["ratio"] = round(r["median_ms"] / base["median_ms"], 3)
+        r["regression"] = r["ratio"] > 1 + threshold
+    return results
+
+def format_table(results: List[Dict[str, Any]]) -> str:
+    with_ratio = any("ratio" in r for r in results)
+    header = f"{'stage':<42}{'median ms':>12}{'items/s':>14}{'peak KB':>11}"
+    if with_ratio:
+        header += f"{'vs base':>10}"
+    lines = [header, "-" * len(header)]
+    for r in results:
+        line = f"{r['name']:<42}{r['median_ms']:>12.3f}{r['items_per_sec'] or 0:>14,.0f}{r['peak_kb']:>11,.1f}"
+        if with_ratio:
+            ratio = f"{r['ratio']:.2f}x" if r.get("ratio") else "new"
+            line += f"{ratio:>10}" + ("  REGRESSION" if r.get("regression") else "")
+        lines.append(line)
+    return "\n".join(lines)
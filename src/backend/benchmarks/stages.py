@@ -0,0 +1,124 @@
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Tuple
+import numpy as np
+import pandas as pd
+from ..schemas import ABSignalOut, ChartOut, DashboardRow
+from ..services import americanbulls
+from ..services.backtest import forward_returns
+from ..services.bars import frame_rows
+from ..services.chart_codec import encode_binary, encode_columnar
+from ..services.downsample import lttb_indices
+from ..services.prices import _quote_from_history, chart_to_points
+
+FIXTURE_DIR = Path(__file__).parent / "fixtures"
+
+# 每个阶段：(名称, 调用, 每次调用处理的条目数)
+Stage = Tuple[str, Callable[[], Any], int]
+
+def load_pages() -> Dict[str, str]:
+    """fixtures 目录下保存的 AB 信号页，键为文件名"""
+    return {p.stem: p.read_text(encoding="utf-8") for p in sorted(FIXTURE_DIR.glob("*.html"))}
+
+def synthetic_ohlcv(n: int, interval_sec: int = 300, seed: int = 7) -> pd.DataFrame:
+    """与 yfinance history() 结构相同的随机游走 OHLCV"""
+    rng = np.random.default_rng(seed)
+    close = 100 * np.exp(np.cumsum(rng.normal(0, 0.002, n)))
+    open_ = np.concatenate(([close[0]], close[:-1]))
+    spread = np.abs(rng.normal(0, 0.001, n)) * close
+    index = pd.date_range("2024-01-02 09:30", periods=n, freq=f"{interval_sec}s", tz="America/New_York")
+    return pd.DataFrame({
+        "Open": open_,
+        "High": np.maximum(open_, close) + spread,
+        "Low": np.minimum(open_, close) - spread,
+        "Close": close,
+        "Volume": rng.integers(1_000, 100_000, n).astype(np.float64),
+    }, index=index)
+
+def synthetic_batch(symbols: List[str], days: int = 5) -> pd.DataFrame:
+    """yf.download(group_by="ticker") 返回的多股票日线 DataFrame"""
+    frames = {sym: synthetic_ohlcv(days, 86400, seed=i) for i, sym in enumerate(symbols)}
+    return pd.concat(frames, axis=1)
+
+def _shape_quotes(hist: pd.DataFrame, symbols: List[str]) -> Dict[str, Dict[str, Any]]:
+    # 与 get_quotes 中按股票拆分批量结果的逻辑一致
+    present = set(hist.columns.get_level_values(0))
+    return {sym: _quote_from_history(sym, hist[sym] if sym in present else None) for sym in symbols}
+
+def _chart(frame: pd.DataFrame) -> Dict[str, Any]:
+    return {
+        "symbol": "BENCH",
+        "t": frame.index.as_unit("ms").asi8,
+        "p": frame["Close"].to_numpy(dtype=np.float64),
+    }
+
+def scraper_stages(pages: Dict[str, str]) -> List[Stage]:
+    stages: List[Stage] = []
+    backends = ["bs4"] + (["lxml"] if americanbulls.lxml else [])
+    for name, html in pages.items():
+        for backend in backends:
+            stages.append((
+                f"ab.parse[{backend}].{name}",
+                lambda html=html, backend=backend: americanbulls.ParsedPage(html, backend).signals(),
+                1,
+            ))
+            stages.append((
+                f"ab.company_name[{backend}].{name}",
+                lambda html=html, backend=backend: americanbulls.ParsedPage(html, backend).company_name("AAPL"),
+                1,
+            ))
+    return stages
+
+def quote_stages() -> List[Stage]:
+    symbols = [f"S{i:03d}" for i in range(100)]
+    batch = synthetic_batch(symbols)
+    intraday = synthetic_ohlcv(78 * 60)
+    return [
+        ("quotes.shape_batch[100]", lambda: _shape_quotes(batch, symbols), len(symbols)),
+        ("bars.frame_rows[4680]", lambda: frame_rows("BENCH", "5m", intraday), len(intraday)),
+    ]
+
+def chart_stages() -> List[Stage]:
+    day = _chart(synthetic_ohlcv(78))
+    month = _chart(synthetic_ohlcv(78 * 22))
+    n = len(month["t"])
+    return [
+        ("chart.lttb[1716->100]", lambda: lttb_indices(month["t"], month["p"], 100), n),
+        ("chart.to_points[78]", lambda: chart_to_points(day), 78),
+        ("chart.to_points[1716->300]", lambda: chart_to_points(month, 300), n),
+        ("chart.encode_columnar[1716]", lambda: encode_columnar(month), n),
+        ("chart.encode_binary[1716]", lambda: encode_binary(month), n),
+    ]
+
+def serialization_stages(pages: Dict[str, str]) -> List[Stage]:
+    html = next(iter(pages.values()))
+    signal = {"symbol": "AAPL", "updated_at": "2024-01-02T16:00:00", **americanbulls.ParsedPage(html).signals()}
+    chart = chart_to_points(_chart(synthetic_ohlcv(78 * 22)))
+    spark = chart_to_points(_chart(synthetic_ohlcv(78)))["points"]
+    quote = {"symbol": "AAPL", "price": 190.12, "change": 0.42, "currency": "USD", "volume": 51_000_000}
+    rows = [{"symbol": f"S{i:03d}", "name": "Bench Inc", "quote": quote, "sparkline": spark, "ab": signal}
+            for i in range(50)]
+    return [
+        ("serialize.ABSignalOut", lambda: ABSignalOut(**signal).model_dump_json(), 1),
+        ("serialize.ChartOut[1716]", lambda: ChartOut(**chart).model_dump_json(), len(chart["points"])),
+        ("serialize.dashboard[50]", lambda: [DashboardRow(**r).model_dump_json() for r in rows], len(rows)),
+    ]
+
+def backtest_stages(symbols: int = 1000, days: int = 1250, events: int = 50) -> List[Stage]:
+    """按股票排序的随机日线和信号，与 backtest._load 的输出结构相同"""
+    rng = np.random.default_rng(11)
+    bar_code = np.repeat(np.arange(symbols), days)
+    bar_day = np.tile(np.arange(19000, 19000 + days), symbols)
+    close = 100 * np.exp(np.cumsum(rng.normal(0, 0.01, symbols * days)))
+    ev_code = np.repeat(np.arange(symbols), events)
+    ev_day = np.sort(rng.integers(19000, 19000 + days, (symbols, events)), axis=1).ravel()
+    ev_dir = rng.choice([1, -1], symbols * events)
+    return [(
+        f"backtest.forward_returns[{symbols}x{days}]",
+        lambda: forward_returns(bar_code, bar_day, close, ev_code, ev_day, ev_dir, (1, 5, 10, 20)),
+        len(ev_code),
+    )]
+
+def all_stages() -> List[Stage]:
+    pages = load_pages()
+    return (scraper_stages(pages) + quote_stages() + chart_stages() + serialization_stages(pages)
+            + backtest_stages())
@@ -1,6 +1,200 @@
-from sqlalchemy import create_engine
+import os
+import logging
+from typing import Any, Dict, Iterable, List, Optional, Sequence
+from sqlalchemy import create_engine, event, inspect, text, select, tuple_
+from sqlalchemy.engine import make_url
+from sqlalchemy.pool import AsyncAdaptedQueuePool
 from sqlalchemy.orm import sessionmaker, declarative_base
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 
-engine = create_engine("sqlite:///./stock_watch.db", future=True, echo=False)
+logger = logging.getLogger(__name__)
+
+DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./stock_watch.db")
+# 异步接口使用的连接串，默认由 DATABASE_URL 换成对应的异步驱动（SQLite 为 aiosqlite）
+ASYNC_DATABASE_URL = os.getenv("ASYNC_DATABASE_URL", "")
+# 连接池：SQLite 使用 WAL 后读写可以并发，多个连接才能让 API 读不被刷新任务的写阻塞
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "10"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "20"))
+DB_POOL_RECYCLE_SEC = int(os.getenv("DB_POOL_RECYCLE_SEC", "1800"))
+# SQLite 调优
+SQLITE_BUSY_TIMEOUT_MS = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000"))
+SQLITE_CACHE_SIZE_KB = int(os.getenv("SQLITE_CACHE_SIZE_KB", "20000"))
+SQLITE_MMAP_SIZE = int(os.getenv("SQLITE_MMAP_SIZE", str(128 * 1024 * 1024)))
+SQLITE_SYNCHRONOUS = os.getenv("SQLITE_SYNCHRONOUS", "NORMAL")
+# 批量写入每条语句的最大行数（SQLite 单条语句的绑定参数个数有限）
+BULK_CHUNK = int(os.getenv("DB_BULK_CHUNK", "200"))
+
+# 同步驱动 -> 异步驱动
+_ASYNC_DRIVERS = {"sqlite": "sqlite+aiosqlite", "postgresql": "postgresql+asyncpg", "mysql": "mysql+aiomysql"}
+
+def _is_memory(db_url) -> bool:
+    return db_url.database in (None, "", ":memory:")
+
+def _install_sqlite_pragmas(eng, in_memory: bool):
+    @event.listens_for(eng, "connect")
+    def _sqlite_pragmas(dbapi_conn, _record):
+        cur = dbapi_conn.cursor()
+        try:
+            if not in_memory:
+                # WAL：写入不阻塞读取；NORMAL 同步在 WAL 下仍然安全
+                cur.execute("PRAGMA journal_mode=WAL")
+                cur.execute(f"PRAGMA mmap_size={SQLITE_MMAP_SIZE}")
+            cur.execute(f"PRAGMA synchronous={SQLITE_SYNCHRONOUS}")
+            cur.execute(f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_MS}")
+            cur.execute(f"PRAGMA cache_size=-{SQLITE_CACHE_SIZE_KB}")
+            cur.execute("PRAGMA temp_store=MEMORY")
+        finally:
+            cur.close()
+
+def _make_engine(url: str):
+    db_url = make_url(url)
+    if db_url.get_backend_name() != "sqlite":
+        return create_engine(
+            url, future=True, echo=False, pool_pre_ping=True,
+            pool_size=DB_POOL_SIZE, max_overflow=DB_MAX_OVERFLOW, pool_recycle=DB_POOL_RECYCLE_SEC,
+        )
+
+    in_memory = _is_memory(db_url)
+    kwargs = {"connect_args": {"check_same_thread": False, "timeout": SQLITE_BUSY_TIMEOUT_MS / 1000}}
+    if not in_memory:
+        kwargs.update(pool_size=DB_POOL_SIZE, max_overflow=DB_MAX_OVERFLOW)
+    eng = create_engine(url, future=True, echo=False, **kwargs)
+    _install_sqlite_pragmas(eng, in_memory)
+    return eng
+
+def _make_async_engine(url: str):
+    """与同步引擎指向同一个数据库的异步引擎，连接池和 SQLite 调优参数相同
+
+    内存数据库每个连接都是独立的库，异步引擎看不到同步引擎建的表，只适用于文件库。
+    """
+    db_url = make_url(url)
+    backend = db_url.get_backend_name()
+    if not ASYNC_DATABASE_URL:
+        if backend not in _ASYNC_DRIVERS:
+            raise ValueError(f"no async driver for {backend}, set ASYNC_DATABASE_URL")
+        db_url = db_url.set(drivername=_ASYNC_DRIVERS[backend])
+    else:
+        db_url = make_url(ASYNC_DATABASE_URL)
+
+    if backend != "sqlite":
+        return create_async_engine(
+            db_url, echo=False, pool_pre_ping=True,
+            pool_size=DB_POOL_SIZE, max_overflow=DB_MAX_OVERFLOW, pool_recycle=DB_POOL_RECYCLE_SEC,
+        )
+
+    in_memory = _is_memory(db_url)
+    kwargs = {"connect_args": {"timeout": SQLITE_BUSY_TIMEOUT_MS / 1000}}
+    if not in_memory:
+        # aiosqlite 的文件库默认不复用连接（NullPool），每次都要重新执行 PRAGMA
+        kwargs.update(poolclass=AsyncAdaptedQueuePool, pool_size=DB_POOL_SIZE, max_overflow=DB_MAX_OVERFLOW)
+    eng = create_async_engine(db_url, echo=False, **kwargs)
+    # 事件挂在底层的同步引擎上，aiosqlite 的连接适配器同样提供 cursor()
+    _install_sqlite_pragmas(eng.sync_engine, in_memory)
+    return eng
+
+engine = _make_engine(DATABASE_URL)
 SessionLocal = sessionmaker(bind=engine, autoflush=False, autocommit=False, future=True)
+async_engine = _make_async_engine(DATABASE_URL)
+# 异步接口的会话；需要复用同步的写入函数时用 session.run_sync(fn, ...)
+AsyncSessionLocal = async_sessionmaker(async_engine, class_=AsyncSession, autoflush=False, expire_on_commit=False)
 Base = declarative_base()
+
+def add_missing_columns(bind=engine):
+    """create_all 不会修改已有的表：把模型里新增的可空列用 ALTER TABLE 补上"""
+    insp = inspect(bind)
+    with bind.begin() as conn:
+        for table in Base.metadata.sorted_tables:
+            if not insp.has_table(table.name):
+                continue
+            existing = {c["name"] for c in insp.get_columns(table.name)}
+            for col in table.columns:
+                if col.name in existing or not col.nullable:
+                    continue
+                col_type = col.type.compile(dialect=bind.dialect)
+                conn.execute(text(f'ALTER TABLE {table.name} ADD COLUMN "{col.name}" {col_type}'))
+                logger.info(f"Added column {table.name}.{col.name}")
+
+def _dialect_insert(dialect_name: str, model):
+    if dialect_name == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert
+    elif dialect_name == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        return None
+    return insert(model)
+
+def bulk_upsert(db, model, rows: Sequence[Dict[str, Any]], index_elements: List[str],
+                update_columns: Optional[Iterable[str]] = None,
+                touch: Optional[Dict[str, Any]] = None) -> int:
+    """批量 INSERT ... ON CONFLICT (index_elements) DO UPDATE（不提交）
+
+    update_columns 为冲突时覆盖的列，为空时 DO NOTHING；touch 为冲突时额外设置的
+    列和 SQL 表达式（比如 updated_at=func.now()，ON CONFLICT 不会触发 onupdate）。
+    不支持 ON CONFLICT 的数据库逐行查询后更新。
+    """
+    if not rows:
+        return 0
+    update_columns = list(update_columns or [])
+    touch = touch or {}
+    stmt = _dialect_insert(db.get_bind().dialect.name, model)
+    if stmt is None:
+        return _upsert_fallback(db, model, rows, index_elements, update_columns, touch)
+
+    if update_columns or touch:
+        stmt = stmt.on_conflict_do_update(
+            index_elements=index_elements,
+            set_={**{c: stmt.excluded[c] for c in update_columns}, **touch},
+        )
+    else:
+        stmt = stmt.on_conflict_do_nothing(index_elements=index_elements)
+    for i in range(0, len(rows), BULK_CHUNK):
+        db.execute(stmt.values(list(rows[i:i + BULK_CHUNK])))
+    return len(rows)
+
+def insert_missing(db, model, rows: Sequence[Dict[str, Any]], key: str) -> set:
+    """批量 INSERT ... ON CONFLICT (key) DO NOTHING（不提交），返回实际插入的行的 key
+
+    用 RETURNING 判断，并发插入了同一 key 的行不会被算作本次插入。
+    不支持 ON CONFLICT 的数据库逐批查询已有的 key 后插入其余的行。
+    """
+    if not rows:
+        return set()
+    column = getattr(model, key)
+    stmt = _dialect_insert(db.get_bind().dialect.name, model)
+    inserted = set()
+    for i in range(0, len(rows), BULK_CHUNK):
+        chunk = list(rows[i:i + BULK_CHUNK])
+        if stmt is not None:
+            inserted.update(db.execute(
+                stmt.values(chunk).on_conflict_do_nothing(index_elements=[key]).returning(column)
+            ).scalars())
+            continue
+        existing = set(db.execute(select(column).where(column.in_([r[key] for r in chunk]))).scalars())
+        new = [r for r in chunk if r[key] not in existing]
+        db.add_all(model(**r) for r in new)
+        inserted.update(r[key] for r in new)
+    db.flush()
+    return inserted
+
+def _upsert_fallback(db, model, rows, index_elements, update_columns, touch) -> int:
+    cols = [getattr(model, c) for c in index_elements]
+    keys = [tuple(r[c] for c in index_elements) for r in rows]
+    existing = {}
+    for i in range(0, len(keys), BULK_CHUNK):
+        chunk = keys[i:i + BULK_CHUNK]
+        cond = cols[0].in_([k[0] for k in chunk]) if len(cols) == 1 else tuple_(*cols).in_(chunk)
+        for obj in db.execute(select(model).where(cond)).scalars():
+            existing[tuple(getattr(obj, c) for c in index_elements)] = obj
+    for key, row in zip(keys, rows):
+        obj = existing.get(key)
+        if obj is None:
+            obj = model(**row)
+            db.add(obj)
+            existing[key] = obj
+            continue
+        for c in update_columns:
+            setattr(obj, c, row[c])
+        for c, value in touch.items():
+            setattr(obj, c, value)
+    db.flush()
+    return len(rows)
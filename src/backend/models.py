@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, DateTime, JSON, Float, UniqueConstraint
+from sqlalchemy import Column, Integer, String, Date, DateTime, JSON, Float, Index, UniqueConstraint
 from sqlalchemy.sql import func
 from .db import Base
 
@@ -36,6 +36,48 @@ class ABSignalCache(Base):
     technical_indicators = Column(JSON, nullable=True)
     # 价格目标
     price_target = Column(String(64), nullable=True)
+    # 信号内容变化的时间；只做检查、内容没变时不更新
     updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+    # 最近一次抓取检查的时间
+    checked_at = Column(DateTime(timezone=True), nullable=True)
+    # 页面去除脚本、隐藏字段等易变部分后的指纹，以及上游返回的条件请求头
+    content_hash = Column(String(64), nullable=True)
+    etag = Column(String(256), nullable=True)
+    last_modified = Column(String(64), nullable=True)
+    # 最近一次抓取失败的原因，抓取成功后清空；失败时保留上次的信号
+    last_error = Column(String(256), nullable=True)
 
     __table_args__ = (UniqueConstraint('symbol', name='uniq_symbol_ab'),)
+
+class PriceBar(Base):
+    """本地 K 线存储，按 (symbol, interval, ts) 唯一，增量追加"""
+    __tablename__ = "price_bars"
+    id = Column(Integer, primary_key=True)
+    symbol = Column(String(16), nullable=False)
+    interval = Column(String(8), nullable=False)
+    ts = Column(Integer, nullable=False)  # 毫秒时间戳
+    open = Column(Float, nullable=True)
+    high = Column(Float, nullable=True)
+    low = Column(Float, nullable=True)
+    close = Column(Float, nullable=False)
+    volume = Column(Integer, nullable=True)
+
+    # 唯一约束同时作为 (symbol, interval, ts) 的范围查询索引
+    __table_args__ = (UniqueConstraint('symbol', 'interval', 'ts', name='uniq_symbol_interval_ts'),)
+
+class ABSignalEvent(Base):
+    """AB 历史信号，按 (symbol, date, signal) 去重后只追加，不随页面刷新覆盖"""
+    __tablename__ = "ab_signal_events"
+    id = Column(Integer, primary_key=True)
+    symbol = Column(String(16), nullable=False)
+    date = Column(Date, nullable=False)
+    signal = Column(String(32), nullable=False)
+    price = Column(Float, nullable=True)
+    # 第一次抓到这条信号的时间
+    first_seen = Column(DateTime(timezone=True), server_default=func.now())
+
+    # 唯一约束同时作为 (symbol, date) 的范围查询索引；跨股票按信号类型查询走 (signal, date)
+    __table_args__ = (
+        UniqueConstraint('symbol', 'date', 'signal', name='uniq_symbol_date_signal'),
+        Index('ix_ab_signal_events_signal_date', 'signal', 'date'),
+    )
@@ -0,0 +1,31 @@
+import inspect
+import functools
+from fastapi.routing import APIRoute
+from .services.timing import span
+
+def _timed_endpoint(endpoint):
+    if inspect.iscoroutinefunction(endpoint):
+        @functools.wraps(endpoint)
+        async def wrapper(*args, **kwargs):
+            with span("handler"):
+                return await endpoint(*args, **kwargs)
+    else:
+        @functools.wraps(endpoint)
+        def wrapper(*args, **kwargs):
+            with span("handler"):
+                return endpoint(*args, **kwargs)
+    return wrapper
+
+class TimedRoute(APIRoute):
+    """记录接口函数（handler）和整个路由（含参数校验、响应序列化）的耗时"""
+
+    def __init__(self, path: str, endpoint, **kwargs):
+        super().__init__(path, _timed_endpoint(endpoint), **kwargs)
+
+    def get_route_handler(self):
+        handler = super().get_route_handler()
+
+        async def timed_handler(request):
+            with span("app"):
+                return await handler(request)
+        return timed_handler
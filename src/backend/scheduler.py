@@ -1,88 +1,160 @@
 import os
 import logging
+import threading
 import time
+import zlib
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional
 from apscheduler.schedulers.background import BackgroundScheduler
 from apscheduler.triggers.interval import IntervalTrigger
-from sqlalchemy import select
-from .db import SessionLocal
-from .models import WatchItem, ABSignalCache, StockQuoteCache
+from sqlalchemy import select, func
+from .db import SessionLocal, bulk_upsert
+from .models import WatchItem, StockQuoteCache, ABSignalCache
 from .services.americanbulls import fetch_ab_for_symbol
-from .services.prices import get_quote
+from .services.market import is_market_open, last_close, next_close, next_open
+from .services.prices import QUOTE_BATCH_SIZE, get_quotes
+from .services.ratelimit import AB_HOST, HOST_LIMITS
+from .services.events import bus
+from .services.metrics import AB_SIGNALS_CHANGED, REFRESH_DURATION, REFRESH_SYMBOLS
+from .services.signals import CHECK_FIELDS, get_cached_signal, invalidate_signal, load_stored_signals, store_signals
+from .services.views import decay_views, view_counts
 
 logger = logging.getLogger(__name__)
 
-def refresh_ab_signals():
-    """刷新AmericanBulls信号数据"""
+# AB 抓取的最大并发数（实际速率由 services.ratelimit 的令牌桶控制）
+AB_MAX_CONCURRENCY = int(os.getenv("AB_MAX_CONCURRENCY", "4"))
+# AB 刷新结果每攒够多少个写入一次
+AB_WRITE_BATCH = int(os.getenv("AB_WRITE_BATCH", "20"))
+
+# 调度器每隔 SCHEDULER_TICK_SEC 秒检查一次到期的股票
+SCHEDULER_TICK_SEC = int(os.getenv("SCHEDULER_TICK_SEC", "30"))
+# 报价刷新间隔：交易时段内 / 休市时（分钟）
+QUOTE_REFRESH_OPEN_MIN = float(os.getenv("QUOTE_REFRESH_OPEN_MIN", "5"))
+QUOTE_REFRESH_CLOSED_MIN = float(os.getenv("QUOTE_REFRESH_CLOSED_MIN", "240"))
+# AB 信号在收盘后多久开始检查，以及检查分散到多长的时间窗口内（分钟）
+AB_AFTER_CLOSE_MIN = float(os.getenv("AB_AFTER_CLOSE_MIN", "30"))
+AB_SPREAD_MIN = float(os.getenv("AB_SPREAD_MIN", "60"))
+# AB 信号最长多久检查一次（小时，默认覆盖周末）
+AB_MAX_AGE_HOURS = float(os.getenv("AB_MAX_AGE_HOURS", "72"))
+# AB 抓取失败后的重试间隔（分钟）：首次约 AB_RETRY_MIN，连续失败时翻倍，最长 AB_RETRY_MAX_MIN
+AB_RETRY_MIN = float(os.getenv("AB_RETRY_MIN", "15"))
+AB_RETRY_MAX_MIN = float(os.getenv("AB_RETRY_MAX_MIN", "240"))
+# 每个 tick 最多刷新的股票数：报价按一次批量下载，AB 按令牌桶在一个 tick 内能发出的请求数
+QUOTE_MAX_PER_TICK = int(os.getenv("QUOTE_MAX_PER_TICK", str(QUOTE_BATCH_SIZE)))
+AB_MAX_PER_TICK = int(os.getenv("AB_MAX_PER_TICK", "0")) or max(1, int(HOST_LIMITS[AB_HOST][0] * SCHEDULER_TICK_SEC))
+# 查看次数每小时衰减一半
+VIEW_DECAY_SEC = 3600
+
+def _flush_ab_results(db, pending: list, stored: dict) -> int:
+    """把一批抓取结果写入一个事务，返回信号有变化的数量"""
+    if not pending:
+        return 0
+    try:
+        changed = store_signals(db, pending, stored)
+        db.commit()
+    except Exception as e:
+        logger.error(f"Failed to store AB data for {len(pending)} symbols: {e}")
+        db.rollback()
+        changed = []
+    for sym, _ in pending:
+        invalidate_signal(sym)
+    pending.clear()
+    # 只推送信号有变化的股票
+    if bus.active:
+        for sym in changed:
+            data = get_cached_signal(sym)
+            if data:
+                bus.publish("signal", sym, data)
+    return len(changed)
+
+def refresh_ab_signals(symbols: Optional[List[str]] = None) -> List[str]:
+    """并发刷新AmericanBulls信号数据，每完成 AB_WRITE_BATCH 个批量提交一次；symbols 为空时刷新整个列表
+
+    返回抓取失败的代码，调度器据此安排较短的重试。
+    """
     logger.info("Starting AB signals refresh...")
+    started = time.time()
     db = SessionLocal()
     try:
-        symbols = [w.symbol for w in db.execute(select(WatchItem)).scalars().all()]
-        logger.info(f"Refreshing AB signals for {len(symbols)} symbols")
+        if symbols is None:
+            symbols = db.execute(select(WatchItem.symbol)).scalars().all()
+        logger.info(f"Refreshing AB signals for {len(symbols)} symbols (concurrency={AB_MAX_CONCURRENCY})")
         
-        for sym in symbols:
-            try:
-                logger.info(f"Fetching AB data for {sym}")
-                data = fetch_ab_for_symbol(sym)
-                
-                # 查找或创建缓存记录
-                obj = db.execute(select(ABSignalCache).where(ABSignalCache.symbol==sym)).scalar_one_or_none()
-                if not obj:
-                    obj = ABSignalCache(symbol=sym)
-                    db.add(obj)
-                
-                # 更新所有字段
-                obj.suggestion = data.get("suggestion")
-                obj.summary = data.get("summary")
-                obj.signal_history = data.get("signal_history", [])
-                obj.technical_indicators = data.get("technical_indicators", {})
-                obj.price_target = data.get("price_target")
-                
-                # 添加延时避免过于频繁的请求
-                time.sleep(2)
-                
-            except Exception as e:
-                logger.error(f"Failed to refresh AB data for {sym}: {e}")
-                continue
+        # 已保存的信号和条件请求头：一次查询读出，用于跳过没有变化的页面和写入
+        stored = load_stored_signals(db, symbols)
+        db.commit()  # 结束读事务，抓取期间不占用连接上的快照
         
-        db.commit()
-        logger.info("AB signals refresh completed")
+        done = changed = 0
+        failed = []
+        pending = []
+        with ThreadPoolExecutor(max_workers=max(1, AB_MAX_CONCURRENCY), thread_name_prefix="ab-refresh") as pool:
+            futures = {
+                pool.submit(fetch_ab_for_symbol, sym, {k: stored[sym][k] for k in CHECK_FIELDS} if sym in stored else None): sym
+                for sym in symbols
+            }
+            for fut in as_completed(futures):
+                sym = futures[fut]
+                try:
+                    result = fut.result()
+                    pending.append((sym, result))
+                    done += 1
+                    if "error" in result:
+                        failed.append(sym)
+                except Exception as e:
+                    logger.error(f"Failed to refresh AB data for {sym}: {e}")
+                    failed.append(sym)
+                    continue
+                if len(pending) >= AB_WRITE_BATCH:
+                    changed += _flush_ab_results(db, pending, stored)
+            changed += _flush_ab_results(db, pending, stored)
+        
+        logger.info(f"AB signals refresh completed: {done}/{len(symbols)} ({changed} changed) in {time.time() - started:.1f}s")
+        REFRESH_DURATION.labels(job="ab").observe(time.time() - started)
+        REFRESH_SYMBOLS.labels(job="ab", result="ok").inc(len(symbols) - len(failed))
+        REFRESH_SYMBOLS.labels(job="ab", result="failed").inc(len(failed))
+        AB_SIGNALS_CHANGED.inc(changed)
+        return failed
         
     except Exception as e:
         logger.error(f"AB signals refresh failed: {e}")
         db.rollback()
+        return list(symbols or [])
     finally:
         db.close()
 
-def refresh_stock_quotes():
-    """刷新股票报价数据"""
+def refresh_stock_quotes(symbols: Optional[List[str]] = None):
+    """批量刷新股票报价数据，一条 upsert 语句写入；symbols 为空时刷新整个列表"""
     logger.info("Starting stock quotes refresh...")
+    started = time.time()
     db = SessionLocal()
     try:
-        symbols = [w.symbol for w in db.execute(select(WatchItem)).scalars().all()]
+        if symbols is None:
+            symbols = db.execute(select(WatchItem.symbol)).scalars().all()
         logger.info(f"Refreshing quotes for {len(symbols)} symbols")
+        quotes = get_quotes(symbols, force=True)
         
-        for sym in symbols:
-            try:
-                quote_data = get_quote(sym)
-                
-                # 查找或创建报价缓存记录
-                obj = db.execute(select(StockQuoteCache).where(StockQuoteCache.symbol==sym)).scalar_one_or_none()
-                if not obj:
-                    obj = StockQuoteCache(symbol=sym)
-                    db.add(obj)
-                
-                # 更新报价数据
-                obj.price = quote_data.get("price")
-                obj.change_pct = quote_data.get("change")
-                obj.volume = quote_data.get("volume")
-                obj.currency = quote_data.get("currency", "USD")
-                
-            except Exception as e:
-                logger.error(f"Failed to refresh quote for {sym}: {e}")
-                continue
-        
+        rows = [
+            {
+                "symbol": sym,
+                "price": q["price"],
+                "change_pct": q.get("change"),
+                "volume": q.get("volume"),
+                "currency": q.get("currency") or "USD",
+            }
+            for sym in symbols
+            if (q := quotes.get(sym)) and q.get("price") is not None
+        ]
+        bulk_upsert(
+            db, StockQuoteCache, rows, ["symbol"],
+            update_columns=("price", "change_pct", "volume", "currency"),
+            touch={"updated_at": func.now()},
+        )
         db.commit()
-        logger.info("Stock quotes refresh completed")
+        logger.info(f"Stock quotes refresh completed: {len(rows)}/{len(symbols)} stored")
+        REFRESH_DURATION.labels(job="quotes").observe(time.time() - started)
+        REFRESH_SYMBOLS.labels(job="quotes", result="ok").inc(len(rows))
+        REFRESH_SYMBOLS.labels(job="quotes", result="failed").inc(len(symbols) - len(rows))
         
     except Exception as e:
         logger.error(f"Stock quotes refresh failed: {e}")
@@ -90,35 +162,184 @@ def refresh_stock_quotes():
     finally:
         db.close()
 
+def _offset(sym: str, span: timedelta) -> timedelta:
+    """按代码哈希得到 [0, span) 内固定的偏移，把同一时刻到期的股票均匀错开"""
+    return span * ((zlib.crc32(sym.encode()) % 10000) / 10000)
+
+def _phase_slot(sym: str, after: datetime, interval: timedelta) -> datetime:
+    """after 之后第一个 epoch + _offset(sym) + k * interval，各股票的刷新相位固定且互相错开"""
+    phase = datetime(1970, 1, 1, tzinfo=timezone.utc) + _offset(sym, interval)
+    return phase + interval * -((phase - after) // interval)
+
+def _as_utc(ts: Optional[datetime]) -> Optional[datetime]:
+    # SQLite 返回的是不带时区的 UTC 时间
+    if ts is None:
+        return None
+    return ts.replace(tzinfo=timezone.utc) if ts.tzinfo is None else ts
+
+class RefreshPlanner:
+    """为每个股票的报价和 AB 信号分别维护下次到期时间
+
+    - 报价：交易时段内每 QUOTE_REFRESH_OPEN_MIN 分钟，收盘后补一次收盘价，休市时
+      每 QUOTE_REFRESH_CLOSED_MIN 分钟或在开盘时刷新
+    - AB 信号：只在收盘后 AB_AFTER_CLOSE_MIN 分钟起、分散在 AB_SPREAD_MIN 分钟内检查，
+      最长不超过 AB_MAX_AGE_HOURS；抓取失败时按 AB_RETRY_MIN 起指数退避重试
+    - 每个 tick 只处理到期的一部分，按查看次数从多到少、到期时间从早到晚排序
+
+    due 和 ab_failures 会被调度线程修改，同时被状态接口和 /metrics 读取，统一由 _lock 保护。
+    """
+
+    def __init__(self):
+        self.due: Dict[str, Dict[str, datetime]] = {"quote": {}, "ab": {}}
+        # 每个股票 AB 抓取连续失败的次数，成功后清除
+        self.ab_failures: Dict[str, int] = {}
+        self._last_decay = time.monotonic()
+        self._lock = threading.Lock()
+
+    # ---- 下次到期时间 ----
+    def next_quote_due(self, sym: str, now: datetime) -> datetime:
+        open_iv = timedelta(minutes=QUOTE_REFRESH_OPEN_MIN)
+        if is_market_open(now):
+            # 按股票固定的相位刷新（间隔仍为 open_iv），避免所有股票在同一个 tick 集中请求
+            due = _phase_slot(sym, now + open_iv / 2, open_iv)
+            close = next_close(now)
+            # 收盘后尽快拿到收盘价
+            return min(due, close + timedelta(minutes=1) + _offset(sym, open_iv))
+        return min(now + timedelta(minutes=QUOTE_REFRESH_CLOSED_MIN), next_open(now) + _offset(sym, open_iv))
+
+    def _ab_slot(self, sym: str, close: datetime) -> datetime:
+        return close + timedelta(minutes=AB_AFTER_CLOSE_MIN) + _offset(sym, timedelta(minutes=AB_SPREAD_MIN))
+
+    def next_ab_due(self, sym: str, now: datetime) -> datetime:
+        slot = self._ab_slot(sym, last_close(now))
+        if slot <= now:
+            slot = self._ab_slot(sym, next_close(now))
+        return min(slot, now + timedelta(hours=AB_MAX_AGE_HOURS))
+
+    def ab_retry_due(self, sym: str, failures: int, now: datetime) -> datetime:
+        """抓取失败后的重试时间：间隔随连续失败次数翻倍，不晚于正常的下次检查"""
+        delay = min(AB_RETRY_MAX_MIN, AB_RETRY_MIN * 2 ** (failures - 1))
+        # 加上最多一倍的固定偏移，熔断后同时失败的股票不会同时重试
+        retry = now + timedelta(minutes=delay) + _offset(sym, timedelta(minutes=delay))
+        return min(retry, self.next_ab_due(sym, now))
+
+    def _initial_quote_due(self, sym: str, updated_at: Optional[datetime], now: datetime) -> datetime:
+        if updated_at is None:
+            return now
+        if not is_market_open(now) and updated_at < last_close(now):
+            return now  # 还没有最近一次的收盘价
+        return max(now, self.next_quote_due(sym, updated_at))
+
+    def _initial_ab_due(self, sym: str, checked_at: Optional[datetime], failed: bool, now: datetime) -> datetime:
+        if checked_at is None or failed:
+            return now  # 从未检查过，或者上次检查失败
+        slot = self._ab_slot(sym, last_close(now))
+        if checked_at < slot <= now:
+            return now  # 最近一次收盘后还没检查过
+        return max(now, min(self.next_ab_due(sym, checked_at), checked_at + timedelta(hours=AB_MAX_AGE_HOURS)))
+
+    # ---- 监控列表同步 ----
+    def sync(self, now: datetime):
+        """加入新添加的股票（按已保存数据的新旧决定首次到期时间），移除已删除的股票"""
+        db = SessionLocal()
+        try:
+            symbols = set(db.execute(select(WatchItem.symbol)).scalars().all())
+            new = [s for s in symbols if s not in self.due["quote"]]
+            if new:
+                quote_ts = dict(db.execute(
+                    select(StockQuoteCache.symbol, StockQuoteCache.updated_at).where(StockQuoteCache.symbol.in_(new))
+                ).all())
+                ab_ts = {row.symbol: (row.checked_at, row.last_error is not None) for row in db.execute(
+                    select(ABSignalCache.symbol, ABSignalCache.checked_at, ABSignalCache.last_error)
+                    .where(ABSignalCache.symbol.in_(new))
+                )}
+        finally:
+            db.close()
+
+        quote_due, ab_due = {}, {}
+        for sym in new:
+            quote_due[sym] = self._initial_quote_due(sym, _as_utc(quote_ts.get(sym)), now)
+            checked_at, failed = ab_ts.get(sym, (None, False))
+            ab_due[sym] = self._initial_ab_due(sym, _as_utc(checked_at), failed, now)
+        with self._lock:
+            self.due["quote"].update(quote_due)
+            self.due["ab"].update(ab_due)
+            for kind in self.due.values():
+                for sym in [s for s in kind if s not in symbols]:
+                    del kind[sym]
+            for sym in [s for s in self.ab_failures if s not in symbols]:
+                del self.ab_failures[sym]
+
+    def take_due(self, kind: str, now: datetime, limit: int) -> List[str]:
+        views = view_counts()
+        with self._lock:
+            due = [(sym, at) for sym, at in self.due[kind].items() if at <= now]
+        due.sort(key=lambda item: (-views.get(item[0], 0), item[1]))
+        return [sym for sym, _ in due[:limit]]
+
+    def tick(self):
+        now = datetime.now(timezone.utc)
+        self.sync(now)
+
+        quotes = self.take_due("quote", now, QUOTE_MAX_PER_TICK)
+        if quotes:
+            refresh_stock_quotes(quotes)
+            done = datetime.now(timezone.utc)
+            next_due = {sym: self.next_quote_due(sym, done) for sym in quotes}
+            with self._lock:
+                self.due["quote"].update(next_due)
+
+        signals = self.take_due("ab", now, AB_MAX_PER_TICK)
+        if signals:
+            failed = set(refresh_ab_signals(signals))
+            done = datetime.now(timezone.utc)
+            with self._lock:
+                for sym in signals:
+                    if sym in failed:
+                        count = self.ab_failures[sym] = self.ab_failures.get(sym, 0) + 1
+                        self.due["ab"][sym] = self.ab_retry_due(sym, count, done)
+                    else:
+                        self.ab_failures.pop(sym, None)
+                        self.due["ab"][sym] = self.next_ab_due(sym, done)
+
+        if time.monotonic() - self._last_decay >= VIEW_DECAY_SEC:
+            decay_views()
+            self._last_decay = time.monotonic()
+
+    def snapshot(self) -> Dict[str, object]:
+        now = datetime.now(timezone.utc)
+        with self._lock:
+            dues = {kind: list(due.values()) for kind, due in self.due.items()}
+            ab_failing = len(self.ab_failures)
+        return {
+            "market_open": is_market_open(now),
+            **{
+                kind: {
+                    "symbols": len(due),
+                    "due_now": sum(1 for at in due if at <= now),
+                    "next_due": min(due).isoformat() if due else None,
+                }
+                for kind, due in dues.items()
+            },
+            "ab_failing": ab_failing,
+        }
+
+planner = RefreshPlanner()
+
 def create_scheduler():
-    """创建后台调度器，分别设置AB信号和股价的更新频率"""
-    
-    # AB 信号更新频率（默认60分钟）
-    ab_interval_min = int(os.getenv("AB_SCRAPE_INTERVAL_MIN", "60"))
-    
-    # 股价更新频率（默认10分钟）  
-    quote_interval_min = int(os.getenv("QUOTE_REFRESH_INTERVAL_MIN", "10"))
-    
-    timezone = os.getenv("TZ", "UTC")
-    sched = BackgroundScheduler(timezone=timezone)
-    
-    # 添加AB信号刷新任务
+    """创建后台调度器：单个 tick 任务按每个股票的到期时间刷新报价和 AB 信号，启动后立即运行一次"""
+    sched = BackgroundScheduler(timezone=os.getenv("TZ", "UTC"))
     sched.add_job(
-        refresh_ab_signals, 
-        IntervalTrigger(minutes=ab_interval_min), 
-        id="ab_signals_refresh", 
+        planner.tick,
+        IntervalTrigger(seconds=SCHEDULER_TICK_SEC),
+        id="refresh_tick",
         replace_existing=True,
-        max_instances=1  # 防止重叠执行
+        max_instances=1,  # 防止重叠执行；上一个 tick 没跑完时跳过
+        coalesce=True,
+        next_run_time=datetime.now(timezone.utc),
     )
-    
-    # 添加股价刷新任务
-    sched.add_job(
-        refresh_stock_quotes, 
-        IntervalTrigger(minutes=quote_interval_min), 
-        id="stock_quotes_refresh", 
-        replace_existing=True,
-        max_instances=1
+    logger.info(
+        f"Scheduler created: tick every {SCHEDULER_TICK_SEC}s, quotes every {QUOTE_REFRESH_OPEN_MIN}min "
+        f"(open) / {QUOTE_REFRESH_CLOSED_MIN}min (closed), AB {AB_AFTER_CLOSE_MIN}min after close"
     )
-    
-    logger.info(f"Scheduler created: AB signals every {ab_interval_min}min, quotes every {quote_interval_min}min")
     return sched
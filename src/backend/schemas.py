@@ -25,13 +25,25 @@ class ABSignalOut(BaseModel):
     summary: Optional[str] = None
     technical_indicators: dict = Field(default_factory=dict)
     price_target: Optional[str] = None
-    updated_at: Optional[str] = None
+    updated_at: Optional[str] = None   # 信号内容最近一次变化的时间
+    checked_at: Optional[str] = None   # 最近一次抓取检查的时间
+    last_error: Optional[str] = None   # 最近一次抓取失败的原因，成功后为空
+
+class SignalEventOut(BaseModel):
+    symbol: str
+    date: str                           # YYYY-MM-DD
+    signal: str
+    price: Optional[float] = None
+    first_seen: Optional[str] = None    # 第一次抓到这条信号的时间
 
 class QuoteOut(BaseModel):
     symbol: str
     price: Optional[float]
     change: Optional[float]     # 当日涨跌百分比（如 1.23 表示 +1.23%）
     currency: Optional[str] = None
+    volume: Optional[int] = None
+    stale: bool = False         # 是否为已过期、正在后台刷新的缓存数据
+    age: Optional[float] = None # stale 时缓存数据的秒数
 
 class SparkPoint(BaseModel):
     t: int
@@ -40,3 +52,12 @@ class SparkPoint(BaseModel):
 class ChartOut(BaseModel):
     symbol: str
     points: List[SparkPoint]
+    stale: bool = False
+    age: Optional[float] = None
+
+class DashboardRow(BaseModel):
+    symbol: str
+    name: Optional[str] = None
+    quote: Optional[QuoteOut] = None
+    sparkline: Optional[List[SparkPoint]] = None   # 无缓存时为 null
+    ab: Optional[ABSignalOut] = None
@@ -1,9 +1,16 @@
+import os
 import re
+import hashlib
 import requests
 from bs4 import BeautifulSoup
 from typing import Dict, List, Any, Optional
 import logging
 import time
+from itertools import islice
+from . import upstream, parsepool
+from .metrics import AB_FETCH, RATELIMIT_WAIT
+from .timing import span
+from .ratelimit import AB_HOST, host_limiter
 
 logger = logging.getLogger(__name__)
 
@@ -14,6 +21,63 @@ HEADERS = {
 BASE = "https://www.americanbulls.com/SignalPage.aspx?lang=en&Ticker={symbol}"
 SEARCH_BASE = "https://www.americanbulls.com/SearchList.aspx?lang=en&SearchText={symbol}"
 
+# americanbulls.com 的共享限流器，所有抓取请求都需要先拿令牌
+_ab_limiter = host_limiter(AB_HOST)
+
+try:
+    import lxml.html
+    from lxml import etree
+except ImportError:  # lxml 为可选依赖
+    lxml = None
+
+# 解析后端：lxml 直接在 C 实现的 lxml 树上解析（默认，需要安装 lxml）；
+# bs4 为原来的 BeautifulSoup 实现，两者结果一致
+PARSER_BACKEND = os.getenv("AB_PARSER_BACKEND") or ("lxml" if lxml else "bs4")
+# bs4 后端使用的 HTML 解析器
+HTML_PARSER = os.getenv("AB_HTML_PARSER") or ("lxml" if lxml else "html.parser")
+
+# 预编译的正则，避免每次解析页面时重新编译
+_SIGNAL_HISTORY_RE = re.compile(r"Signal History", re.I)
+_DATE_RE = re.compile(r'\d{1,2}[/-]\d{1,2}[/-]\d{2,4}|\d{4}-\d{2}-\d{2}')
+_NON_WORD_RE = re.compile(r'[^\w\s]')
+_SUGGESTION_RES = [
+    re.compile(r'\b(BUY|SELL|SHORT|STAY LONG|HOLD|STRONG BUY|STRONG SELL)\b', re.I),
+    re.compile(r'Current Signal:\s*([A-Z\s]+)', re.I),
+    re.compile(r'Recommendation:\s*([A-Z\s]+)', re.I),
+]
+_UPDATE_RES = [re.compile(p, re.I) for p in (r"Signal Update", r"Analysis", r"Commentary", r"Market View")]
+_SIGNAL_LINK_RE = re.compile(r"SignalPage.*Ticker=", re.I)
+_RSI_RE = re.compile(r'RSI[:\s]*(\d+\.?\d*)', re.I)
+_MA_RES = [
+    re.compile(r'MA\s*(\d+)[:\s]*([A-Z]+)', re.I),
+    re.compile(r'Moving Average[:\s]*([A-Z]+)', re.I),
+    re.compile(r'(\d+)-day MA[:\s]*([A-Z]+)', re.I),
+]
+_PRICE_TARGET_RES = [
+    re.compile(r'Target[:\s]*\$?(\d+\.?\d*)', re.I),
+    re.compile(r'Price Target[:\s]*\$?(\d+\.?\d*)', re.I),
+    re.compile(r'Objective[:\s]*\$?(\d+\.?\d*)', re.I),
+]
+
+# 计算页面指纹前去掉的易变部分：脚本、样式、注释、ASP.NET 的 __VIEWSTATE 等隐藏字段
+_VOLATILE_RES = [
+    re.compile(r'<script\b.*?</script\s*>', re.I | re.S),
+    re.compile(r'<style\b.*?</style\s*>', re.I | re.S),
+    re.compile(r'<!--.*?-->', re.S),
+    re.compile(r'<input\b[^>]*\btype\s*=\s*["\']?hidden\b[^>]*>', re.I),
+]
+_WHITESPACE_RE = re.compile(r'\s+')
+
+def page_fingerprint(html: str) -> str:
+    """去掉易变部分后对页面内容做哈希，不需要解析 HTML"""
+    for pattern in _VOLATILE_RES:
+        html = pattern.sub('', html)
+    html = _WHITESPACE_RE.sub(' ', html)
+    return hashlib.blake2b(html.encode("utf-8"), digest_size=16).hexdigest()
+
+def make_soup(html: str) -> BeautifulSoup:
+    return BeautifulSoup(html, HTML_PARSER)
+
 def parse_signal_history(soup) -> List[Dict[str, str]]:
     """从 'Signal History' 表格抓取更多历史记录"""
     history = []
@@ -23,24 +87,23 @@ def parse_signal_history(soup) -> List[Dict[str, str]]:
         table = None
         
         # 方法1: 查找包含 "Signal History" 的文本
-        header = soup.find(string=re.compile(r"Signal History", re.I))
+        header = soup.find(string=_SIGNAL_HISTORY_RE)
         if header:
             table = header.find_parent().find_next("table")
         
-        # 方法2: 查找包含日期模式的表格
+        # 方法2: 查找包含日期模式的表格（只需要每个表格的前两行）
         if not table:
-            tables = soup.find_all("table")
-            for t in tables:
-                rows = t.find_all("tr")
+            for t in soup.find_all("table"):
+                rows = t.find_all("tr", limit=2)
                 if len(rows) > 1:
                     first_row_text = rows[1].get_text()
                     # 查找日期模式 (MM/DD/YYYY 或 YYYY-MM-DD)
-                    if re.search(r'\d{1,2}[/-]\d{1,2}[/-]\d{2,4}|\d{4}-\d{2}-\d{2}', first_row_text):
+                    if _DATE_RE.search(first_row_text):
                         table = t
                         break
         
         if table:
-            rows = table.find_all("tr")
+            rows = table.find_all("tr", limit=9)
             # 跳过表头，获取更多历史记录（最多8条）
             for tr in rows[1:9]:
                 tds = [td.get_text(strip=True) for td in tr.find_all("td")]
@@ -50,7 +113,7 @@ def parse_signal_history(soup) -> List[Dict[str, str]]:
                     signal = tds[2].upper() if len(tds) > 2 else ""
                     
                     # 清理信号文本
-                    signal = re.sub(r'[^\w\s]', '', signal).strip()
+                    signal = _NON_WORD_RE.sub('', signal).strip()
                     
                     if date and signal:
                         history.append({
@@ -64,220 +127,505 @@ def parse_signal_history(soup) -> List[Dict[str, str]]:
     
     return history
 
-def parse_suggestion_and_details(soup) -> tuple:
-    """解析建议和详细信息，包括技术指标"""
+def _parse_details_text(page_text: str) -> tuple:
+    """只依赖页面文本的字段：建议、技术指标和价格目标"""
+    suggestion = None
+    technical_indicators = {}
+    price_target = None
+    
+    # 查找当前建议 - 尝试多种模式
+    for pattern in _SUGGESTION_RES:
+        match = pattern.search(page_text)
+        if match:
+            suggestion = match.group(1).upper().strip()
+            break
+    
+    # 查找RSI
+    rsi_match = _RSI_RE.search(page_text)
+    if rsi_match:
+        technical_indicators['RSI'] = float(rsi_match.group(1))
+    
+    # 查找移动平均线信号
+    for pattern in _MA_RES:
+        ma_match = pattern.search(page_text)
+        if ma_match:
+            technical_indicators['MA_Signal'] = ma_match.group(len(ma_match.groups())).upper()
+            break
+    
+    # 查找价格目标
+    for pattern in _PRICE_TARGET_RES:
+        price_match = pattern.search(page_text)
+        if price_match:
+            price_target = f"${price_match.group(1)}"
+            break
+    
+    return suggestion, technical_indicators, price_target
+
+def parse_suggestion_and_details(soup, page_text: Optional[str] = None) -> tuple:
+    """解析建议和详细信息，包括技术指标；page_text 为已提取的页面文本"""
     suggestion = None
     summary = None
     technical_indicators = {}
     price_target = None
     
     try:
-        # 查找当前建议 - 尝试多种模式
-        suggestion_patterns = [
-            r'\b(BUY|SELL|SHORT|STAY LONG|HOLD|STRONG BUY|STRONG SELL)\b',
-            r'Current Signal:\s*([A-Z\s]+)',
-            r'Recommendation:\s*([A-Z\s]+)'
-        ]
+        # 整个页面只提取一次文本
+        if page_text is None:
+            page_text = soup.get_text()
         
-        page_text = soup.get_text()
-        for pattern in suggestion_patterns:
-            match = re.search(pattern, page_text, re.I)
-            if match:
-                suggestion = match.group(1).upper().strip()
-                break
+        suggestion, technical_indicators, price_target = _parse_details_text(page_text)
         
         # 查找 Signal Update 或相关描述
-        update_patterns = [
-            r"Signal Update",
-            r"Analysis",
-            r"Commentary",
-            r"Market View"
-        ]
-        
-        for pattern in update_patterns:
-            su = soup.find(string=re.compile(pattern, re.I))
+        for pattern in _UPDATE_RES:
+            su = soup.find(string=pattern)
             if su:
                 # 获取后续的段落文本
                 parent = su.find_parent()
                 if parent:
-                    next_elements = parent.find_next_siblings(["p", "div", "span"])
+                    next_elements = parent.find_next_siblings(["p", "div", "span"], limit=1)
                     if next_elements:
                         summary = next_elements[0].get_text(" ", strip=True)[:500]  # 限制长度
                         break
-        
-        # 尝试解析技术指标
-        tech_indicators_text = soup.get_text()
-        
-        # 查找RSI
-        rsi_match = re.search(r'RSI[:\s]*(\d+\.?\d*)', tech_indicators_text, re.I)
-        if rsi_match:
-            technical_indicators['RSI'] = float(rsi_match.group(1))
-        
-        # 查找移动平均线信号
-        ma_patterns = [
-            (r'MA\s*(\d+)[:\s]*([A-Z]+)', 'MA_Signal'),
-            (r'Moving Average[:\s]*([A-Z]+)', 'MA_Signal'),
-            (r'(\d+)-day MA[:\s]*([A-Z]+)', 'MA_Signal')
-        ]
-        
-        for pattern, key in ma_patterns:
-            ma_match = re.search(pattern, tech_indicators_text, re.I)
-            if ma_match:
-                if len(ma_match.groups()) >= 2:
-                    technical_indicators[key] = ma_match.group(2).upper()
-                else:
-                    technical_indicators[key] = ma_match.group(1).upper()
-                break
-        
-        # 查找价格目标
-        price_patterns = [
-            r'Target[:\s]*\$?(\d+\.?\d*)',
-            r'Price Target[:\s]*\$?(\d+\.?\d*)',
-            r'Objective[:\s]*\$?(\d+\.?\d*)'
-        ]
-        
-        for pattern in price_patterns:
-            price_match = re.search(pattern, tech_indicators_text, re.I)
-            if price_match:
-                price_target = f"${price_match.group(1)}"
-                break
                 
     except Exception as e:
         logger.warning(f"Failed to parse suggestion and details: {e}")
     
     return suggestion, summary, technical_indicators, price_target
 
-def fetch_ab_for_symbol(symbol: str) -> Dict[str, Any]:
-    """获取AmericanBulls的完整分析数据"""
-    symbol = symbol.upper()
-    url = BASE.format(symbol=symbol)
-    
+def parse_ab_page(soup, page_text: Optional[str] = None) -> Dict[str, Any]:
+    """解析信号页的全部字段，页面文本只提取一次"""
+    if page_text is None:
+        page_text = soup.get_text()
+    suggestion, summary, technical_indicators, price_target = parse_suggestion_and_details(soup, page_text)
+    return {
+        "suggestion": suggestion,
+        "summary": summary,
+        "signal_history": parse_signal_history(soup),
+        "technical_indicators": technical_indicators,
+        "price_target": price_target,
+    }
+
+# ---- lxml 后端 ----
+# 与 BeautifulSoup 的字符串语义保持一致：这些标签内的文本不计入 get_text()
+_HIDDEN_TEXT_TAGS = frozenset(("script", "style", "template", "rt", "rp"))
+_PRESERVE_WS_TAGS = frozenset(("pre", "textarea"))
+_ASCII_SPACES = "\x20\x0a\x09\x0c\x0d"
+_SUMMARY_TAGS = frozenset(("p", "div", "span"))
+
+def _bs4_whitespace(text: str, preserve: bool) -> str:
+    """BeautifulSoup 会把纯空白的文本节点折叠成一个换行或空格"""
+    if not preserve and not text.strip(_ASCII_SPACES):
+        return "\n" if "\n" in text else " "
+    return text
+
+def _iter_strings(el, hidden: bool = False, preserve: bool = False):
+    """按文档顺序产出 (文本, 所属元素, 是否普通文本)，与 bs4 的 NavigableString 一一对应"""
+    if not isinstance(el.tag, str):
+        # 注释：bs4 的 find(string=...) 能匹配到，但不属于 get_text()
+        if el.tag is etree.Comment and el.text:
+            yield el.text, el.getparent(), False
+        return
+    tag = el.tag.lower()
+    hidden = hidden or tag in _HIDDEN_TEXT_TAGS
+    preserve = preserve or tag in _PRESERVE_WS_TAGS
+    if el.text:
+        yield _bs4_whitespace(el.text, preserve), el, not hidden
+    for child in el:
+        yield from _iter_strings(child, hidden, preserve)
+        if child.tail:
+            yield _bs4_whitespace(child.tail, preserve), el, not hidden
+
+def _element_text(el, separator: str = "", strip: bool = False) -> str:
+    """等价于 bs4 的 Tag.get_text(separator, strip)"""
+    hidden = any(a.tag in _HIDDEN_TEXT_TAGS for a in el.iterancestors())
+    preserve = any(a.tag in _PRESERVE_WS_TAGS for a in el.iterancestors())
+    parts = (text for text, _, plain in _iter_strings(el, hidden, preserve) if plain)
+    if strip:
+        parts = (text.strip() for text in parts)
+        parts = (text for text in parts if text)
+    return separator.join(parts)
+
+class _LxmlPage:
+    """lxml 解析出的页面：字符串列表只遍历一次，页面文本只拼接一次"""
+
+    def __init__(self, html: str):
+        self.root = lxml.html.document_fromstring(html)
+        self.strings = list(_iter_strings(self.root))
+        self.text = "".join(text for text, _, plain in self.strings if plain)
+
+    def find_string_owner(self, pattern):
+        """等价于 soup.find(string=pattern).find_parent()"""
+        for text, owner, _ in self.strings:
+            if pattern.search(text):
+                return owner
+        return None
+
+    def title(self) -> Optional[str]:
+        title = next(self.root.iter("title"), None)
+        return _element_text(title) if title is not None else None
+
+def _lxml_signal_history(page: _LxmlPage) -> List[Dict[str, str]]:
+    history = []
     try:
-        # 添加请求间隔，避免被限制
-        time.sleep(1)
-        
-        response = requests.get(url, headers=HEADERS, timeout=20)
-        response.raise_for_status()
-        
-        soup = BeautifulSoup(response.text, "html.parser")
-        
-        # 解析各种数据
-        suggestion, summary, technical_indicators, price_target = parse_suggestion_and_details(soup)
-        signal_history = parse_signal_history(soup)
-        
-        result = {
-            "symbol": symbol,
+        table = None
+        owner = page.find_string_owner(_SIGNAL_HISTORY_RE)
+        if owner is not None:
+            # find_next("table")：先找后代，再找文档中之后的表格
+            found = owner.xpath("(descendant::table | following::table)[1]")
+            table = found[0] if found else None
+        
+        if table is None:
+            for t in page.root.iter("table"):
+                rows = list(islice(t.iter("tr"), 2))
+                if len(rows) > 1 and _DATE_RE.search(_element_text(rows[1])):
+                    table = t
+                    break
+        
+        if table is not None:
+            for tr in islice(table.iter("tr"), 1, 9):
+                tds = [_element_text(td, strip=True) for td in tr.iter("td")]
+                if len(tds) >= 3:
+                    date, price = tds[0], tds[1]
+                    signal = _NON_WORD_RE.sub('', tds[2].upper()).strip()
+                    if date and signal:
+                        history.append({"date": date, "price": price, "signal": signal})
+    except Exception as e:
+        logger.warning(f"Failed to parse signal history: {e}")
+    return history
+
+def _lxml_summary(page: _LxmlPage) -> Optional[str]:
+    for pattern in _UPDATE_RES:
+        owner = page.find_string_owner(pattern)
+        if owner is None:
+            continue
+        sibling = next((sib for sib in owner.itersiblings() if sib.tag in _SUMMARY_TAGS), None)
+        if sibling is not None:
+            return _element_text(sibling, " ", strip=True)[:500]
+    return None
+
+class ParsedPage:
+    """按 PARSER_BACKEND 解析后的信号页，供抓取和代码验证共用"""
+
+    def __init__(self, html: str, backend: Optional[str] = None):
+        self.backend = backend or PARSER_BACKEND
+        if self.backend == "lxml":
+            self._page = _LxmlPage(html)
+            self.text = self._page.text
+        else:
+            self._soup = make_soup(html)
+            self.text = self._soup.get_text()
+
+    def signals(self) -> Dict[str, Any]:
+        if self.backend != "lxml":
+            return parse_ab_page(self._soup, self.text)
+        summary = None
+        try:
+            suggestion, technical_indicators, price_target = _parse_details_text(self.text)
+            summary = _lxml_summary(self._page)
+        except Exception as e:
+            logger.warning(f"Failed to parse suggestion and details: {e}")
+            suggestion, technical_indicators, price_target = None, {}, None
+        return {
             "suggestion": suggestion,
             "summary": summary,
-            "signal_history": signal_history,
+            "signal_history": _lxml_signal_history(self._page),
             "technical_indicators": technical_indicators,
             "price_target": price_target,
-            "data_source": "americanbulls.com",
-            "scraped_at": time.time()
         }
-        
-        logger.info(f"Successfully fetched AB data for {symbol}: {len(signal_history)} signals, suggestion: {suggestion}")
+
+    def company_name(self, symbol: str) -> Optional[str]:
+        if self.backend != "lxml":
+            return extract_company_name(self._soup, symbol, self.text)
+        return _company_name_from_text(symbol, self.text, self._page.title())
+
+def _ab_get(url: str, **kwargs):
+    """熔断检查 -> 令牌桶限流 -> 通过共享连接池发请求"""
+    upstream.check_circuit(AB_HOST)
+    with span("ratelimit"):
+        RATELIMIT_WAIT.labels(limiter="americanbulls").observe(_ab_limiter.acquire())
+    return upstream.get(url, **kwargs)
+
+async def _ab_aget(url: str, **kwargs):
+    """_ab_get 的协程版本：等待令牌和请求上游时不占用线程"""
+    upstream.check_circuit(AB_HOST)
+    with span("ratelimit"):
+        RATELIMIT_WAIT.labels(limiter="americanbulls").observe(await _ab_limiter.acquire_async())
+    return await upstream.aget(url, **kwargs)
+
+def _validators(response, previous: Optional[Dict[str, Any]] = None) -> Dict[str, Optional[str]]:
+    """响应里的条件请求头，没有时沿用上次保存的值"""
+    previous = previous or {}
+    return {
+        "etag": response.headers.get("ETag") or previous.get("etag"),
+        "last_modified": response.headers.get("Last-Modified") or previous.get("last_modified"),
+    }
+
+def analyze_signal_page(symbol: str, html: str, previous_hash: Optional[str] = None,
+                        validate: bool = False, with_signals: bool = True) -> Dict[str, Any]:
+    """计算指纹并解析信号页，在解析进程池中运行，只返回普通 dict
+
+    validate=True 时先检查页面是否是有效的股票页（"valid"）并提取公司名称（"name"）；
+    否则指纹与 previous_hash 相同时不解析（"changed" 为 False）。
+    """
+    content_hash = page_fingerprint(html)
+    result: Dict[str, Any] = {"content_hash": content_hash, "changed": content_hash != previous_hash}
+    if not validate and not result["changed"]:
         return result
-        
-    except requests.RequestException as e:
+
+    page = ParsedPage(html)
+    if validate:
+        result["text_length"] = len(page.text)
+        result["valid"] = _looks_like_stock_page(symbol, page.text)
+        if not result["valid"]:
+            return result
+        result["name"] = page.company_name(symbol)
+        if with_signals:
+            try:
+                result["signals"] = page.signals()
+            except Exception as e:
+                logger.warning(f"Failed to parse signals from validation page for {symbol}: {e}")
+        return result
+
+    result["signals"] = page.signals()
+    return result
+
+def _looks_like_stock_page(symbol: str, page_text: str) -> bool:
+    # 检查页面是否包含股票特征信息
+    has_stock_info = any([
+        symbol in page_text.upper(),
+        "STAY LONG" in page_text,
+        "BUY" in page_text,
+        "SELL" in page_text,
+        "Close" in page_text and "Prev.Close" in page_text,
+        "NASDAQ" in page_text or "NYSE" in page_text or "AMEX" in page_text
+    ])
+    # 内容太少的页面也不是有效的股票页
+    return has_stock_info and len(page_text) >= 10000
+
+def analyze_search_page(symbol: str, html: str) -> Optional[Dict[str, str]]:
+    """解析搜索结果页，在解析进程池中运行"""
+    return parse_search_results(make_soup(html), symbol)
+
+def _signal_result(symbol: str, signals: Dict[str, Any], content_hash: str,
+                   validators: Dict[str, Optional[str]]) -> Dict[str, Any]:
+    return {
+        "symbol": symbol,
+        **signals,
+        "changed": True,
+        "content_hash": content_hash,
+        **validators,
+        "data_source": "americanbulls.com",
+        "scraped_at": time.time()
+    }
+
+def _conditional_headers(previous: Dict[str, Any]) -> Dict[str, str]:
+    headers = dict(HEADERS)
+    if previous.get("etag"):
+        headers["If-None-Match"] = previous["etag"]
+    if previous.get("last_modified"):
+        headers["If-Modified-Since"] = previous["last_modified"]
+    return headers
+
+def _not_modified(symbol: str, response, previous: Dict[str, Any]) -> Dict[str, Any]:
+    logger.info(f"AB page for {symbol} not modified (304)")
+    return {"symbol": symbol, "changed": False, "content_hash": previous.get("content_hash"),
+            **_validators(response, previous)}
+
+def _page_result(symbol: str, response, previous: Dict[str, Any], parsed: Dict[str, Any]) -> Dict[str, Any]:
+    validators = _validators(response, previous)
+    if not parsed["changed"]:
+        logger.info(f"AB page for {symbol} unchanged, skipped parsing")
+        return {"symbol": symbol, "changed": False, "content_hash": parsed["content_hash"], **validators}
+    
+    # 解析各种数据
+    result = _signal_result(symbol, parsed["signals"], parsed["content_hash"], validators)
+    
+    logger.info(f"Successfully fetched AB data for {symbol}: {len(result['signal_history'])} signals, suggestion: {result['suggestion']}")
+    return result
+
+def _error_result(symbol: str, e: Exception) -> Dict[str, Any]:
+    if isinstance(e, requests.RequestException):
         logger.error(f"Network error fetching AB data for {symbol}: {e}")
-        return {
-            "symbol": symbol,
-            "suggestion": None,
-            "summary": f"网络错误: {str(e)[:100]}",
-            "signal_history": [],
-            "technical_indicators": {},
-            "price_target": None,
-            "error": str(e)
-        }
-    except Exception as e:
+        label = "网络错误"
+    else:
         logger.error(f"Unexpected error fetching AB data for {symbol}: {e}")
+        label = "解析错误"
+    return {
+        "symbol": symbol,
+        "suggestion": None,
+        "summary": f"{label}: {str(e)[:100]}",
+        "signal_history": [],
+        "technical_indicators": {},
+        "price_target": None,
+        "error": str(e)
+    }
+
+def _observe_fetch(result: Dict[str, Any], start: float):
+    outcome = "error" if "error" in result else ("changed" if result.get("changed", True) else "unchanged")
+    AB_FETCH.labels(result=outcome).observe(time.perf_counter() - start)
+
+def fetch_ab_for_symbol(symbol: str, previous: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """获取AmericanBulls的完整分析数据
+
+    previous 为上次抓取保存的 etag / last_modified / content_hash。上游返回 304
+    或页面指纹没变时不再解析，返回 {"changed": False, ...}。
+    """
+    start = time.perf_counter()
+    with span("scrape"):
+        result = _fetch_ab_for_symbol(symbol, previous)
+    _observe_fetch(result, start)
+    return result
+
+def _fetch_ab_for_symbol(symbol: str, previous: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    symbol = symbol.upper()
+    previous = previous or {}
+    
+    try:
+        # 通过令牌桶限流，避免被限制
+        response = _ab_get(BASE.format(symbol=symbol), headers=_conditional_headers(previous), timeout=20)
+        if response.status_code == 304:
+            return _not_modified(symbol, response, previous)
+        response.raise_for_status()
+        
+        # 指纹和解析都在解析进程池中完成，不占用 API 线程的 GIL
+        parsed = parsepool.run(analyze_signal_page, symbol, response.text, previous.get("content_hash"))
+        return _page_result(symbol, response, previous, parsed)
+    except Exception as e:
+        return _error_result(symbol, e)
+
+async def fetch_ab_for_symbol_async(symbol: str, previous: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """fetch_ab_for_symbol 的协程版本，供异步接口使用：限流等待、请求和解析都不占用线程"""
+    start = time.perf_counter()
+    with span("scrape"):
+        result = await _fetch_ab_for_symbol_async(symbol, previous)
+    _observe_fetch(result, start)
+    return result
+
+async def _fetch_ab_for_symbol_async(symbol: str, previous: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    symbol = symbol.upper()
+    previous = previous or {}
+    
+    try:
+        response = await _ab_aget(BASE.format(symbol=symbol), headers=_conditional_headers(previous), timeout=20)
+        if response.status_code == 304:
+            return _not_modified(symbol, response, previous)
+        upstream.check_status(response)
+        
+        parsed = await parsepool.run_async(analyze_signal_page, symbol, response.text, previous.get("content_hash"))
+        return _page_result(symbol, response, previous, parsed)
+    except Exception as e:
+        return _error_result(symbol, e)
+
+def _validation_result(symbol: str, response, parsed: Dict[str, Any]) -> Dict[str, Any]:
+    if not parsed["valid"]:
+        # 页面没有股票信息或内容太少
+        logger.warning(f"Invalid stock page for {symbol}, content length: {parsed['text_length']}")
+        return {"valid": False, "symbol": symbol, "name": None}
+    
+    logger.info(f"Symbol {symbol} validated successfully via direct access")
+    result = {
+        "valid": True,
+        "symbol": symbol,
+        "name": parsed["name"]
+    }
+    if parsed.get("signals") is not None:
+        result["signals"] = _signal_result(
+            symbol, parsed["signals"], parsed["content_hash"], _validators(response)
+        )
+    return result
+
+def _search_result(symbol: str, search_results: Optional[Dict[str, str]]) -> Dict[str, Any]:
+    if search_results:
+        logger.info(f"Symbol {symbol} found via search")
         return {
+            "valid": True,
             "symbol": symbol,
-            "suggestion": None,
-            "summary": f"解析错误: {str(e)[:100]}",
-            "signal_history": [],
-            "technical_indicators": {},
-            "price_target": None,
-            "error": str(e)
+            "name": search_results.get("name")
         }
+    logger.info(f"Symbol {symbol} not found in search results")
+    return {"valid": False, "symbol": symbol, "name": None}
 
-def validate_symbol_and_get_name(symbol: str) -> Dict[str, Any]:
-    """使用AmericanBulls验证股票代码并获取公司名称"""
+def _unverified(symbol: str, error: Optional[str]) -> Dict[str, Any]:
+    """信号页和搜索页都没能给出结论；上游出错时带 "error"，调用方可以稍后重试"""
+    result = {"valid": False, "symbol": symbol, "name": None}
+    if error:
+        result["error"] = error
+    return result
+
+def validate_symbol_and_get_name(symbol: str, with_signals: bool = False) -> Dict[str, Any]:
+    """使用AmericanBulls验证股票代码并获取公司名称
+
+    with_signals=True 时顺便解析同一个信号页，结果放在 "signals" 中（格式与
+    fetch_ab_for_symbol 相同），添加股票时不必再抓一次。网络错误、熔断或上游
+    返回错误状态导致无法判断时，结果带 "error"，与"不是有效代码"区分开。
+    """
     symbol = symbol.upper().strip()
     
     try:
         # 首先尝试直接访问股票页面
-        url = BASE.format(symbol=symbol)
-        response = requests.get(url, headers=HEADERS, timeout=15)
-        
+        response = _ab_get(BASE.format(symbol=symbol), headers=HEADERS, timeout=15)
         if response.status_code == 200:
-            soup = BeautifulSoup(response.text, "html.parser")
-            
-            # 检查页面是否包含有效的股票信息
-            page_text = soup.get_text()
-            
-            # 检查页面是否包含股票特征信息
-            has_stock_info = any([
-                symbol in page_text.upper(),
-                "STAY LONG" in page_text,
-                "BUY" in page_text,
-                "SELL" in page_text,
-                "Close" in page_text and "Prev.Close" in page_text,
-                "NASDAQ" in page_text or "NYSE" in page_text or "AMEX" in page_text
-            ])
-            
-            if not has_stock_info or len(page_text) < 10000:
-                # 页面没有股票信息或内容太少
-                logger.warning(f"Invalid stock page for {symbol}, content length: {len(page_text)}")
-                return {"valid": False, "symbol": symbol, "name": None}
-            
-            # 尝试提取公司名称
-            company_name = extract_company_name(soup, symbol)
-            
-            logger.info(f"Symbol {symbol} validated successfully via direct access")
-            return {
-                "valid": True,
-                "symbol": symbol,
-                "name": company_name
-            }
-            
+            parsed = parsepool.run(
+                analyze_signal_page, symbol, response.text, validate=True, with_signals=with_signals
+            )
+            return _validation_result(symbol, response, parsed)
     except requests.RequestException as e:
         logger.warning(f"Direct access failed for {symbol}: {e}")
     
     # 如果直接访问失败，尝试搜索
     try:
-        search_url = SEARCH_BASE.format(symbol=symbol)
-        response = requests.get(search_url, headers=HEADERS, timeout=15)
-        
+        response = _ab_get(SEARCH_BASE.format(symbol=symbol), headers=HEADERS, timeout=15)
         if response.status_code == 200:
-            soup = BeautifulSoup(response.text, "html.parser")
-            
-            # 检查搜索结果
-            search_results = parse_search_results(soup, symbol)
-            
-            if search_results:
-                logger.info(f"Symbol {symbol} found via search")
-                return {
-                    "valid": True,
-                    "symbol": symbol,
-                    "name": search_results.get("name")
-                }
-            else:
-                logger.info(f"Symbol {symbol} not found in search results")
-                return {"valid": False, "symbol": symbol, "name": None}
-                
+            return _search_result(symbol, parsepool.run(analyze_search_page, symbol, response.text))
+        # 429 / 5xx 说明上游暂时不可用，其他状态视为没找到
+        error = f"search returned HTTP {response.status_code}" if response.status_code in upstream.RETRY_STATUS else None
     except requests.RequestException as e:
         logger.error(f"Search failed for {symbol}: {e}")
-        return {"valid": False, "symbol": symbol, "name": None}
+        error = str(e)
     
-    return {"valid": False, "symbol": symbol, "name": None}
+    return _unverified(symbol, error)
 
-def extract_company_name(soup, symbol: str) -> Optional[str]:
-    """从股票页面提取公司名称"""
+async def validate_symbol_and_get_name_async(symbol: str, with_signals: bool = False) -> Dict[str, Any]:
+    """validate_symbol_and_get_name 的协程版本"""
+    symbol = symbol.upper().strip()
+    
+    try:
+        response = await _ab_aget(BASE.format(symbol=symbol), headers=HEADERS, timeout=15)
+        if response.status_code == 200:
+            parsed = await parsepool.run_async(
+                analyze_signal_page, symbol, response.text, validate=True, with_signals=with_signals
+            )
+            return _validation_result(symbol, response, parsed)
+    except requests.RequestException as e:
+        logger.warning(f"Direct access failed for {symbol}: {e}")
+    
+    try:
+        response = await _ab_aget(SEARCH_BASE.format(symbol=symbol), headers=HEADERS, timeout=15)
+        if response.status_code == 200:
+            return _search_result(symbol, await parsepool.run_async(analyze_search_page, symbol, response.text))
+        # 429 / 5xx 说明上游暂时不可用，其他状态视为没找到
+        error = f"search returned HTTP {response.status_code}" if response.status_code in upstream.RETRY_STATUS else None
+    except requests.RequestException as e:
+        logger.error(f"Search failed for {symbol}: {e}")
+        error = str(e)
+    
+    return _unverified(symbol, error)
+
+def extract_company_name(soup, symbol: str, page_text: Optional[str] = None) -> Optional[str]:
+    """从股票页面提取公司名称；page_text 为已提取的页面文本"""
+    try:
+        if page_text is None:
+            page_text = soup.get_text()
+        title_tag = soup.find("title")
+        title = title_tag.get_text() if title_tag else None
+        return _company_name_from_text(symbol, page_text, title)
+    except Exception as e:
+        logger.warning(f"Failed to extract company name for {symbol}: {e}")
+        return None
+
+def _company_name_from_text(symbol: str, page_text: str, title: Optional[str]) -> Optional[str]:
+    """根据页面文本和标题推断公司名称（与解析后端无关）"""
     try:
-        page_text = soup.get_text()
-        
         # 方法1: 从页面文本中查找公司名称模式
         # 基于观察到的结构：AAPL (NASDAQ) 后面跟着 Apple Inc
         lines = [line.strip() for line in page_text.split('\n') if line.strip()]
@@ -309,9 +657,8 @@ def extract_company_name(soup, symbol: str) -> Optional[str]:
                         return next_line
         
         # 方法2: 从标题提取
-        title_tag = soup.find("title")
-        if title_tag:
-            title = title_tag.get_text().strip()
+        if title is not None:
+            title = title.strip()
             # 标题格式如 "AAPL (NASDAQ)"
             if symbol in title and "(" in title:
                 # 有时候标题之后会有公司名
@@ -359,7 +706,7 @@ def parse_search_results(soup, target_symbol: str) -> Optional[Dict[str, str]]:
         # 根据实际页面结构调整选择器
         
         # 方法1: 查找包含股票代码的链接
-        links = soup.find_all("a", href=re.compile(r"SignalPage.*Ticker=", re.I))
+        links = soup.find_all("a", href=_SIGNAL_LINK_RE)
         
         for link in links:
             href = link.get("href", "")
@@ -0,0 +1,285 @@
+import os
+import logging
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+import numpy as np
+from sqlalchemy import select, func
+from ..db import SessionLocal
+from ..models import ABSignalEvent, PriceBar
+from .bars import DAY_MS, sync_bars
+from .cache import TTLCache
+from .ratelimit import host_limiter
+
+logger = logging.getLogger(__name__)
+
+# 默认的持有期（交易日）和允许的最大持有期
+DEFAULT_HORIZONS = (1, 5, 10, 20)
+MAX_HORIZON = int(os.getenv("BACKTEST_MAX_HORIZON", "120"))
+# 按股票缓存的逐条信号结果；签名（K 线和事件的数量、最新时间）变化时重算，TTL 只是兜底
+BACKTEST_CACHE_SIZE = int(os.getenv("BACKTEST_CACHE_SIZE", "10000"))
+BACKTEST_CACHE_TTL = float(os.getenv("BACKTEST_CACHE_TTL_SEC", "86400"))
+# sync=True 时补全日线的回溯区间，以及单次请求最多补全的股票数
+BACKTEST_PERIOD = os.getenv("BACKTEST_PERIOD", "5y")
+BACKTEST_SYNC_MAX = int(os.getenv("BACKTEST_SYNC_MAX", "50"))
+# 一次向量化计算的最大矩阵元素数（信号数 × 持有期），超过时分块
+BACKTEST_CHUNK_CELLS = int(os.getenv("BACKTEST_CHUNK_CELLS", "4000000"))
+# 每条 IN 查询的股票数
+_SYMBOL_CHUNK = 500
+
+# 信号预期的价格方向：命中率和回撤按这个方向计算，0 表示不计命中率
+SIGNAL_DIRECTION = {"BUY": 1, "STAY LONG": 1, "SELL": -1, "SHORT": -1, "STAY SHORT": -1}
+
+# 复合键 = 股票编号 << 20 | 自 1970 年起的天数（2^20 天约 2870 年）
+_KEY_SHIFT = 20
+
+_EMPTY = {
+    "day": np.empty(0, dtype=np.int64), "signal": np.empty(0, dtype=object),
+    "direction": np.empty(0, dtype=np.int64), "entry": np.empty(0), "drawdown": np.empty(0),
+}
+
+_results = TTLCache(BACKTEST_CACHE_SIZE, BACKTEST_CACHE_TTL, name="backtest")
+
+def forward_returns(bar_code: np.ndarray, bar_day: np.ndarray, close: np.ndarray,
+                    ev_code: np.ndarray, ev_day: np.ndarray, ev_dir: np.ndarray,
+                    horizons: Sequence[int]) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """所有股票一起计算每条信号的入场价、各持有期收益和持有期内的最大不利回撤
+
+    K 线须按 (bar_code, bar_day) 排序。入场价为信号日当天（非交易日则为之后第一个
+    交易日）的收盘价，h 日收益为之后第 h 根 K 线的收盘价相对入场价的涨跌；数据不足时为 NaN。
+    回撤按信号方向计算（做空信号价格上涨为回撤），取最大持有期内的最差值，不大于 0。
+    返回 (entry[E], returns[E, len(horizons)], drawdown[E])。
+    """
+    n, e = len(close), len(ev_code)
+    horizons = np.asarray(horizons, dtype=np.int64)
+    entry = np.full(e, np.nan)
+    returns = np.full((e, len(horizons)), np.nan)
+    drawdown = np.full(e, np.nan)
+    if n == 0 or e == 0:
+        return entry, returns, drawdown
+
+    bar_key = (bar_code.astype(np.int64) << _KEY_SHIFT) | bar_day.astype(np.int64)
+    ev_key = (ev_code.astype(np.int64) << _KEY_SHIFT) | ev_day.astype(np.int64)
+    idx = np.minimum(np.searchsorted(bar_key, ev_key, side="left"), n - 1)
+    # 找到的 K 线必须属于同一个股票，且不早于信号日
+    found = (bar_code[idx] == ev_code) & (bar_key[idx] >= ev_key)
+    entry[found] = close[idx[found]]
+
+    span = int(horizons.max())
+    steps = np.arange(span + 1)
+    chunk = max(1, BACKTEST_CHUNK_CELLS // (span + 1))
+    for lo in range(0, e, chunk):
+        hi = min(lo + chunk, e)
+        win = idx[lo:hi, None] + steps
+        win_c = np.minimum(win, n - 1)
+        same = (win < n) & (bar_code[win_c] == ev_code[lo:hi, None]) & found[lo:hi, None]
+        path = np.where(same, close[win_c] / entry[lo:hi, None] - 1, np.nan)
+        returns[lo:hi] = path[:, horizons]
+
+        signed = path[:, 1:] * ev_dir[lo:hi, None]
+        worst = np.where(same[:, 1:], signed, np.inf).min(axis=1)
+        has_path = np.isfinite(worst) & (ev_dir[lo:hi] != 0)
+        drawdown[lo:hi] = np.where(has_path, np.minimum(worst, 0), np.nan)
+    return entry, returns, drawdown
+
+def _day_numbers(values) -> np.ndarray:
+    return np.asarray(values, dtype="datetime64[D]").astype(np.int64)
+
+def _signatures(db, symbols: List[str]) -> Dict[str, tuple]:
+    """每个股票的 (K 线数, 最后一根 K 线时间, 收盘价之和, 事件数, 最新事件日期)"""
+    sigs = {sym: [0, None, None, 0, None] for sym in symbols}
+    for i in range(0, len(symbols), _SYMBOL_CHUNK):
+        chunk = symbols[i:i + _SYMBOL_CHUNK]
+        bars = db.execute(
+            select(PriceBar.symbol, func.count(), func.max(PriceBar.ts), func.sum(PriceBar.close))
+            .where(PriceBar.interval == "1d", PriceBar.symbol.in_(chunk))
+            .group_by(PriceBar.symbol)
+        )
+        for sym, count, last_ts, total in bars:
+            sigs[sym][0:3] = [count, last_ts, total]
+        events = db.execute(
+            select(ABSignalEvent.symbol, func.count(), func.max(ABSignalEvent.date))
+            .where(ABSignalEvent.symbol.in_(chunk))
+            .group_by(ABSignalEvent.symbol)
+        )
+        for sym, count, last_date in events:
+            sigs[sym][3:5] = [count, last_date]
+    return {sym: tuple(v) for sym, v in sigs.items()}
+
+def _load(db, symbols: List[str]):
+    """一次读出多个股票的日线和信号，按股票编号（symbols 的下标）排序"""
+    code_of = {sym: i for i, sym in enumerate(symbols)}
+    bars, events = [], []
+    for i in range(0, len(symbols), _SYMBOL_CHUNK):
+        chunk = symbols[i:i + _SYMBOL_CHUNK]
+        bars.extend(db.execute(
+            select(PriceBar.symbol, PriceBar.ts, PriceBar.close)
+            .where(PriceBar.interval == "1d", PriceBar.symbol.in_(chunk))
+        ).all())
+        events.extend(db.execute(
+            select(ABSignalEvent.symbol, ABSignalEvent.date, ABSignalEvent.signal)
+            .where(ABSignalEvent.symbol.in_(chunk))
+        ).all())
+
+    bar_code = np.fromiter((code_of[r[0]] for r in bars), dtype=np.int64, count=len(bars))
+    # 日线时间戳是纽约时间零点，对应 UTC 同一天的 04:00/05:00
+    bar_day = np.fromiter((r[1] for r in bars), dtype=np.int64, count=len(bars)) // DAY_MS
+    close = np.fromiter((r[2] for r in bars), dtype=np.float64, count=len(bars))
+    order = np.lexsort((bar_day, bar_code))
+    bar_code, bar_day, close = bar_code[order], bar_day[order], close[order]
+
+    ev_code = np.fromiter((code_of[r[0]] for r in events), dtype=np.int64, count=len(events))
+    ev_day = _day_numbers([r[1] for r in events]) if events else np.empty(0, dtype=np.int64)
+    ev_signal = np.array([r[2] for r in events], dtype=object)
+    order = np.lexsort((ev_day, ev_code))
+    return (bar_code, bar_day, close), (ev_code[order], ev_day[order], ev_signal[order])
+
+def _compute(db, symbols: List[str], horizons: Tuple[int, ...]) -> Dict[str, Dict[str, np.ndarray]]:
+    """重算一批股票，返回每个股票的逐条信号结果"""
+    (bar_code, bar_day, close), (ev_code, ev_day, ev_signal) = _load(db, symbols)
+    ev_dir = np.array([SIGNAL_DIRECTION.get(s, 0) for s in ev_signal], dtype=np.int64)
+    entry, returns, drawdown = forward_returns(bar_code, bar_day, close, ev_code, ev_day, ev_dir, horizons)
+
+    # 事件已按股票编号排序，按边界切分
+    bounds = np.searchsorted(ev_code, np.arange(len(symbols) + 1))
+    return {
+        sym: {
+            "day": ev_day[lo:hi], "signal": ev_signal[lo:hi], "direction": ev_dir[lo:hi],
+            "entry": entry[lo:hi], "returns": returns[lo:hi], "drawdown": drawdown[lo:hi],
+        }
+        for sym, lo, hi in zip(symbols, bounds[:-1], bounds[1:])
+    }
+
+def event_results(symbols: List[str], horizons: Sequence[int] = DEFAULT_HORIZONS) -> Dict[str, Dict[str, np.ndarray]]:
+    """每个股票的逐条信号回测结果；只重算签名变化了的股票"""
+    horizons = tuple(horizons)
+    db = SessionLocal()
+    try:
+        sigs = _signatures(db, symbols)
+        out, stale = {}, []
+        for sym in symbols:
+            cached = _results.get((sym, horizons))
+            if cached is not None and cached[0] == sigs[sym]:
+                out[sym] = cached[1]
+            else:
+                stale.append(sym)
+        if stale:
+            fresh = _compute(db, stale, horizons)
+            for sym in stale:
+                _results.set((sym, horizons), (sigs[sym], fresh[sym]))
+            out.update(fresh)
+            logger.info(f"Backtest recomputed {len(stale)} of {len(symbols)} symbols")
+        return out
+    finally:
+        db.close()
+
+def _group_stats(codes: np.ndarray, groups: int, returns: np.ndarray, direction: np.ndarray,
+                 drawdown: np.ndarray, horizons: Sequence[int]) -> List[Dict[str, Any]]:
+    """按组编号汇总：每个持有期的样本数、平均/中位收益、命中率，以及回撤"""
+    stats = [{"count": 0, "horizons": {}} for _ in range(groups)]
+    counts = np.bincount(codes, minlength=groups)
+    for g in range(groups):
+        stats[g]["count"] = int(counts[g])
+
+    for j, h in enumerate(horizons):
+        r = returns[:, j]
+        ok = ~np.isnan(r)
+        c, v, d = codes[ok], r[ok], direction[ok]
+        n = np.bincount(c, minlength=groups)
+        total = np.bincount(c, weights=v, minlength=groups)
+        directional = d != 0
+        hits = np.bincount(c[directional], weights=(v[directional] * d[directional] > 0), minlength=groups)
+        judged = np.bincount(c[directional], minlength=groups)
+        # 中位数：按 (组, 收益) 排序后取每组中间的元素
+        order = np.lexsort((v, c))
+        vs = v[order]
+        starts = np.cumsum(n) - n
+        mid_lo = np.minimum(starts + (n - 1) // 2, max(len(vs) - 1, 0))
+        mid_hi = np.minimum(starts + n // 2, max(len(vs) - 1, 0))
+        for g in range(groups):
+            if n[g] == 0:
+                stats[g]["horizons"][str(h)] = {"count": 0, "mean_return": None, "median_return": None, "hit_rate": None}
+                continue
+            stats[g]["horizons"][str(h)] = {
+                "count": int(n[g]),
+                "mean_return": round(float(total[g] / n[g]), 6),
+                "median_return": round(float((vs[mid_lo[g]] + vs[mid_hi[g]]) / 2), 6),
+                "hit_rate": round(float(hits[g] / judged[g]), 4) if judged[g] else None,
+            }
+
+    ok = ~np.isnan(drawdown)
+    c, d = codes[ok], drawdown[ok]
+    n = np.bincount(c, minlength=groups)
+    total = np.bincount(c, weights=d, minlength=groups)
+    worst = np.zeros(groups)
+    np.minimum.at(worst, c, d)
+    for g in range(groups):
+        stats[g]["avg_drawdown"] = round(float(total[g] / n[g]), 6) if n[g] else None
+        stats[g]["max_drawdown"] = round(float(worst[g]), 6) if n[g] else None
+    return stats
+
+def run_backtest(symbols: List[str], horizons: Sequence[int] = DEFAULT_HORIZONS,
+                 signals: Optional[List[str]] = None, start=None, end=None,
+                 include_events: bool = False) -> Dict[str, Any]:
+    """回测 symbols 的 AB 信号：按信号类型和按 (股票, 信号类型) 汇总
+
+    signals、start / end（信号日期，含两端）用于筛选参与统计的信号。
+    """
+    horizons = tuple(sorted(set(int(h) for h in horizons)))
+    per_symbol = event_results(symbols, horizons)
+    if not per_symbol:
+        per_symbol = {"": {**_EMPTY, "returns": np.empty((0, len(horizons)))}}
+    sym = np.concatenate([np.full(len(r["day"]), s, dtype=object) for s, r in per_symbol.items()])
+    day, signal, direction, entry, returns, drawdown = (
+        np.concatenate([r[k] for r in per_symbol.values()])
+        for k in ("day", "signal", "direction", "entry", "returns", "drawdown")
+    )
+
+    keep = ~np.isnan(entry)
+    if signals:
+        keep &= np.isin(signal, signals)
+    if start is not None:
+        keep &= day >= _day_numbers(start)
+    if end is not None:
+        keep &= day <= _day_numbers(end)
+    day, signal, direction, entry = day[keep], signal[keep], direction[keep], entry[keep]
+    returns, drawdown, sym = returns[keep], drawdown[keep], sym[keep]
+
+    sig_names, sig_codes = np.unique(signal.astype(str), return_inverse=True)
+    sym_names, sym_codes = np.unique(sym.astype(str), return_inverse=True)
+    # (股票, 信号类型) 组合编号
+    pairs, pair_codes = np.unique(sym_codes * max(len(sig_names), 1) + sig_codes, return_inverse=True)
+    by_signal = _group_stats(sig_codes, len(sig_names), returns, direction, drawdown, horizons)
+    by_symbol = _group_stats(pair_codes, len(pairs), returns, direction, drawdown, horizons)
+
+    result = {
+        "horizons": list(horizons),
+        "symbols": len(symbols),
+        "events": int(len(day)),
+        "by_signal": [{"signal": name, **s} for name, s in zip(sig_names.tolist(), by_signal)],
+        "by_symbol": [
+            {"symbol": sym_names[p // len(sig_names)], "signal": sig_names[p % len(sig_names)], **s}
+            for p, s in zip(pairs.tolist(), by_symbol)
+        ],
+    }
+    if include_events:
+        dates = day.astype("datetime64[D]").astype(str)
+        result["event_list"] = [
+            {
+                "symbol": sym[i], "date": dates[i], "signal": signal[i], "entry": float(entry[i]),
+                "returns": {str(h): (None if np.isnan(returns[i, j]) else round(float(returns[i, j]), 6))
+                            for j, h in enumerate(horizons)},
+                "drawdown": None if np.isnan(drawdown[i]) else round(float(drawdown[i]), 6),
+            }
+            for i in range(len(day))
+        ]
+    return result
+
+def sync_daily_bars(symbols: List[str], period: str = BACKTEST_PERIOD) -> int:
+    """把日线增量同步到本地存储（最多 BACKTEST_SYNC_MAX 个股票），返回写入条数"""
+    limiter = host_limiter("query2.finance.yahoo.com")
+    return sum(
+        sync_bars(sym, "1d", period, throttle=lambda _sym: limiter.acquire())
+        for sym in symbols[:BACKTEST_SYNC_MAX]
+    )
+
+def backtest_cache_stats() -> Dict[str, Any]:
+    return _results.stats()
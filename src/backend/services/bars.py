@@ -0,0 +1,227 @@
+import os
+import re
+import time
+import logging
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, List, Optional, Tuple
+import numpy as np
+import yfinance as yf
+from sqlalchemy import select, func
+from ..db import SessionLocal, bulk_upsert
+from ..models import PriceBar
+from . import upstream
+from .cache import TTLCache
+from .metrics import YFINANCE_CALL
+from .timing import span
+from .singleflight import SingleFlight
+
+logger = logging.getLogger(__name__)
+
+# 各 K 线周期的秒数
+INTERVAL_SECONDS = {
+    "1m": 60, "2m": 120, "5m": 300, "15m": 900, "30m": 1800,
+    "60m": 3600, "90m": 5400, "1h": 3600,
+    "1d": 86400, "5d": 5 * 86400, "1wk": 7 * 86400, "1mo": 30 * 86400, "3mo": 90 * 86400,
+}
+# yfinance 分钟级数据的最大回溯天数
+INTRADAY_LOOKBACK_DAYS = {"1m": 7}
+DEFAULT_INTRADAY_LOOKBACK_DAYS = 59
+
+# 同一 (symbol, interval) 两次上游同步的最小间隔
+BAR_SYNC_MIN_SEC = float(os.getenv("BAR_SYNC_MIN_SEC", "60"))
+
+DAY_MS = 86400 * 1000
+# 美股交易时段在 UTC-5 下不会跨日，用它把时间戳归到交易日
+SESSION_OFFSET_MS = 5 * 3600 * 1000
+
+_PERIOD_RE = re.compile(r"^(\d+)(d|wk|mo|y)$")
+_PERIOD_UNIT_DAYS = {"d": 1, "wk": 7, "mo": 31, "y": 366}
+
+_flight = SingleFlight()
+# (symbol, interval) -> 最近一次同步时间
+_last_sync = TTLCache(5000, BAR_SYNC_MIN_SEC, name="bar_sync")
+# (symbol, interval) -> 已经从上游回填到的最早时间（毫秒，0 表示 max）
+_coverage = TTLCache(5000, 86400, name="bar_coverage")
+
+def is_intraday(interval: str) -> bool:
+    return INTERVAL_SECONDS.get(interval, 86400) < 86400
+
+def _lookback_days(interval: str) -> Optional[int]:
+    if not is_intraday(interval):
+        return None
+    return INTRADAY_LOOKBACK_DAYS.get(interval, DEFAULT_INTRADAY_LOOKBACK_DAYS)
+
+def period_days(period: str) -> Optional[float]:
+    """把 yfinance 的 period 换算成天数，max 返回 None"""
+    if period == "max":
+        return None
+    if period == "ytd":
+        now = datetime.now(timezone.utc)
+        return (now - datetime(now.year, 1, 1, tzinfo=timezone.utc)).total_seconds() / 86400
+    m = _PERIOD_RE.match(period)
+    if not m:
+        raise ValueError(f"unsupported period: {period}")
+    return int(m.group(1)) * _PERIOD_UNIT_DAYS[m.group(2)]
+
+def _clamp_period(period: str, interval: str) -> str:
+    """分钟级数据不能超出 yfinance 的回溯上限"""
+    limit = _lookback_days(interval)
+    days = period_days(period)
+    if limit is not None and (days is None or days > limit):
+        return f"{limit}d"
+    return period
+
+def frame_rows(symbol: str, interval: str, hist) -> List[Dict[str, Any]]:
+    """把 yfinance 的 OHLCV DataFrame 转成 price_bars 的行"""
+    if hist is None or hist.empty:
+        return []
+    hist = hist.dropna(subset=["Close"])
+    if hist.empty:
+        return []
+
+    # 整列转成 Python 列表后再组装，避免逐行访问 DataFrame
+    ts = hist.index.as_unit("ms").asi8.tolist()
+    ohlc = [hist[c].to_numpy(dtype=np.float64).tolist() for c in ("Open", "High", "Low", "Close")]
+    volume = hist["Volume"].to_numpy(dtype=np.float64)
+    volume = np.where(np.isnan(volume), -1, volume).astype(np.int64).tolist()
+    return [
+        {
+            "symbol": symbol, "interval": interval, "ts": t,
+            "open": o, "high": h, "low": l, "close": c,
+            "volume": v if v >= 0 else None,
+        }
+        for t, o, h, l, c, v in zip(ts, *ohlc, volume)
+    ]
+
+def _upsert_frame(db, symbol: str, interval: str, hist) -> int:
+    rows = frame_rows(symbol, interval, hist)
+    if not rows:
+        return 0
+    # 最后一根 K 线在收盘前会变化，冲突时覆盖
+    bulk_upsert(
+        db, PriceBar, rows, ["symbol", "interval", "ts"],
+        update_columns=("open", "high", "low", "close", "volume"),
+    )
+    db.commit()
+    return len(rows)
+
+def _sync(symbol: str, interval: str, period: str, throttle: Optional[Callable[[str], None]]) -> int:
+    key = (symbol, interval)
+    now_ms = int(time.time() * 1000)
+    days = period_days(period)
+    want_start = 0 if days is None else now_ms - int(days * DAY_MS)
+    lookback = _lookback_days(interval)
+    slack_ms = (4 if is_intraday(interval) else 7) * DAY_MS
+
+    db = SessionLocal()
+    try:
+        first_ts, last_ts = db.execute(
+            select(func.min(PriceBar.ts), func.max(PriceBar.ts))
+            .where(PriceBar.symbol == symbol, PriceBar.interval == interval)
+        ).one()
+
+        covered = _coverage.get(key)
+        need_backfill = (
+            first_ts is None
+            or (want_start < first_ts - slack_ms and (covered is None or covered > want_start))
+        )
+        if need_backfill:
+            fetch_kwargs = {"period": _clamp_period(period, interval)}
+        elif now_ms - last_ts < INTERVAL_SECONDS.get(interval, 86400) * 1000:
+            # 还不可能出现新的 K 线
+            return 0
+        elif lookback is not None and now_ms - last_ts > lookback * DAY_MS:
+            fetch_kwargs = {"period": f"{lookback}d"}
+        else:
+            # 只取最后一根已存 K 线之后的数据（包含它本身，用于更新未收盘的 K 线）
+            fetch_kwargs = {"start": datetime.fromtimestamp(last_ts / 1000, tz=timezone.utc)}
+
+        if throttle:
+            throttle(symbol)
+        with span("yfinance"), YFINANCE_CALL.labels(call="history").time():
+            hist = yf.Ticker(symbol, session=upstream.session).history(interval=interval, **fetch_kwargs)
+        count = _upsert_frame(db, symbol, interval, hist)
+        if need_backfill:
+            _coverage.set(key, want_start)
+        logger.info(f"Synced {count} {interval} bars for {symbol} ({fetch_kwargs})")
+        return count
+    finally:
+        db.close()
+
+def sync_bars(symbol: str, interval: str, period: str,
+              throttle: Optional[Callable[[str], None]] = None) -> int:
+    """把上游的新 K 线增量写入本地存储，返回写入条数；上游失败时只记录日志"""
+    symbol = symbol.upper()
+    key = (symbol, interval)
+    if _last_sync.get(key) is not None:
+        covered = _coverage.get(key)
+        days = period_days(period)
+        want_start = 0 if days is None else int((time.time() - days * 86400) * 1000)
+        if covered is not None and covered <= want_start:
+            return 0
+    try:
+        return _flight.do(("bars", symbol, interval, period), _sync, symbol, interval, period, throttle)
+    except Exception as e:
+        logger.error(f"Failed to sync {interval} bars for {symbol}: {e}")
+        return 0
+    finally:
+        _last_sync.set(key, time.time())
+
+def _columns(rows) -> Tuple[np.ndarray, np.ndarray]:
+    if not rows:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float64)
+    arr = np.asarray(rows, dtype=np.float64)
+    return arr[:, 0].astype(np.int64), arr[:, 1]
+
+def query_bars(symbol: str, interval: str, period: str) -> Tuple[np.ndarray, np.ndarray]:
+    """从本地存储读取 period 范围内的 (毫秒时间戳数组, 收盘价数组)"""
+    symbol = symbol.upper()
+    days = period_days(period)
+    db = SessionLocal()
+    try:
+        base = (
+            select(PriceBar.ts, PriceBar.close)
+            .where(PriceBar.symbol == symbol, PriceBar.interval == interval)
+            .order_by(PriceBar.ts)
+        )
+        if days is None:
+            return _columns(db.execute(base).all())
+
+        if is_intraday(interval) and period.endswith("d"):
+            # 分钟级的 "Nd" 与 yfinance 一致：取最近 N 个交易日，而不是最近 N*24 小时
+            last_ts = db.execute(
+                select(func.max(PriceBar.ts)).where(PriceBar.symbol == symbol, PriceBar.interval == interval)
+            ).scalar()
+            if last_ts is None:
+                return _columns([])
+            n = int(days)
+            lower = last_ts - int((n * 1.5 + 5) * DAY_MS)
+            ts, close = _columns(db.execute(base.where(PriceBar.ts >= lower)).all())
+            sessions = np.unique((ts - SESSION_OFFSET_MS) // DAY_MS)[-n:]
+            if len(sessions) == 0:
+                return ts, close
+            keep = ts >= sessions[0] * DAY_MS + SESSION_OFFSET_MS
+            return ts[keep], close[keep]
+
+        start = int((time.time() - days * 86400) * 1000)
+        return _columns(db.execute(base.where(PriceBar.ts >= start)).all())
+    finally:
+        db.close()
+
+async def query_bars_since_async(db, symbols: List[str], interval: str,
+                                 start_ms: int) -> Dict[str, Tuple[np.ndarray, np.ndarray]]:
+    """用一次查询读取多只股票 start_ms 之后的 K 线，按股票分组返回 (时间戳数组, 收盘价数组)
+
+    db 为调用方的 AsyncSession，没有数据的股票不出现在结果中。
+    """
+    if not symbols:
+        return {}
+    rows = (await db.execute(
+        select(PriceBar.symbol, PriceBar.ts, PriceBar.close)
+        .where(PriceBar.symbol.in_(symbols), PriceBar.interval == interval, PriceBar.ts >= start_ms)
+        .order_by(PriceBar.symbol, PriceBar.ts)
+    )).all()
+    grouped: Dict[str, List[Tuple[int, float]]] = {}
+    for symbol, ts, close in rows:
+        grouped.setdefault(symbol, []).append((ts, close))
+    return {symbol: _columns(points) for symbol, points in grouped.items()}
@@ -0,0 +1,81 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Optional, Tuple
+
+class TTLCache:
+    """线程安全的有界缓存：按条目 TTL 过期，超出容量时按 LRU 淘汰
+
+    过期条目不会立即删除，仍可通过 peek() 读到（用于上游失败时回退旧数据），
+    直到被新条目按 LRU 挤出，因此内存占用始终受 maxsize 限制。
+    """
+
+    def __init__(self, maxsize: int, ttl: float, name: str = "cache"):
+        if maxsize <= 0:
+            raise ValueError("maxsize must be positive")
+        self.name = name
+        self.maxsize = maxsize
+        self.ttl = ttl
+        # key -> (value, 写入时间, 过期时间)
+        self._data: "OrderedDict[Hashable, Tuple[Any, float, float]]" = OrderedDict()
+        self._lock = threading.RLock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: Hashable, record: bool = True) -> Optional[Any]:
+        """返回未过期的值，过期或不存在时返回 None；record=False 时不计入统计"""
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None or entry[2] <= time.time():
+                if record:
+                    self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            if record:
+                self.hits += 1
+            return entry[0]
+
+    def peek(self, key: Hashable) -> Optional[Tuple[Any, float]]:
+        """不论是否过期都返回 (值, 已缓存秒数)，不计入命中统计"""
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            return entry[0], time.time() - entry[1]
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None, stored_at: Optional[float] = None):
+        """stored_at 为数据实际产生的时间（默认现在），peek() 的已缓存秒数和过期时间都从它算起"""
+        written = time.time() if stored_at is None else stored_at
+        with self._lock:
+            self._data[key] = (value, written, written + (self.ttl if ttl is None else ttl))
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def pop(self, key: Hashable) -> Optional[Any]:
+        with self._lock:
+            entry = self._data.pop(key, None)
+            return entry[0] if entry else None
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "name": self.name,
+                "size": len(self._data),
+                "maxsize": self.maxsize,
+                "ttl": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_ratio": round(self.hits / total, 4) if total else None,
+            }
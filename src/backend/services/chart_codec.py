@@ -0,0 +1,48 @@
+import struct
+from typing import Any, Dict
+import numpy as np
+
+# 紧凑的图表格式，JSON 的 {"t","p"} 列表仍是默认格式
+COLUMNAR_MEDIA_TYPE = "application/vnd.stockwatch.chart.columnar+json"
+BINARY_MEDIA_TYPE = "application/vnd.stockwatch.chart.binary"
+CHART_FORMATS = ("json", "columnar", "binary")
+
+# 二进制格式（小端）：
+#   0  char[4]  magic "SWC1"
+#   4  uint32   点数 n
+#   8  float64  第一个点的毫秒时间戳 t0
+#   16 uint32[n] 相对上一个点的秒数增量（第一个为 0）
+#   .. float32[n] 收盘价
+# 偏移都按 4 字节对齐，前端可以直接用 Uint32Array / Float32Array 读取
+BINARY_MAGIC = b"SWC1"
+_HEADER = struct.Struct("<4sId")
+
+def negotiate_format(fmt: str, accept: str) -> str:
+    """query 参数优先，其次按 Accept 头选择格式"""
+    if fmt:
+        return fmt
+    accept = accept or ""
+    if BINARY_MEDIA_TYPE in accept:
+        return "binary"
+    if COLUMNAR_MEDIA_TYPE in accept:
+        return "columnar"
+    return "json"
+
+def encode_columnar(chart: Dict[str, Any]) -> Dict[str, Any]:
+    """列式 JSON：时间戳做差分编码，价格为数组"""
+    t, p = chart["t"], chart["p"]
+    return {
+        "symbol": chart["symbol"],
+        "t0": int(t[0]) if len(t) else None,
+        "dt": np.diff(t, prepend=t[:1]).tolist(),
+        "p": np.round(p, 4).tolist(),
+        "stale": chart.get("stale", False),
+        "age": chart.get("age"),
+    }
+
+def encode_binary(chart: Dict[str, Any]) -> bytes:
+    t, p = chart["t"], chart["p"]
+    n = len(t)
+    t0 = float(t[0]) if n else 0.0
+    dt = (np.diff(t, prepend=t[:1]) // 1000).astype("<u4")
+    return _HEADER.pack(BINARY_MAGIC, n, t0) + dt.tobytes() + np.asarray(p, dtype="<f4").tobytes()
@@ -0,0 +1,37 @@
+import numpy as np
+
+def lttb_indices(x: np.ndarray, y: np.ndarray, n_out: int) -> np.ndarray:
+    """Largest-Triangle-Three-Buckets 降采样，返回保留点的下标（含首尾点）
+
+    每个桶的均值用一次 reduceat 算出，逐桶循环只在桶内做向量化的三角形面积计算，
+    循环次数等于输出点数而不是输入点数。
+    """
+    n = len(x)
+    if n_out >= n or n <= 2:
+        return np.arange(n)
+    if n_out <= 2:
+        return np.array([0, n - 1])[:max(n_out, 0)]
+
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+
+    # 中间的 n-2 个点均分成 n_out-2 个桶，edges[i]:edges[i+1] 为第 i 个桶
+    edges = np.linspace(1, n - 1, n_out - 1).astype(np.int64)
+    starts, ends = edges[:-1], edges[1:]
+    counts = ends - starts
+    avg_x = np.add.reduceat(x[:n - 1], starts) / counts
+    avg_y = np.add.reduceat(y[:n - 1], starts) / counts
+    # 第 i 个桶的"下一个桶"均值；最后一个桶的下一个是末尾点
+    next_x = np.append(avg_x[1:], x[-1])
+    next_y = np.append(avg_y[1:], y[-1])
+
+    out = np.empty(n_out, dtype=np.int64)
+    out[0], out[-1] = 0, n - 1
+    a = 0
+    for i in range(n_out - 2):
+        s, e = starts[i], ends[i]
+        ax, ay = x[a], y[a]
+        area = np.abs((ax - next_x[i]) * (y[s:e] - ay) - (ax - x[s:e]) * (next_y[i] - ay))
+        a = s + int(np.argmax(area))
+        out[i + 1] = a
+    return out
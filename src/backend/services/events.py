@@ -0,0 +1,97 @@
+import asyncio
+import json
+import os
+import threading
+import logging
+from typing import Any, Dict, Iterable, Optional, Set
+
+logger = logging.getLogger(__name__)
+
+# 同时连接的订阅者上限，以及每个订阅者最多积压的事件数（超出时丢弃最旧的）
+STREAM_MAX_SUBSCRIBERS = int(os.getenv("STREAM_MAX_SUBSCRIBERS", "100"))
+STREAM_QUEUE_SIZE = int(os.getenv("STREAM_QUEUE_SIZE", "256"))
+
+class Subscription:
+    def __init__(self, loop: asyncio.AbstractEventLoop, symbols: Optional[Set[str]]):
+        self.loop = loop
+        self.symbols = symbols  # None 表示订阅全部
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=STREAM_QUEUE_SIZE)
+        self.dropped = 0
+
+    def wants(self, symbol: str) -> bool:
+        return self.symbols is None or symbol in self.symbols
+
+    def _put(self, event: Dict[str, Any]):
+        # 只在订阅者所在的事件循环线程里执行
+        if self.queue.full():
+            self.queue.get_nowait()
+            self.dropped += 1
+        self.queue.put_nowait(event)
+
+class EventBus:
+    """进程内的变更事件总线：后台线程发布，异步的 SSE 连接订阅
+
+    同一 (kind, symbol) 的内容没有变化时不发布；没有订阅者时 publish 直接返回。
+    """
+
+    def __init__(self):
+        self._subs: Set[Subscription] = set()
+        self._last: Dict[tuple, Any] = {}
+        self._lock = threading.Lock()
+
+    def subscribe(self, symbols: Optional[Iterable[str]] = None) -> Subscription:
+        """在事件循环中调用；超过 STREAM_MAX_SUBSCRIBERS 时抛出 RuntimeError"""
+        sub = Subscription(asyncio.get_running_loop(), set(symbols) if symbols else None)
+        with self._lock:
+            if len(self._subs) >= STREAM_MAX_SUBSCRIBERS:
+                raise RuntimeError("too many stream subscribers")
+            self._subs.add(sub)
+        return sub
+
+    def unsubscribe(self, sub: Subscription):
+        with self._lock:
+            self._subs.discard(sub)
+
+    @property
+    def active(self) -> bool:
+        """是否有订阅者；发布前需要额外查询数据时先检查它"""
+        return bool(self._subs)
+
+    def publish(self, kind: str, symbol: str, data: Dict[str, Any]):
+        """发布 kind（quote / signal）类型的变更，可以在任意线程调用"""
+        if not self._subs:
+            return
+        key = (kind, symbol)
+        with self._lock:
+            if self._last.get(key) == data:
+                return
+            self._last[key] = data
+            targets = [s for s in self._subs if s.wants(symbol)]
+        if not targets:
+            return
+
+        event = {"event": kind, "data": json.dumps(data, default=str, separators=(",", ":"))}
+        for sub in targets:
+            try:
+                sub.loop.call_soon_threadsafe(sub._put, event)
+            except RuntimeError:
+                # 事件循环已关闭
+                self.unsubscribe(sub)
+
+    def forget(self, symbol: str):
+        """股票移出监控列表时清除去重状态"""
+        with self._lock:
+            for key in [k for k in self._last if k[1] == symbol]:
+                del self._last[key]
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "subscribers": len(self._subs),
+                "dropped": sum(s.dropped for s in self._subs),
+            }
+
+bus = EventBus()
+
+def format_sse(event: Dict[str, Any]) -> str:
+    return f"event: {event['event']}\ndata: {event['data']}\n\n"
@@ -0,0 +1,60 @@
+import asyncio
+import contextvars
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict
+
+class ExecutorBusy(RuntimeError):
+    """等待执行的任务已满，调用方应返回 503 而不是继续排队"""
+
+class BoundedExecutor:
+    """给异步接口用的有界线程池：线程数和排队数都有上限
+
+    阻塞调用（yfinance 等）放到这里执行，不会占满事件循环的默认线程池；
+    排队数超过上限时直接抛出 ExecutorBusy。任务在调用方的 contextvars 中运行，
+    Server-Timing 的阶段耗时照常记录。
+    """
+
+    def __init__(self, name: str, workers: int, max_pending: int):
+        self.name = name
+        self.workers = max(1, workers)
+        self.max_pending = max(self.workers, max_pending)
+        self._pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix=name)
+        self._lock = threading.Lock()
+        self._pending = 0
+        self.completed = 0
+        self.rejected = 0
+
+    async def run(self, fn: Callable[..., Any], *args, **kwargs) -> Any:
+        with self._lock:
+            if self._pending >= self.max_pending:
+                self.rejected += 1
+                raise ExecutorBusy(f"{self.name} executor busy ({self._pending} pending)")
+            self._pending += 1
+        try:
+            ctx = contextvars.copy_context()
+            future = self._pool.submit(ctx.run, fn, *args, **kwargs)
+        except BaseException:
+            self._done(None)
+            raise
+        # 在线程里的任务真正结束时才释放名额：调用方被取消（客户端断开）时任务仍在运行
+        future.add_done_callback(self._done)
+        return await asyncio.wrap_future(future)
+
+    def _done(self, _future):
+        with self._lock:
+            self._pending -= 1
+            self.completed += 1
+
+    def shutdown(self):
+        self._pool.shutdown(wait=False, cancel_futures=True)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "name": self.name,
+            "workers": self.workers,
+            "max_pending": self.max_pending,
+            "pending": self._pending,
+            "completed": self.completed,
+            "rejected": self.rejected,
+        }
@@ -0,0 +1,68 @@
+import os
+from datetime import date, datetime, time, timedelta, timezone
+from typing import Optional
+from zoneinfo import ZoneInfo
+
+# 美股常规交易时段（美东时间）
+MARKET_TZ = ZoneInfo("America/New_York")
+MARKET_OPEN = time(9, 30)
+MARKET_CLOSE = time(16, 0)
+# 休市日（逗号分隔的 YYYY-MM-DD），周末自动视为休市
+MARKET_HOLIDAYS = {
+    date.fromisoformat(d.strip()) for d in os.getenv("MARKET_HOLIDAYS", "").split(",") if d.strip()
+}
+
+def _local(now: Optional[datetime]) -> datetime:
+    return (now or datetime.now(timezone.utc)).astimezone(MARKET_TZ)
+
+def is_trading_day(d: date) -> bool:
+    return d.weekday() < 5 and d not in MARKET_HOLIDAYS
+
+def is_market_open(now: Optional[datetime] = None) -> bool:
+    local = _local(now)
+    return is_trading_day(local.date()) and MARKET_OPEN <= local.time() < MARKET_CLOSE
+
+def _session_time(d: date, t: time) -> datetime:
+    return datetime.combine(d, t, tzinfo=MARKET_TZ)
+
+def last_close(now: Optional[datetime] = None) -> datetime:
+    """最近一次（不晚于 now 的）收盘时间"""
+    local = _local(now)
+    d = local.date()
+    if not (is_trading_day(d) and local.time() >= MARKET_CLOSE):
+        d -= timedelta(days=1)
+        while not is_trading_day(d):
+            d -= timedelta(days=1)
+    return _session_time(d, MARKET_CLOSE)
+
+def last_open(now: Optional[datetime] = None) -> datetime:
+    """最近一次（不晚于 now 的）开盘时间，即最近一个交易日的开始"""
+    local = _local(now)
+    d = local.date()
+    if not (is_trading_day(d) and local.time() >= MARKET_OPEN):
+        d -= timedelta(days=1)
+        while not is_trading_day(d):
+            d -= timedelta(days=1)
+    return _session_time(d, MARKET_OPEN)
+
+def next_close(now: Optional[datetime] = None) -> datetime:
+    """下一次（晚于 now 的）收盘时间"""
+    local = _local(now)
+    d = local.date()
+    if not (is_trading_day(d) and local.time() < MARKET_CLOSE):
+        d += timedelta(days=1)
+        while not is_trading_day(d):
+            d += timedelta(days=1)
+    return _session_time(d, MARKET_CLOSE)
+
+def next_open(now: Optional[datetime] = None) -> datetime:
+    """下一次开盘时间；交易时段内返回 now"""
+    local = _local(now)
+    if is_market_open(local):
+        return local
+    d = local.date()
+    if not (is_trading_day(d) and local.time() < MARKET_OPEN):
+        d += timedelta(days=1)
+        while not is_trading_day(d):
+            d += timedelta(days=1)
+    return _session_time(d, MARKET_OPEN)
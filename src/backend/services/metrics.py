@@ -0,0 +1,216 @@
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterable, List, Sequence, Tuple
+
+# Prometheus 文本格式（0.0.4），不依赖 prometheus_client
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# 默认桶（秒）：覆盖从毫秒级的缓存命中到几十秒的上游请求
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+# 整轮刷新任务的桶（秒）
+REFRESH_BUCKETS = (1.0, 5.0, 15.0, 30.0, 60.0, 120.0, 300.0, 600.0, 1800.0)
+
+LabelValues = Tuple[str, ...]
+# 采集时生成的指标：(名称, 类型, 说明, [(标签, 值)])
+Family = Tuple[str, str, str, List[Tuple[Dict[str, object], float]]]
+
+def _escape(value: object) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _format_labels(labels: Dict[str, object]) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in labels.items()) + "}"
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    if isinstance(value, float) and value.is_integer() and abs(value) < 1e15:
+        return str(int(value))
+    return repr(float(value))
+
+class _Metric:
+    kind = ""
+    suffix = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children: Dict[LabelValues, object] = {}
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def labels(self, **labels):
+        key = tuple(str(labels[n]) for n in self.labelnames)
+        child = self._children.get(key)
+        if child is None:
+            with self._lock:
+                child = self._children.setdefault(key, self._new_child())
+        return child
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def _samples(self) -> Iterable[str]:
+        raise NotImplementedError
+
+    def render(self) -> List[str]:
+        name = self.name + self.suffix
+        lines = [f"# HELP {name} {self.documentation}", f"# TYPE {name} {self.kind}"]
+        lines.extend(self._samples())
+        return lines
+
+class _CounterChild:
+    def __init__(self):
+        self.value = 0.0
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0):
+        with self._lock:
+            self.value += amount
+
+class Counter(_Metric):
+    """只增的计数器，导出时加 _total 后缀"""
+    kind = "counter"
+    suffix = "_total"
+
+    def _new_child(self):
+        return _CounterChild()
+
+    def inc(self, amount: float = 1.0):
+        self.labels().inc(amount)
+
+    def _samples(self):
+        for key, child in list(self._children.items()):
+            yield f"{self.name}_total{_format_labels(dict(zip(self.labelnames, key)))} {_format_value(child.value)}"
+
+class _HistogramChild:
+    def __init__(self, buckets: Tuple[float, ...]):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # 最后一个为 +Inf
+        self.sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float):
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[i] += 1
+            self.sum += value
+
+    @contextmanager
+    def time(self):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start)
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, documentation, labelnames)
+
+    def _new_child(self):
+        return _HistogramChild(self.buckets)
+
+    def observe(self, value: float):
+        self.labels().observe(value)
+
+    def time(self):
+        return self.labels().time()
+
+    def _samples(self):
+        for key, child in list(self._children.items()):
+            labels = dict(zip(self.labelnames, key))
+            with child._lock:
+                counts, total = list(child.counts), child.sum
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                yield f"{self.name}_bucket{_format_labels({**labels, 'le': _format_value(bound)})} {cumulative}"
+            yield f"{self.name}_sum{_format_labels(labels)} {_format_value(total)}"
+            yield f"{self.name}_count{_format_labels(labels)} {cumulative}"
+
+_registry: List[_Metric] = []
+_collectors: List[Callable[[], Iterable[Family]]] = []
+
+def register_collector(fn: Callable[[], Iterable[Family]]):
+    """注册采集时才计算的指标（缓存统计、熔断状态等已经在别处维护的数值）"""
+    _collectors.append(fn)
+    return fn
+
+def render() -> str:
+    lines: List[str] = []
+    for metric in _registry:
+        lines.extend(metric.render())
+    for collect in _collectors:
+        for name, kind, documentation, samples in collect():
+            if kind == "counter":
+                name += "_total"
+            lines.append(f"# HELP {name} {documentation}")
+            lines.append(f"# TYPE {name} {kind}")
+            lines.extend(f"{name}{_format_labels(labels)} {_format_value(float(value))}"
+                         for labels, value in samples)
+    return "\n".join(lines) + "\n"
+
+# ---- 各模块共用的指标 ----
+UPSTREAM_LATENCY = Histogram(
+    "upstream_request_seconds", "Upstream HTTP request latency per attempt", ["host", "status"],
+)
+UPSTREAM_RETRIES = Counter("upstream_retries", "Upstream HTTP retries", ["host"])
+RATELIMIT_WAIT = Histogram(
+    "ratelimit_wait_seconds", "Time spent waiting for a rate limiter", ["limiter"],
+    buckets=(0.001, 0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.0, 5.0, 10.0, 30.0),
+)
+AB_FETCH = Histogram("ab_fetch_seconds", "fetch_ab_for_symbol latency", ["result"])
+YFINANCE_CALL = Histogram("yfinance_call_seconds", "yfinance call latency", ["call"])
+REFRESH_DURATION = Histogram(
+    "refresh_duration_seconds", "Duration of a background refresh pass", ["job"], buckets=REFRESH_BUCKETS,
+)
+REFRESH_SYMBOLS = Counter("refresh_symbols", "Symbols processed by background refreshes", ["job", "result"])
+AB_SIGNALS_CHANGED = Counter("ab_signals_changed", "AB signals whose content changed on refresh")
+HTTP_LATENCY = Histogram(
+    "http_request_duration_seconds", "API request latency by route", ["method", "route", "status"],
+)
+
+class MetricsMiddleware:
+    """按路由模板记录请求耗时（ASGI 中间件，不缓冲响应体）
+
+    SSE 这类长连接的耗时是连接时长，不计入。
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        start = time.perf_counter()
+        info = {"status": 500, "stream": False}
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                info["status"] = message["status"]
+                for name, value in message.get("headers", []):
+                    if name == b"content-type" and value.startswith(b"text/event-stream"):
+                        info["stream"] = True
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            if not info["stream"]:
+                route = scope.get("route")
+                HTTP_LATENCY.labels(
+                    method=scope["method"],
+                    route=getattr(route, "path", None) or "static",
+                    status=info["status"],
+                ).observe(time.perf_counter() - start)
@@ -0,0 +1,97 @@
+import os
+import asyncio
+import signal
+import logging
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Callable, Dict, Optional
+from .timing import span
+
+logger = logging.getLogger(__name__)
+
+# 解析 HTML 的进程数：0 表示在调用线程里直接解析（单核机器默认如此）
+AB_PARSE_WORKERS = int(os.getenv("AB_PARSE_WORKERS", str(max(0, min(4, (os.cpu_count() or 1) - 1)))))
+# 单个页面解析的最长等待时间（秒）
+AB_PARSE_TIMEOUT_SEC = float(os.getenv("AB_PARSE_TIMEOUT_SEC", "30"))
+
+_pool: Optional[ProcessPoolExecutor] = None
+_lock = threading.Lock()
+_stats = {"pooled": 0, "inline": 0, "broken": 0}
+
+def _init_worker():
+    # Ctrl+C 由主进程处理，解析进程随主进程的 shutdown 退出
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+def _get_pool() -> Optional[ProcessPoolExecutor]:
+    global _pool
+    if AB_PARSE_WORKERS <= 0:
+        return None
+    with _lock:
+        if _pool is None:
+            # 主进程里有调度器和请求线程，fork 可能复制到被持有的锁，用 spawn 启动干净的进程
+            _pool = ProcessPoolExecutor(
+                max_workers=AB_PARSE_WORKERS,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_init_worker,
+            )
+            logger.info(f"Started HTML parse pool with {AB_PARSE_WORKERS} workers")
+        return _pool
+
+def _discard(pool: ProcessPoolExecutor):
+    global _pool
+    with _lock:
+        if _pool is pool:
+            _pool = None
+    pool.shutdown(wait=False, cancel_futures=True)
+
+def run(fn: Callable[..., Any], *args, **kwargs) -> Any:
+    """在解析进程池中执行 fn（必须是模块级函数，参数和返回值可以 pickle）
+
+    未启用进程池或进程池崩溃时在当前线程执行；崩溃的进程池会在下次调用时重建。
+    """
+    with span("parse"):
+        return _run(fn, *args, **kwargs)
+
+def _run(fn: Callable[..., Any], *args, **kwargs) -> Any:
+    pool = _get_pool()
+    if pool is not None:
+        try:
+            future = pool.submit(fn, *args, **kwargs)
+            result = future.result(timeout=AB_PARSE_TIMEOUT_SEC)
+            _stats["pooled"] += 1
+            return result
+        except BrokenProcessPool as e:
+            logger.error(f"Parse pool broken, parsing inline: {e}")
+            _stats["broken"] += 1
+            _discard(pool)
+    _stats["inline"] += 1
+    return fn(*args, **kwargs)
+
+async def run_async(fn: Callable[..., Any], *args, **kwargs) -> Any:
+    """run 的协程版本：等待解析结果时不占用线程，未启用进程池时在默认线程池中解析"""
+    with span("parse"):
+        pool = _get_pool()
+        if pool is not None:
+            try:
+                future = pool.submit(fn, *args, **kwargs)
+                result = await asyncio.wait_for(asyncio.wrap_future(future), AB_PARSE_TIMEOUT_SEC)
+                _stats["pooled"] += 1
+                return result
+            except BrokenProcessPool as e:
+                logger.error(f"Parse pool broken, parsing inline: {e}")
+                _stats["broken"] += 1
+                _discard(pool)
+        _stats["inline"] += 1
+        return await asyncio.to_thread(fn, *args, **kwargs)
+
+def shutdown():
+    global _pool
+    with _lock:
+        pool, _pool = _pool, None
+    if pool is not None:
+        pool.shutdown(wait=False, cancel_futures=True)
+
+def stats() -> Dict[str, Any]:
+    return {"workers": AB_PARSE_WORKERS, "started": _pool is not None, **_stats}
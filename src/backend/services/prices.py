@@ -1,24 +1,169 @@
+import os
 import yfinance as yf
+import numpy as np
+import pandas as pd
 import requests
 import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timezone, timedelta
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, List
 import logging
+from sqlalchemy import select
+from ..db import SessionLocal
+from ..models import StockQuoteCache
+from . import upstream
+from .cache import TTLCache
+from .signals import ab_cache_stats
+from .singleflight import SingleFlight
+from .executor import BoundedExecutor
+from .bars import sync_bars, query_bars
+from .downsample import lttb_indices
+from .events import bus
+from .metrics import RATELIMIT_WAIT, YFINANCE_CALL
+from .timing import record, span
 
 logger = logging.getLogger(__name__)
 
-# 缓存和限流控制
-_last_request_time = {}
-_request_cache = {}
 MIN_REQUEST_INTERVAL = 5  # 增加到5秒间隔
+QUOTE_BATCH_SIZE = int(os.getenv("QUOTE_BATCH_SIZE", "100"))  # 每次批量下载的股票数
+
+# 缓存配置：报价30分钟；图表数据来自本地 K 线存储，增量同步成本低，缓存5分钟即可
+QUOTE_CACHE_TTL = float(os.getenv("QUOTE_CACHE_TTL_SEC", "1800"))
+CHART_CACHE_TTL = float(os.getenv("CHART_CACHE_TTL_SEC", "300"))
+QUOTE_CACHE_SIZE = int(os.getenv("QUOTE_CACHE_SIZE", "2000"))
+CHART_CACHE_SIZE = int(os.getenv("CHART_CACHE_SIZE", "500"))
+
+# 过期数据的服务模式：先返回旧数据（标记 stale 和 age），后台再刷新
+SERVE_STALE = os.getenv("SERVE_STALE", "true").lower() in ("1", "true", "yes")
+STALE_MAX_AGE = float(os.getenv("STALE_MAX_AGE_SEC", "86400"))  # 超过该时长的旧数据不再直接返回
+REVALIDATE_WORKERS = int(os.getenv("REVALIDATE_WORKERS", "2"))
+REVALIDATE_QUEUE_MAX = int(os.getenv("REVALIDATE_QUEUE_MAX", "200"))
+# 异步接口调用 yfinance 的线程池：线程数和最多排队的调用数，排满时接口返回 503
+YF_EXECUTOR_WORKERS = int(os.getenv("YF_EXECUTOR_WORKERS", "8"))
+YF_EXECUTOR_QUEUE_MAX = int(os.getenv("YF_EXECUTOR_QUEUE_MAX", "64"))
+# StockQuoteCache 表中的报价在该时长内视为新鲜
+QUOTE_DB_FRESHNESS = float(os.getenv("QUOTE_DB_FRESHNESS_SEC", "1800"))
+
+# 缓存和限流控制
+_quote_cache = TTLCache(QUOTE_CACHE_SIZE, QUOTE_CACHE_TTL, name="quote")
+_chart_cache = TTLCache(CHART_CACHE_SIZE, CHART_CACHE_TTL, name="chart")
+# symbol -> 下一次允许请求的时间，条目在间隔结束后自动过期
+_last_request_time = TTLCache(QUOTE_CACHE_SIZE, MIN_REQUEST_INTERVAL, name="rate_limit")
+_rate_lock = threading.Lock()
+# 合并同一股票、同一类型的并发上游请求
+_flight = SingleFlight()
+
+# 异步接口里所有可能访问 yfinance 的调用都在这里执行，缓存命中时不经过线程池
+yf_executor = BoundedExecutor("yfinance", YF_EXECUTOR_WORKERS, YF_EXECUTOR_QUEUE_MAX)
+
+# 后台刷新：有界线程池 + 有界待办集合，队列满时直接丢弃刷新任务
+_revalidator = ThreadPoolExecutor(max_workers=max(1, REVALIDATE_WORKERS), thread_name_prefix="revalidate")
+_revalidate_pending = set()
+_revalidate_lock = threading.Lock()
+
+def _revalidate(key, fn, *args):
+    """提交后台刷新任务，同一 key 同时只排队一次"""
+    with _revalidate_lock:
+        if key in _revalidate_pending or len(_revalidate_pending) >= REVALIDATE_QUEUE_MAX:
+            return
+        _revalidate_pending.add(key)
+    
+    def run():
+        try:
+            _flight.do(key, fn, *args)
+        except Exception as e:
+            logger.warning(f"Background refresh failed for {key}: {e}")
+        finally:
+            with _revalidate_lock:
+                _revalidate_pending.discard(key)
+    
+    try:
+        _revalidator.submit(run)
+    except RuntimeError:
+        # 线程池已关闭
+        with _revalidate_lock:
+            _revalidate_pending.discard(key)
+
+def _serve_stale(cache: TTLCache, cache_key, flight_key, fn, *args) -> Optional[Dict[str, Any]]:
+    """有可用的旧数据时立即返回并触发后台刷新，否则返回 None"""
+    stale = cache.peek(cache_key)
+    if not stale or stale[1] > STALE_MAX_AGE:
+        return None
+    _revalidate(flight_key, fn, *args)
+    return {**stale[0], "stale": True, "age": round(stale[1], 1)}
+
+def _row_age(updated_at: Optional[datetime]) -> float:
+    if updated_at is None:
+        return float("inf")
+    # SQLite 的 CURRENT_TIMESTAMP 为不带时区的 UTC 时间
+    if updated_at.tzinfo is None:
+        updated_at = updated_at.replace(tzinfo=timezone.utc)
+    return max(0.0, (datetime.now(timezone.utc) - updated_at).total_seconds())
+
+def _seed_quote(row: StockQuoteCache) -> bool:
+    """把持久化的报价放入内存缓存，写入时间记为 updated_at，超过 STALE_MAX_AGE 的不放入"""
+    age = _row_age(row.updated_at)
+    if row.price is None or age > STALE_MAX_AGE:
+        return False
+    data = {
+        "symbol": row.symbol, "price": row.price, "change": row.change_pct,
+        "currency": row.currency, "volume": row.volume,
+    }
+    _quote_cache.set(row.symbol, data, ttl=QUOTE_DB_FRESHNESS, stored_at=time.time() - age)
+    return True
+
+def _load_persisted_quotes(symbols: List[str]) -> int:
+    """内存中完全没有的报价，一次查询从 StockQuoteCache 表读取"""
+    missing = [sym for sym in symbols if _quote_cache.peek(sym) is None]
+    if not missing:
+        return 0
+    db = SessionLocal()
+    try:
+        rows = db.execute(select(StockQuoteCache).where(StockQuoteCache.symbol.in_(missing))).scalars().all()
+        return sum(1 for row in rows if _seed_quote(row))
+    except Exception as e:
+        logger.warning(f"Failed to read persisted quotes for {len(missing)} symbols: {e}")
+        return 0
+    finally:
+        db.close()
+
+def _cache_quote(symbol: str, quote: Dict[str, Any]):
+    """写入报价缓存并向实时流发布（内容没变时事件总线不会推送）"""
+    _quote_cache.set(symbol, quote)
+    if quote.get("price") is not None:
+        bus.publish("quote", symbol, quote)
+
+def warm_quote_cache() -> int:
+    """启动时从 StockQuoteCache 表预热内存缓存，避免重启后集中请求上游"""
+    db = SessionLocal()
+    try:
+        rows = db.execute(select(StockQuoteCache)).scalars().all()
+        count = sum(1 for row in rows if _seed_quote(row))
+        logger.info(f"Warmed quote cache with {count} symbols")
+        return count
+    finally:
+        db.close()
+
+def shutdown_background():
+    _revalidator.shutdown(wait=False, cancel_futures=True)
+    yf_executor.shutdown()
 
 def _wait_for_rate_limit(symbol: str):
     """确保请求间隔，避免频率限制"""
-    now = time.time()
-    last_time = _last_request_time.get(symbol, 0)
-    if now - last_time < MIN_REQUEST_INTERVAL:
-        time.sleep(MIN_REQUEST_INTERVAL - (now - last_time))
-    _last_request_time[symbol] = time.time()
+    with _rate_lock:
+        now = time.time()
+        last_time = _last_request_time.get(symbol) or 0
+        slot = max(now, last_time + MIN_REQUEST_INTERVAL)
+        _last_request_time.set(symbol, slot, ttl=slot - now + MIN_REQUEST_INTERVAL)
+    RATELIMIT_WAIT.labels(limiter="yahoo_symbol").observe(slot - now)
+    record("ratelimit", max(0.0, slot - now))
+    if slot > now:
+        time.sleep(slot - now)
+
+def cache_stats() -> List[Dict[str, Any]]:
+    """报价和图表缓存的命中/淘汰统计"""
+    return [_quote_cache.stats(), _chart_cache.stats(), ab_cache_stats()]
 
 def validate_symbol(symbol: str) -> bool:
     """使用AmericanBulls验证股票代码"""
@@ -30,37 +175,77 @@ def validate_symbol(symbol: str) -> bool:
         logger.warning(f"Symbol validation failed for {symbol}: {e}")
         return False
 
-def get_symbol_info(symbol: str) -> Dict[str, Any]:
-    """获取股票代码信息（包含公司名称）"""
+def get_symbol_info(symbol: str, with_signals: bool = False) -> Dict[str, Any]:
+    """获取股票代码信息（包含公司名称），with_signals 时附带同一页面解析出的 AB 信号"""
     try:
         from .americanbulls import validate_symbol_and_get_name
-        return validate_symbol_and_get_name(symbol)
+        return validate_symbol_and_get_name(symbol, with_signals=with_signals)
     except Exception as e:
         logger.error(f"Failed to get symbol info for {symbol}: {e}")
-        return {"valid": False, "symbol": symbol, "name": None}
+        return {"valid": False, "symbol": symbol, "name": None, "error": str(e)}
 
-def get_quote(symbol: str) -> Dict[str, Any]:
+async def get_symbol_info_async(symbol: str, with_signals: bool = False) -> Dict[str, Any]:
+    """get_symbol_info 的协程版本"""
+    try:
+        from .americanbulls import validate_symbol_and_get_name_async
+        return await validate_symbol_and_get_name_async(symbol, with_signals=with_signals)
+    except Exception as e:
+        logger.error(f"Failed to get symbol info for {symbol}: {e}")
+        return {"valid": False, "symbol": symbol, "name": None, "error": str(e)}
+
+def get_quote(symbol: str, allow_stale: Optional[bool] = None) -> Dict[str, Any]:
     """获取股票报价，带缓存和错误处理"""
     symbol = symbol.upper()
     
-    # 检查缓存（30分钟有效期，大幅延长避免频率限制）
-    cache_key = f"quote_{symbol}"
-    cached = _request_cache.get(cache_key)
-    if cached and (time.time() - cached['timestamp']) < 1800:  # 30分钟缓存
+    cached = _quote_cache.get(symbol)
+    if cached is not None:
         logger.info(f"Using cached quote for {symbol}")
-        return cached['data']
+        return cached
+    return _load_quote(symbol, allow_stale)
+
+async def get_quote_async(symbol: str, allow_stale: Optional[bool] = None) -> Dict[str, Any]:
+    """get_quote 的协程版本：内存缓存命中时直接返回，否则在 yfinance 线程池中读库或请求上游"""
+    symbol = symbol.upper()
+    cached = _quote_cache.get(symbol)
+    if cached is not None:
+        return cached
+    return await yf_executor.run(_load_quote, symbol, allow_stale)
+
+def _load_quote(symbol: str, allow_stale: Optional[bool]) -> Dict[str, Any]:
+    # 内存里没有时读取调度器持久化的报价
+    if _load_persisted_quotes([symbol]):
+        cached = _quote_cache.get(symbol, record=False)
+        if cached is not None:
+            logger.info(f"Using persisted quote for {symbol}")
+            return cached
+    
+    if SERVE_STALE if allow_stale is None else allow_stale:
+        stale = _serve_stale(_quote_cache, symbol, ("quote", symbol), _fetch_quote, symbol)
+        if stale is not None:
+            return stale
+    
+    return _flight.do(("quote", symbol), _fetch_quote, symbol)
+
+def _fetch_quote(symbol: str) -> Dict[str, Any]:
+    """从上游获取单个报价并写入缓存"""
+    # 可能刚有另一个请求完成了同样的抓取
+    cached = _quote_cache.get(symbol, record=False)
+    if cached is not None:
+        return cached
     
     try:
         _wait_for_rate_limit(symbol)
-        t = yf.Ticker(symbol)
+        t = yf.Ticker(symbol, session=upstream.session)
         
         # 优先使用 fast_info，失败则使用历史数据
         result = {"symbol": symbol, "price": None, "change": None, "currency": None, "volume": None}
         
         try:
-            info = t.fast_info
-            if info.last_price is not None:
-                result["price"] = round(float(info.last_price), 2)
+            with span("yfinance"), YFINANCE_CALL.labels(call="fast_info").time():
+                info = t.fast_info
+                last_price = info.last_price
+            if last_price is not None:
+                result["price"] = round(float(last_price), 2)
                 result["currency"] = getattr(info, "currency", "USD")
         except:
             pass
@@ -69,7 +254,8 @@ def get_quote(symbol: str) -> Dict[str, Any]:
         if result["price"] is None:
             try:
                 # 使用更宽松的时间范围
-                hist = t.history(period="2d", interval="1d")  # 改为日线数据
+                with span("yfinance"), YFINANCE_CALL.labels(call="history").time():
+                    hist = t.history(period="2d", interval="1d")  # 改为日线数据
                 if not hist.empty:
                     latest = hist.iloc[-1]
                     result["price"] = round(float(latest["Close"]), 2)
@@ -85,62 +271,201 @@ def get_quote(symbol: str) -> Dict[str, Any]:
                 logger.warning(f"Failed to get history for {symbol}: {e}")
         
         # 缓存结果
-        _request_cache[cache_key] = {
-            'data': result,
-            'timestamp': time.time()
-        }
+        _cache_quote(symbol, result)
         
         return result
         
     except Exception as e:
         logger.error(f"Failed to get quote for {symbol}: {e}")
-        # 返回缓存的数据（如果有）
-        if cached:
-            return cached['data']
+        # 返回缓存的数据（如果有，即使已过期）
+        stale = _quote_cache.peek(symbol)
+        if stale:
+            return stale[0]
         return {"symbol": symbol, "price": None, "change": None, "currency": None, "volume": None}
 
-def get_intraday_points(symbol: str, period="1d", interval="5m") -> Dict[str, Any]:
+def _quote_from_history(symbol: str, hist) -> Dict[str, Any]:
+    """根据日线数据计算最新价、涨跌幅和成交量"""
+    result = {"symbol": symbol, "price": None, "change": None, "currency": None, "volume": None}
+    if hist is None or hist.empty or "Close" not in hist:
+        return result
+    
+    hist = hist.dropna(subset=["Close"])
+    if hist.empty:
+        return result
+    
+    latest = hist.iloc[-1]
+    result["price"] = round(float(latest["Close"]), 2)
+    if len(hist) >= 2:
+        prev_close = float(hist.iloc[-2]["Close"])
+        if prev_close > 0:
+            result["change"] = round((result["price"] / prev_close - 1) * 100, 2)
+    volume = latest.get("Volume")
+    result["volume"] = int(volume) if volume is not None and not pd.isna(volume) and volume > 0 else None
+    return result
+
+def _split_cached_quotes(wanted: List[str]):
+    results: Dict[str, Dict[str, Any]] = {}
+    missing = []
+    for sym in wanted:
+        cached = _quote_cache.get(sym)
+        if cached is not None:
+            results[sym] = cached
+        else:
+            missing.append(sym)
+    return results, missing
+
+def get_quotes(symbols: List[str], force: bool = False) -> Dict[str, Dict[str, Any]]:
+    """批量获取报价：缓存未命中的股票按批次一次性从上游下载"""
+    wanted = list(dict.fromkeys(s.upper().strip() for s in symbols if s and s.strip()))
+    if force:
+        results: Dict[str, Dict[str, Any]] = {}
+        _download_quotes(wanted, results)
+        return results
+    results, missing = _split_cached_quotes(wanted)
+    results.update(_load_quotes(missing))
+    return results
+
+async def get_quotes_async(symbols: List[str]) -> Dict[str, Dict[str, Any]]:
+    """get_quotes 的协程版本：全部命中内存缓存时不经过线程池"""
+    wanted = list(dict.fromkeys(s.upper().strip() for s in symbols if s and s.strip()))
+    results, missing = _split_cached_quotes(wanted)
+    if missing:
+        results.update(await yf_executor.run(_load_quotes, missing))
+    return results
+
+def _load_quotes(missing: List[str]) -> Dict[str, Dict[str, Any]]:
+    """内存缓存未命中的报价：先读持久化的报价，剩下的从上游下载"""
+    results: Dict[str, Dict[str, Any]] = {}
+    _load_persisted_quotes(missing)
+    remaining = []
+    for sym in missing:
+        cached = _quote_cache.get(sym, record=False)
+        if cached is not None:
+            results[sym] = cached
+        else:
+            remaining.append(sym)
+    _download_quotes(remaining, results)
+    return results
+
+def _download_quotes(missing: List[str], results: Dict[str, Dict[str, Any]]):
+    for i in range(0, len(missing), QUOTE_BATCH_SIZE):
+        chunk = missing[i:i + QUOTE_BATCH_SIZE]
+        try:
+            _wait_for_rate_limit("__batch__")
+            with span("yfinance"), YFINANCE_CALL.labels(call="download").time():
+                hist = yf.download(
+                    chunk, period="5d", interval="1d", group_by="ticker",
+                    threads=True, progress=False, session=upstream.session
+                )
+        except Exception as e:
+            logger.error(f"Batch quote download failed for {len(chunk)} symbols: {e}")
+            hist = None
+        
+        for sym in chunk:
+            frame = None
+            if hist is not None and not hist.empty:
+                if isinstance(hist.columns, pd.MultiIndex):
+                    if sym in hist.columns.get_level_values(0):
+                        frame = hist[sym]
+                else:
+                    frame = hist
+            
+            quote = _quote_from_history(sym, frame)
+            stale = _quote_cache.peek(sym)
+            if quote["price"] is None:
+                # 下载失败时退回旧缓存
+                results[sym] = stale[0] if stale else quote
+                continue
+            
+            if stale and stale[0].get("currency"):
+                quote["currency"] = stale[0]["currency"]
+            _cache_quote(sym, quote)
+            results[sym] = quote
+        
+        logger.info(f"Batch fetched quotes for {len(chunk)} symbols")
+
+def peek_cached_quote(symbol: str) -> Optional[Dict[str, Any]]:
+    """只读内存缓存中的报价（不论是否过期），不访问上游"""
+    cached = _quote_cache.peek(symbol.upper())
+    return cached[0] if cached else None
+
+def peek_cached_chart(symbol: str, period: str, interval: str) -> Optional[Dict[str, Any]]:
+    """只读内存缓存中的图表数据（不论是否过期），不访问上游"""
+    cached = _chart_cache.peek((symbol.upper(), period, interval))
+    return cached[0] if cached else None
+
+def downsample_chart(chart: Dict[str, Any], max_points: Optional[int] = None) -> Dict[str, Any]:
+    """对列数组形式的图表数据做 LTTB 降采样，不修改缓存中的原数组"""
+    t, p = chart["t"], chart["p"]
+    if not max_points or len(t) <= max_points:
+        return chart
+    keep = lttb_indices(t, p, max_points)
+    return {**chart, "t": t[keep], "p": p[keep]}
+
+def chart_to_points(chart: Dict[str, Any], max_points: Optional[int] = None) -> Dict[str, Any]:
+    """把缓存的列数组转成 ChartOut 的 points，可选 LTTB 降采样"""
+    chart = downsample_chart(chart, max_points)
+    result = {k: v for k, v in chart.items() if k not in ("t", "p")}
+    result["points"] = [{"t": ts, "p": price} for ts, price in zip(chart["t"].tolist(), np.round(chart["p"], 4).tolist())]
+    return result
+
+def get_intraday_points(symbol: str, period="1d", interval="5m", allow_stale: Optional[bool] = None,
+                        max_points: Optional[int] = None) -> Dict[str, Any]:
     """获取图表数据，使用更宽松的间隔"""
+    return chart_to_points(get_chart_arrays(symbol, period, interval, allow_stale), max_points)
+
+def get_chart_arrays(symbol: str, period="1d", interval="5m", allow_stale: Optional[bool] = None) -> Dict[str, Any]:
+    """获取图表数据的列数组形式：{"symbol", "t": int64 毫秒时间戳, "p": float64 收盘价}"""
     symbol = symbol.upper()
     
-    # 检查缓存（2小时有效期，大幅延长避免频率限制）
-    cache_key = f"chart_{symbol}_{period}_{interval}"
-    cached = _request_cache.get(cache_key)
-    if cached and (time.time() - cached['timestamp']) < 7200:  # 2小时缓存
+    cached = _chart_cache.get((symbol, period, interval))
+    if cached is not None:
         logger.info(f"Using cached chart for {symbol}")
-        return cached['data']
+        return cached
+    return _load_chart(symbol, period, interval, allow_stale)
+
+async def get_chart_arrays_async(symbol: str, period="1d", interval="5m",
+                                 allow_stale: Optional[bool] = None) -> Dict[str, Any]:
+    """get_chart_arrays 的协程版本：缓存命中时直接返回，否则在 yfinance 线程池中同步 K 线"""
+    symbol = symbol.upper()
+    cached = _chart_cache.get((symbol, period, interval))
+    if cached is not None:
+        return cached
+    return await yf_executor.run(_load_chart, symbol, period, interval, allow_stale)
+
+def _load_chart(symbol: str, period: str, interval: str, allow_stale: Optional[bool]) -> Dict[str, Any]:
+    cache_key = (symbol, period, interval)
+    flight_key = ("chart", symbol, period, interval)
+    if SERVE_STALE if allow_stale is None else allow_stale:
+        stale = _serve_stale(_chart_cache, cache_key, flight_key, _fetch_chart, symbol, period, interval)
+        if stale is not None:
+            return stale
+    
+    return _flight.do(flight_key, _fetch_chart, symbol, period, interval)
+
+def _fetch_chart(symbol: str, period: str, interval: str) -> Dict[str, Any]:
+    """从上游获取图表数据并写入缓存"""
+    cache_key = (symbol, period, interval)
+    cached = _chart_cache.get(cache_key, record=False)
+    if cached is not None:
+        return cached
     
     try:
-        _wait_for_rate_limit(symbol)
-        t = yf.Ticker(symbol)
-        
-        # 使用更保守的参数避免频率限制
-        hist = t.history(period=period, interval=interval)
-        pts = []
-        
-        if not hist.empty:
-            for ts, row in hist.iterrows():
-                try:
-                    # 转毫秒时间戳
-                    t_ms = int(ts.timestamp() * 1000)
-                    price = round(float(row["Close"]), 4)
-                    pts.append({"t": t_ms, "p": price})
-                except:
-                    continue
+        # 增量同步到本地 K 线存储，再从本地按 period 读取
+        sync_bars(symbol, interval, period, throttle=_wait_for_rate_limit)
+        t, p = query_bars(symbol, interval, period)
         
-        result = {"symbol": symbol, "points": pts}
+        result = {"symbol": symbol, "t": t, "p": p}
         
         # 缓存结果
-        _request_cache[cache_key] = {
-            'data': result,
-            'timestamp': time.time()
-        }
+        _chart_cache.set(cache_key, result)
         
         return result
         
     except Exception as e:
         logger.error(f"Failed to get chart data for {symbol}: {e}")
         # 返回缓存的数据或空数据
-        if cached:
-            return cached['data']
-        return {"symbol": symbol, "points": []}
+        stale = _chart_cache.peek(cache_key)
+        if stale:
+            return stale[0]
+        return {"symbol": symbol, "t": np.empty(0, dtype=np.int64), "p": np.empty(0, dtype=np.float64)}
@@ -0,0 +1,117 @@
+import os
+import sys
+import time
+import logging
+import threading
+from collections import Counter
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+# 采样结果（folded stacks，可直接交给 flamegraph.pl / speedscope）的保存目录
+PROFILE_DIR = Path(os.getenv("PROFILE_DIR", "./profiles"))
+# 单次采样的最长时间（秒）和最小采样间隔（毫秒）
+PROFILE_MAX_SECONDS = float(os.getenv("PROFILE_MAX_SECONDS", "300"))
+PROFILE_MIN_INTERVAL_MS = float(os.getenv("PROFILE_MIN_INTERVAL_MS", "1"))
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})"
+
+class SamplingProfiler:
+    """定时读取所有线程的调用栈（sys._current_frames），按 folded 格式累计
+
+    每行为 "线程名;最外层函数;...;最内层函数 次数"。采样在独立的守护线程中进行，
+    只在开启期间有开销。
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._data_lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        self._stacks: Counter = Counter()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self.seconds = 0.0
+        self.interval = 0.0
+        self.samples = 0
+        self.path: Optional[Path] = None
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self, seconds: float, interval_ms: float) -> Dict[str, Any]:
+        """开始采样；已在运行时抛出 RuntimeError"""
+        with self._lock:
+            if self.running:
+                raise RuntimeError("profiler already running")
+            self.seconds = min(max(seconds, 0.1), PROFILE_MAX_SECONDS)
+            self.interval = max(interval_ms, PROFILE_MIN_INTERVAL_MS) / 1000
+            self._stacks = Counter()
+            self._stop.clear()
+            self.samples = 0
+            self.started_at, self.finished_at, self.path = time.time(), None, None
+            self._thread = threading.Thread(target=self._run, name="profiler", daemon=True)
+            self._thread.start()
+        logger.info(f"Sampling profiler started for {self.seconds}s every {self.interval * 1000:.1f}ms")
+        return self.status()
+
+    def stop(self):
+        self._stop.set()
+        thread = self._thread
+        if thread is not None:
+            thread.join()
+
+    def _run(self):
+        me = threading.get_ident()
+        deadline = time.monotonic() + self.seconds
+        while not self._stop.is_set() and time.monotonic() < deadline:
+            names = {t.ident: t.name for t in threading.enumerate()}
+            sampled = []
+            for ident, frame in sys._current_frames().items():
+                if ident == me:
+                    continue
+                stack = []
+                while frame is not None:
+                    stack.append(_frame_label(frame))
+                    frame = frame.f_back
+                stack.append(names.get(ident, f"thread-{ident}"))
+                sampled.append(";".join(reversed(stack)))
+            with self._data_lock:
+                self._stacks.update(sampled)
+                self.samples += 1
+            self._stop.wait(self.interval)
+        self.finished_at = time.time()
+        self._save()
+
+    def _save(self):
+        try:
+            PROFILE_DIR.mkdir(parents=True, exist_ok=True)
+            path = PROFILE_DIR / time.strftime("profile-%Y%m%d-%H%M%S.folded", time.localtime(self.started_at))
+            path.write_text(self.folded(), encoding="utf-8")
+            self.path = path
+            logger.info(f"Sampling profiler wrote {self.samples} samples to {path}")
+        except OSError as e:
+            logger.error(f"Failed to save profile: {e}")
+
+    def folded(self) -> str:
+        with self._data_lock:
+            stacks = self._stacks.most_common()
+        return "".join(f"{stack} {count}\n" for stack, count in stacks)
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            "running": self.running,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "seconds": self.seconds,
+            "interval_ms": round(self.interval * 1000, 3),
+            "samples": self.samples,
+            "stacks": len(self._stacks),
+            "path": str(self.path) if self.path else None,
+        }
+
+profiler = SamplingProfiler()
@@ -0,0 +1,81 @@
+import os
+import asyncio
+import threading
+import time
+from typing import Dict
+from urllib.parse import urlparse
+
+AB_HOST = "www.americanbulls.com"
+
+# 各上游站点的令牌桶配置：(每秒请求数, 突发容量)
+HOST_LIMITS = {
+    AB_HOST: (
+        float(os.getenv("AB_RATE_PER_SEC", "1.0")),
+        float(os.getenv("AB_RATE_BURST", "2")),
+    ),
+}
+DEFAULT_RATE_PER_SEC = float(os.getenv("UPSTREAM_RATE_PER_SEC", "5.0"))
+DEFAULT_BURST = float(os.getenv("UPSTREAM_RATE_BURST", "5"))
+
+class TokenBucket:
+    """线程安全的令牌桶限流器"""
+
+    def __init__(self, rate: float, capacity: float):
+        if rate <= 0:
+            raise ValueError("rate must be positive")
+        self.rate = rate
+        self.capacity = max(capacity, 1.0)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now: float):
+        elapsed = now - self._updated
+        if elapsed > 0:
+            self._tokens = min(self.capacity, self._tokens + elapsed * self.rate)
+            self._updated = now
+
+    def _take(self, tokens: float) -> float:
+        """拿到令牌时返回 0，否则返回还需等待的秒数"""
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            if self._tokens >= tokens:
+                self._tokens -= tokens
+                return 0.0
+            return (tokens - self._tokens) / self.rate
+
+    def acquire(self, tokens: float = 1.0) -> float:
+        """阻塞直到拿到令牌，返回实际等待的秒数"""
+        waited = 0.0
+        while True:
+            delay = self._take(tokens)
+            if not delay:
+                return waited
+            time.sleep(delay)
+            waited += delay
+
+    async def acquire_async(self, tokens: float = 1.0) -> float:
+        """acquire 的协程版本，等待期间不占用线程"""
+        waited = 0.0
+        while True:
+            delay = self._take(tokens)
+            if not delay:
+                return waited
+            await asyncio.sleep(delay)
+            waited += delay
+
+_limiters: Dict[str, TokenBucket] = {}
+_limiters_lock = threading.Lock()
+
+def host_limiter(url_or_host: str) -> TokenBucket:
+    """按主机名返回共享的限流器"""
+    host = urlparse(url_or_host).hostname if "://" in url_or_host else url_or_host
+    host = (host or url_or_host).lower()
+    with _limiters_lock:
+        limiter = _limiters.get(host)
+        if limiter is None:
+            rate, burst = HOST_LIMITS.get(host, (DEFAULT_RATE_PER_SEC, DEFAULT_BURST))
+            limiter = TokenBucket(rate, burst)
+            _limiters[host] = limiter
+        return limiter
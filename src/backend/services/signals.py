@@ -0,0 +1,244 @@
+import os
+import logging
+from datetime import date, datetime, timezone
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+from sqlalchemy import select, update, bindparam, func
+from ..db import SessionLocal, AsyncSessionLocal, bulk_upsert
+from ..models import ABSignalCache, ABSignalEvent
+from .cache import TTLCache
+
+logger = logging.getLogger(__name__)
+
+# AB 信号的内存缓存：调度器写库后会主动失效，TTL 只是兜底
+AB_CACHE_TTL = float(os.getenv("AB_CACHE_TTL_SEC", "600"))
+AB_CACHE_SIZE = int(os.getenv("AB_CACHE_SIZE", "2000"))
+
+_ab_cache = TTLCache(AB_CACHE_SIZE, AB_CACHE_TTL, name="ab")
+
+def signal_to_dict(obj: ABSignalCache) -> Dict[str, Any]:
+    return {
+        "symbol": obj.symbol,
+        "suggestion": obj.suggestion,
+        "signal_history": obj.signal_history or [],
+        "summary": obj.summary,
+        "technical_indicators": obj.technical_indicators or {},
+        "price_target": obj.price_target,
+        "updated_at": obj.updated_at.isoformat() if obj.updated_at else None,
+        "checked_at": obj.checked_at.isoformat() if obj.checked_at else None,
+        "last_error": obj.last_error,
+    }
+
+SIGNAL_FIELDS = ("suggestion", "summary", "signal_history", "technical_indicators", "price_target")
+CHECK_FIELDS = ("content_hash", "etag", "last_modified")
+
+def load_stored_signals(db, symbols: List[str]) -> Dict[str, Dict[str, Any]]:
+    """一次查询读出已保存的信号字段和条件请求头，供 store_signals 比较"""
+    cols = [getattr(ABSignalCache, k) for k in SIGNAL_FIELDS + CHECK_FIELDS]
+    rows = db.execute(select(ABSignalCache.symbol, *cols).where(ABSignalCache.symbol.in_(symbols)))
+    return {row.symbol: {k: getattr(row, k) for k in SIGNAL_FIELDS + CHECK_FIELDS} for row in rows}
+
+def store_signals(db, results: List[Tuple[str, Dict[str, Any]]],
+                  stored: Dict[str, Dict[str, Any]]) -> List[str]:
+    """批量写入抓取结果（不提交），返回信号内容有变化的代码
+
+    - 304、页面指纹相同或解析出的信号相同：只更新检查时间和条件请求头，显式保留
+      updated_at 不被 onupdate 刷新
+    - 抓取失败（带 "error"）：保留已有的信号和条件请求头，只更新检查时间和
+      last_error，不算作变化；没有已保存的行时写入一行占位
+    - 信号有变化：INSERT ... ON CONFLICT DO UPDATE 覆盖全部字段
+    stored 为 load_stored_signals 的结果，写入后会同步更新。
+    """
+    now = datetime.now(timezone.utc)
+    changed_rows, checked_rows, placeholder_rows = [], [], []
+    for sym, data in results:
+        prev = stored.get(sym)
+        if data.get("error"):
+            error = str(data["error"])[:256]
+            if prev:
+                checked_rows.append({"sym": sym, "checked_at": now, "last_error": error,
+                                     **{k: prev[k] for k in CHECK_FIELDS}})
+            else:
+                placeholder_rows.append({"symbol": sym, "summary": data.get("summary"), "signal_history": [],
+                                         "technical_indicators": {}, "checked_at": now, "last_error": error})
+            continue
+        check = {k: data.get(k) for k in CHECK_FIELDS}
+        values = {
+            "suggestion": data.get("suggestion"),
+            "summary": data.get("summary"),
+            "signal_history": data.get("signal_history", []),
+            "technical_indicators": data.get("technical_indicators", {}),
+            "price_target": data.get("price_target"),
+        }
+        if not data.get("changed", True) or (prev and all(prev[k] == values[k] for k in SIGNAL_FIELDS)):
+            if prev:
+                checked_rows.append({"sym": sym, "checked_at": now, "last_error": None, **check})
+                prev.update(check)
+            continue
+        changed_rows.append({"symbol": sym, **values, **check, "checked_at": now, "updated_at": now,
+                             "last_error": None})
+        stored[sym] = {**values, **check}
+
+    if checked_rows:
+        # Core 层的 executemany UPDATE，每行的 SET 列来自参数
+        table = ABSignalCache.__table__
+        db.execute(
+            update(table)
+            .where(table.c.symbol == bindparam("sym"))
+            .values(updated_at=table.c.updated_at),
+            checked_rows,
+        )
+    bulk_upsert(
+        db, ABSignalCache, changed_rows, ["symbol"],
+        update_columns=SIGNAL_FIELDS + CHECK_FIELDS + ("checked_at", "updated_at", "last_error"),
+    )
+    # 并发写入时可能已经有了正常的行，冲突时不覆盖
+    bulk_upsert(db, ABSignalCache, placeholder_rows, ["symbol"])
+    # 信号没变时历史也没变，只有变化的股票需要追加事件
+    store_events(db, [e for r in changed_rows for e in event_rows(r["symbol"], r["signal_history"])])
+    return [r["symbol"] for r in changed_rows]
+
+# 信号页历史表里出现过的日期格式
+_EVENT_DATE_FORMATS = ("%m/%d/%Y", "%m/%d/%y", "%Y-%m-%d", "%m-%d-%Y", "%m-%d-%y")
+
+def parse_event_date(text: str) -> Optional[date]:
+    text = (text or "").strip()
+    for fmt in _EVENT_DATE_FORMATS:
+        try:
+            return datetime.strptime(text, fmt).date()
+        except ValueError:
+            continue
+    return None
+
+def _parse_price(text: Any) -> Optional[float]:
+    try:
+        return float(str(text).replace(",", "").replace("$", ""))
+    except (TypeError, ValueError):
+        return None
+
+def event_rows(symbol: str, history: Iterable[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """把 signal_history 转成 ABSignalEvent 的行，跳过日期无法识别的条目"""
+    rows = []
+    for item in history or []:
+        day = parse_event_date(item.get("date"))
+        signal = (item.get("signal") or "").strip().upper()
+        if day is None or not signal:
+            continue
+        rows.append({"symbol": symbol, "date": day, "signal": signal, "price": _parse_price(item.get("price"))})
+    return rows
+
+def store_events(db, rows: List[Dict[str, Any]]) -> int:
+    """追加历史信号（不提交），已存在的 (symbol, date, signal) 保持不变"""
+    unique = {(r["symbol"], r["date"], r["signal"]): r for r in rows}
+    return bulk_upsert(db, ABSignalEvent, list(unique.values()), ["symbol", "date", "signal"])
+
+def store_signal(db, sym: str, data: Dict[str, Any]) -> bool:
+    """写入单个股票的抓取结果（不提交），返回信号内容是否有变化"""
+    return bool(store_signals(db, [(sym, data)], load_stored_signals(db, [sym])))
+
+def get_cached_signal(symbol: str) -> Optional[Dict[str, Any]]:
+    """先查内存，再查 ABSignalCache 表，都没有时返回 None"""
+    symbol = symbol.upper()
+    cached = _ab_cache.get(symbol)
+    if cached is not None:
+        return cached
+
+    db = SessionLocal()
+    try:
+        obj = db.execute(select(ABSignalCache).where(ABSignalCache.symbol==symbol)).scalar_one_or_none()
+        if not obj:
+            return None
+        data = signal_to_dict(obj)
+    finally:
+        db.close()
+    _ab_cache.set(symbol, data)
+    return data
+
+async def get_cached_signal_async(symbol: str) -> Optional[Dict[str, Any]]:
+    """get_cached_signal 的协程版本，供异步接口使用，查库时不阻塞事件循环"""
+    symbol = symbol.upper()
+    cached = _ab_cache.get(symbol)
+    if cached is not None:
+        return cached
+
+    async with AsyncSessionLocal() as db:
+        obj = (await db.execute(select(ABSignalCache).where(ABSignalCache.symbol==symbol))).scalar_one_or_none()
+        if not obj:
+            return None
+        data = signal_to_dict(obj)
+    _ab_cache.set(symbol, data)
+    return data
+
+def cache_signal(data: Dict[str, Any]):
+    _ab_cache.set(data["symbol"], data)
+
+def invalidate_signal(symbol: str):
+    _ab_cache.pop(symbol.upper())
+
+def ab_cache_stats() -> Dict[str, Any]:
+    return _ab_cache.stats()
+
+def warm_signal_cache() -> int:
+    """启动时从 ABSignalCache 表预热内存缓存"""
+    db = SessionLocal()
+    try:
+        rows = db.execute(select(ABSignalCache)).scalars().all()
+        for obj in rows:
+            _ab_cache.set(obj.symbol, signal_to_dict(obj))
+        logger.info(f"Warmed AB signal cache with {len(rows)} symbols")
+        return len(rows)
+    finally:
+        db.close()
+
+def backfill_signal_events() -> int:
+    """事件表为空时（刚升级）从 ABSignalCache 已保存的 signal_history 导入"""
+    db = SessionLocal()
+    try:
+        if db.execute(select(ABSignalEvent.id).limit(1)).first() is not None:
+            return 0
+        rows = []
+        for sym, history in db.execute(select(ABSignalCache.symbol, ABSignalCache.signal_history)):
+            rows.extend(event_rows(sym, history))
+        count = store_events(db, rows)
+        db.commit()
+        if count:
+            logger.info(f"Backfilled {count} AB signal events")
+        return count
+    finally:
+        db.close()
+
+def query_signal_events(db, symbols: Optional[List[str]] = None, signals: Optional[List[str]] = None,
+                        start: Optional[date] = None, end: Optional[date] = None,
+                        latest: bool = False, limit: int = 500) -> List[Dict[str, Any]]:
+    """按股票、信号类型和日期范围（含两端）查询历史信号，按日期倒序
+
+    latest=True 时每个股票只看它最新的一条信号，用于“本周转为 SELL 的股票”这类查询。
+    """
+    stmt = select(ABSignalEvent)
+    if latest:
+        newest = (
+            select(ABSignalEvent.symbol, func.max(ABSignalEvent.date).label("date"))
+            .group_by(ABSignalEvent.symbol)
+        )
+        if symbols:
+            newest = newest.where(ABSignalEvent.symbol.in_(symbols))
+        newest = newest.subquery()
+        stmt = stmt.join(newest, (ABSignalEvent.symbol == newest.c.symbol) & (ABSignalEvent.date == newest.c.date))
+    if symbols:
+        stmt = stmt.where(ABSignalEvent.symbol.in_(symbols))
+    if signals:
+        stmt = stmt.where(ABSignalEvent.signal.in_(signals))
+    if start:
+        stmt = stmt.where(ABSignalEvent.date >= start)
+    if end:
+        stmt = stmt.where(ABSignalEvent.date <= end)
+    stmt = stmt.order_by(ABSignalEvent.date.desc(), ABSignalEvent.symbol).limit(limit)
+    return [
+        {
+            "symbol": e.symbol,
+            "date": e.date.isoformat(),
+            "signal": e.signal,
+            "price": e.price,
+            "first_seen": e.first_seen.isoformat() if e.first_seen else None,
+        }
+        for e in db.execute(stmt).scalars()
+    ]
@@ -0,0 +1,92 @@
+import os
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, List, Optional
+
+# 是否在响应中返回 Server-Timing 头
+SERVER_TIMING = os.getenv("SERVER_TIMING", "1").lower() not in ("0", "false", "no")
+
+# 当前请求的各阶段耗时：名称 -> [累计秒数, 次数]。请求线程池会复制上下文，
+# 所以同步接口里记录的阶段也会写进同一个 dict；不在请求中时为 None，span 直接跳过。
+_spans: ContextVar[Optional[Dict[str, List[float]]]] = ContextVar("server_timing_spans", default=None)
+
+def record(name: str, seconds: float):
+    spans = _spans.get()
+    if spans is None:
+        return
+    entry = spans.get(name)
+    if entry is None:
+        spans[name] = [seconds, 1]
+    else:
+        entry[0] += seconds
+        entry[1] += 1
+
+@contextmanager
+def span(name: str):
+    """记录一个命名阶段的耗时；同名阶段累加"""
+    if _spans.get() is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(name, time.perf_counter() - start)
+
+def instrument_engine(engine):
+    """把每条 SQL 的执行时间记为 db 阶段"""
+    from sqlalchemy import event
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("timing_start", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        starts = conn.info.get("timing_start")
+        if starts:
+            record("db", time.perf_counter() - starts.pop())
+
+def _header(spans: Dict[str, List[float]], total: float) -> str:
+    parts = []
+    app_time = spans.pop("app", None)
+    handler = spans.get("handler")
+    if app_time and handler:
+        # 路由内除接口函数以外的时间：参数校验和响应序列化
+        spans["serialize"] = [max(0.0, app_time[0] - handler[0]), 1]
+    for name, (seconds, count) in spans.items():
+        desc = f';desc="{int(count)} calls"' if count > 1 else ""
+        parts.append(f"{name};dur={seconds * 1000:.2f}{desc}")
+    parts.append(f"total;dur={total * 1000:.2f}")
+    return ", ".join(parts)
+
+class ServerTimingMiddleware:
+    """为每个请求收集阶段耗时，在响应头 Server-Timing 中返回（ASGI 中间件）
+
+    响应头发出时接口已经执行完，流式响应只包含开始响应前的阶段。
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not SERVER_TIMING:
+            await self.app(scope, receive, send)
+            return
+
+        spans: Dict[str, List[float]] = {}
+        token = _spans.set(spans)
+        start = time.perf_counter()
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                value = _header(dict(spans), time.perf_counter() - start)
+                message = {**message, "headers": [*message.get("headers", []),
+                                                   (b"server-timing", value.encode("latin-1"))]}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            _spans.reset(token)
@@ -0,0 +1,284 @@
+import os
+import asyncio
+import random
+import threading
+import time
+import logging
+from contextlib import contextmanager
+from email.utils import parsedate_to_datetime
+from typing import Dict, Optional
+from urllib.parse import urlparse
+import httpx
+import requests
+from requests.adapters import HTTPAdapter
+from .metrics import UPSTREAM_LATENCY, UPSTREAM_RETRIES
+from .timing import record
+
+logger = logging.getLogger(__name__)
+
+# 连接池：每个主机保持的长连接数
+HTTP_POOL_SIZE = int(os.getenv("HTTP_POOL_SIZE", "10"))
+# 连接失败、超时、429 和 5xx 的重试次数，以及指数退避的基数（秒，带随机抖动）
+HTTP_RETRIES = int(os.getenv("HTTP_RETRIES", "2"))
+HTTP_BACKOFF = float(os.getenv("HTTP_RETRY_BACKOFF_SEC", "0.5"))
+HTTP_BACKOFF_MAX = float(os.getenv("HTTP_RETRY_BACKOFF_MAX_SEC", "10"))
+# 熔断：同一主机连续失败多少次后打开，打开后多久允许一次试探请求
+CIRCUIT_FAIL_THRESHOLD = int(os.getenv("CIRCUIT_FAIL_THRESHOLD", "5"))
+CIRCUIT_COOLDOWN = float(os.getenv("CIRCUIT_COOLDOWN_SEC", "60"))
+
+RETRY_STATUS = frozenset((429, 500, 502, 503, 504))
+RETRY_METHODS = frozenset(("GET", "HEAD", "OPTIONS"))
+
+class CircuitOpenError(requests.ConnectionError):
+    """主机熔断中，请求未发出；继承 RequestException，调用方原有的异常处理仍然适用"""
+
+class CircuitBreaker:
+    """按主机统计连续失败：closed -> open（快速失败）-> half-open（放一个试探请求）"""
+
+    def __init__(self, host: str, threshold: int = CIRCUIT_FAIL_THRESHOLD, cooldown: float = CIRCUIT_COOLDOWN):
+        self.host = host
+        self.threshold = max(1, threshold)
+        self.cooldown = cooldown
+        self._failures = 0
+        self._opened_at: Optional[float] = None
+        self._probing = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            if self._opened_at is None:
+                return "closed"
+            if time.monotonic() - self._opened_at >= self.cooldown:
+                return "half-open"
+            return "open"
+
+    def before_request(self):
+        with self._lock:
+            if self._opened_at is None:
+                return
+            if self._probing or time.monotonic() - self._opened_at < self.cooldown:
+                raise CircuitOpenError(f"circuit open for {self.host}")
+            # 冷却结束，只放行一个试探请求
+            self._probing = True
+
+    def record_success(self):
+        with self._lock:
+            if self._opened_at is not None:
+                logger.info(f"Circuit closed for {self.host}")
+            self._failures = 0
+            self._opened_at = None
+            self._probing = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._probing or (self._opened_at is None and self._failures >= self.threshold):
+                logger.warning(f"Circuit opened for {self.host} after {self._failures} failures")
+                self._opened_at = time.monotonic()
+            self._probing = False
+
+    def release_probe(self):
+        """试探请求没有结果（比如被取消）时放弃试探，下一个请求可以重新试探"""
+        with self._lock:
+            self._probing = False
+
+    @contextmanager
+    def call(self):
+        """包住一次请求（含重试），通过 yield 出的对象记录结果
+
+        循环外的异常（没记录结果就抛出）记为一次失败；取消等 BaseException 只释放
+        试探名额，不会让主机一直停在 half-open。
+        """
+        self.before_request()
+        call = _BreakerCall(self)
+        try:
+            yield call
+        except Exception:
+            if not call.settled:
+                call.failure()
+            raise
+        finally:
+            if not call.settled:
+                self.release_probe()
+
+    def stats(self) -> Dict[str, object]:
+        return {"host": self.host, "state": self.state, "failures": self._failures}
+
+class _BreakerCall:
+    __slots__ = ("breaker", "settled")
+
+    def __init__(self, breaker: CircuitBreaker):
+        self.breaker = breaker
+        self.settled = False
+
+    def success(self):
+        self.settled = True
+        self.breaker.record_success()
+
+    def failure(self):
+        self.settled = True
+        self.breaker.record_failure()
+
+_breakers: Dict[str, CircuitBreaker] = {}
+_breakers_lock = threading.Lock()
+
+def host_breaker(host: str) -> CircuitBreaker:
+    host = host.lower()
+    with _breakers_lock:
+        breaker = _breakers.get(host)
+        if breaker is None:
+            breaker = CircuitBreaker(host)
+            _breakers[host] = breaker
+        return breaker
+
+def check_circuit(host: str):
+    """熔断打开时直接抛出 CircuitOpenError，调用方可以在排队限流之前快速失败"""
+    breaker = host_breaker(host)
+    if breaker.state == "open":
+        raise CircuitOpenError(f"circuit open for {breaker.host}")
+
+def breaker_stats():
+    with _breakers_lock:
+        breakers = list(_breakers.values())
+    return [b.stats() for b in breakers]
+
+def _retry_after(response) -> Optional[float]:
+    value = response.headers.get("Retry-After")
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+def _backoff(attempt: int) -> float:
+    # full jitter：在 [0, base * 2^attempt] 内随机，避免多个线程同时重试
+    return random.uniform(0, min(HTTP_BACKOFF_MAX, HTTP_BACKOFF * (2 ** attempt)))
+
+def _response_delay(response, attempt: int) -> float:
+    delay = _retry_after(response)
+    return _backoff(attempt) if delay is None else min(delay, HTTP_BACKOFF_MAX)
+
+class UpstreamAdapter(HTTPAdapter):
+    """带重试和熔断的连接池适配器，yfinance 传入同一个 Session 后也会经过这里"""
+
+    def __init__(self, retries: int = HTTP_RETRIES, **kwargs):
+        self.retries = retries
+        super().__init__(max_retries=0, **kwargs)
+
+    def send(self, request, **kwargs):
+        breaker = host_breaker(urlparse(request.url).hostname or "")
+        retries = self.retries if request.method in RETRY_METHODS else 0
+
+        with breaker.call() as call:
+            attempt = 0
+            while True:
+                start = time.perf_counter()
+                try:
+                    response = super().send(request, **kwargs)
+                except (requests.ConnectionError, requests.Timeout) as e:
+                    elapsed = time.perf_counter() - start
+                    UPSTREAM_LATENCY.labels(host=breaker.host, status="error").observe(elapsed)
+                    record("upstream", elapsed)
+                    if attempt >= retries:
+                        call.failure()
+                        raise
+                    delay = _backoff(attempt)
+                    logger.info(f"Retrying {request.method} {request.url} in {delay:.2f}s: {e}")
+                else:
+                    elapsed = time.perf_counter() - start
+                    UPSTREAM_LATENCY.labels(host=breaker.host, status=response.status_code).observe(elapsed)
+                    record("upstream", elapsed)
+                    if response.status_code not in RETRY_STATUS:
+                        call.success()
+                        return response
+                    if attempt >= retries:
+                        call.failure()
+                        return response
+                    delay = _response_delay(response, attempt)
+                    logger.info(f"Retrying {request.method} {request.url} in {delay:.2f}s: HTTP {response.status_code}")
+                    response.close()
+                UPSTREAM_RETRIES.labels(host=breaker.host).inc()
+                time.sleep(delay)
+                attempt += 1
+
+def _build_session() -> requests.Session:
+    session = requests.Session()
+    adapter = UpstreamAdapter(pool_connections=HTTP_POOL_SIZE, pool_maxsize=HTTP_POOL_SIZE)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+# 所有上游请求共享的 Session：连接池 + keep-alive
+session = _build_session()
+
+def get(url: str, **kwargs) -> requests.Response:
+    return session.get(url, **kwargs)
+
+# 异步接口共享的 httpx 客户端，在事件循环里首次使用时创建
+_async_client: Optional[httpx.AsyncClient] = None
+
+def _get_async_client() -> httpx.AsyncClient:
+    global _async_client
+    if _async_client is None:
+        _async_client = httpx.AsyncClient(
+            limits=httpx.Limits(max_connections=HTTP_POOL_SIZE, max_keepalive_connections=HTTP_POOL_SIZE),
+            follow_redirects=True,
+        )
+    return _async_client
+
+async def aget(url: str, **kwargs) -> httpx.Response:
+    """get 的异步版本：同样经过熔断、重试和指标统计
+
+    网络错误转换为 requests 的异常类型，调用方原有的异常处理仍然适用。
+    """
+    breaker = host_breaker(urlparse(url).hostname or "")
+    client = _get_async_client()
+
+    with breaker.call() as call:
+        attempt = 0
+        while True:
+            start = time.perf_counter()
+            try:
+                response = await client.get(url, **kwargs)
+            except httpx.TransportError as e:
+                elapsed = time.perf_counter() - start
+                UPSTREAM_LATENCY.labels(host=breaker.host, status="error").observe(elapsed)
+                record("upstream", elapsed)
+                if attempt >= HTTP_RETRIES:
+                    call.failure()
+                    error = requests.Timeout if isinstance(e, httpx.TimeoutException) else requests.ConnectionError
+                    raise error(f"{type(e).__name__}: {e}") from e
+                delay = _backoff(attempt)
+                logger.info(f"Retrying GET {url} in {delay:.2f}s: {e!r}")
+            else:
+                elapsed = time.perf_counter() - start
+                UPSTREAM_LATENCY.labels(host=breaker.host, status=response.status_code).observe(elapsed)
+                record("upstream", elapsed)
+                if response.status_code not in RETRY_STATUS:
+                    call.success()
+                    return response
+                if attempt >= HTTP_RETRIES:
+                    call.failure()
+                    return response
+                delay = _response_delay(response, attempt)
+                logger.info(f"Retrying GET {url} in {delay:.2f}s: HTTP {response.status_code}")
+            UPSTREAM_RETRIES.labels(host=breaker.host).inc()
+            await asyncio.sleep(delay)
+            attempt += 1
+
+def check_status(response: httpx.Response):
+    """httpx 响应的 raise_for_status，抛出 requests.HTTPError"""
+    if response.is_error:
+        raise requests.HTTPError(f"{response.status_code} Error: {response.reason_phrase} for url: {response.url}")
+
+async def aclose():
+    global _async_client
+    client, _async_client = _async_client, None
+    if client is not None:
+        await client.aclose()
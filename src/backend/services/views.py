@@ -0,0 +1,23 @@
+import threading
+from collections import Counter
+from typing import Dict
+
+# 各股票最近被查看的次数，调度器按它决定同一批到期任务的先后顺序
+_views: Counter = Counter()
+_lock = threading.Lock()
+
+def record_view(symbol: str):
+    with _lock:
+        _views[symbol.upper()] += 1
+
+def view_counts() -> Dict[str, float]:
+    with _lock:
+        return dict(_views)
+
+def decay_views(factor: float = 0.5):
+    """按比例衰减计数，让排序反映最近的查看情况"""
+    with _lock:
+        for sym in list(_views):
+            _views[sym] *= factor
+            if _views[sym] < 0.01:
+                del _views[sym]
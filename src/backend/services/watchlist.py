@@ -0,0 +1,233 @@
+import os
+import re
+import csv
+import io
+import json
+import logging
+import secrets
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from sqlalchemy import select, func
+from ..db import SessionLocal, insert_missing
+from ..models import WatchItem
+from . import upstream
+from .cache import TTLCache
+from .prices import get_symbol_info
+from .ratelimit import AB_HOST
+from .events import bus
+from .signals import get_cached_signal, invalidate_signal, load_stored_signals, store_signals
+
+logger = logging.getLogger(__name__)
+
+# 批量导入单次允许的最大股票数，以及并发验证的线程数（实际速率由 AB 的令牌桶控制）
+IMPORT_MAX_SYMBOLS = int(os.getenv("WATCHLIST_IMPORT_MAX", "2000"))
+IMPORT_CONCURRENCY = int(os.getenv("WATCHLIST_IMPORT_CONCURRENCY", os.getenv("AB_MAX_CONCURRENCY", "4")))
+# 导入任务结束后保留结果的时长（秒）
+IMPORT_JOB_TTL = float(os.getenv("WATCHLIST_IMPORT_JOB_TTL_SEC", "3600"))
+
+_SYMBOL_RE = re.compile(r"^[A-Z0-9][A-Z0-9.\-^=]{0,15}$")
+_HEADER_NAMES = {"symbol", "ticker", "code", "代码"}
+
+Entry = Tuple[str, Optional[str]]
+
+def _is_symbol(cell: str) -> bool:
+    return bool(_SYMBOL_RE.match(cell.upper()))
+
+def parse_import_body(body: bytes, content_type: str) -> List[Entry]:
+    r"""解析导入请求：JSON（代码列表、{"symbols": [...]}、[{symbol, name}]）或 CSV/纯文本
+
+    有表头行（symbol/ticker/...）时第一列为代码、第二列为名称；没有表头时只有两列、
+    且第二列不像代码的行才把第二列当作名称，其余每个单元格（含空格分隔的）都是代码。
+    返回 (代码, 名称) 列表。
+
+    >>> parse_import_body(b"AAPL,MSFT,GOOG", "text/csv")
+    [('AAPL', None), ('MSFT', None), ('GOOG', None)]
+    >>> parse_import_body(b"AAPL,Apple Inc.\nMSFT MSFT.MX", "text/csv")
+    [('AAPL', 'Apple Inc.'), ('MSFT', None), ('MSFT.MX', None)]
+    >>> parse_import_body(b"symbol,name\nAAPL,Apple", "text/csv")
+    [('AAPL', 'Apple')]
+    """
+    text = body.decode("utf-8-sig").strip()
+    if not text:
+        return []
+
+    if "json" in (content_type or "") or text[0] in "[{":
+        data = json.loads(text)
+        if isinstance(data, dict):
+            data = data.get("symbols", [])
+        if not isinstance(data, list):
+            raise ValueError("expected a list of symbols")
+        entries = []
+        for item in data:
+            if isinstance(item, dict):
+                entries.append((str(item.get("symbol", "")), item.get("name")))
+            else:
+                entries.append((str(item), None))
+        return entries
+
+    entries = []
+    has_header = False
+    for row in csv.reader(io.StringIO(text)):
+        cells = [c.strip() for c in row]
+        if not cells or not cells[0]:
+            continue
+        if cells[0].lower() in _HEADER_NAMES:
+            has_header = True
+            continue
+        if has_header or (len(cells) == 2 and cells[1] and not _is_symbol(cells[1])):
+            entries.append((cells[0], cells[1] if len(cells) > 1 and cells[1] else None))
+        else:
+            # 一行里用逗号或空格分隔的多个代码
+            entries.extend((sym, None) for cell in cells for sym in cell.split())
+    return entries
+
+def _validate(symbol: str) -> Dict[str, Any]:
+    try:
+        # 上游熔断时不必排队等令牌，直接记为错误
+        upstream.check_circuit(AB_HOST)
+    except upstream.CircuitOpenError as e:
+        return {"valid": False, "error": str(e)}
+    return get_symbol_info(symbol, with_signals=True)
+
+def import_symbols(entries: List[Entry],
+                   progress: Optional[Callable[[int, int], None]] = None) -> List[Dict[str, Any]]:
+    """批量导入：并发验证新代码，一条语句插入有效的行，按输入顺序分配 display_order
+
+    progress(已验证数, 需验证数) 在每个代码验证完成后调用。
+    """
+    results: List[Dict[str, Any]] = []
+    wanted: Dict[str, Optional[str]] = {}
+    for raw, name in entries:
+        sym = (raw or "").upper().strip()
+        if not _SYMBOL_RE.match(sym):
+            results.append({"symbol": sym or raw, "status": "invalid", "name": None})
+        elif sym in wanted:
+            results.append({"symbol": sym, "status": "duplicate", "name": None})
+        else:
+            wanted[sym] = name
+            results.append({"symbol": sym, "status": None, "name": name})
+
+    db = SessionLocal()
+    try:
+        existing = {
+            row.symbol: row.name
+            for row in db.execute(
+                select(WatchItem.symbol, WatchItem.name).where(WatchItem.symbol.in_(list(wanted)))
+            )
+        }
+    finally:
+        db.close()
+
+    pending = [sym for sym in wanted if sym not in existing]
+    logger.info(f"Importing {len(pending)} new symbols ({len(existing)} already in watchlist)")
+    infos = {}
+    if progress:
+        progress(0, len(pending))
+    with ThreadPoolExecutor(max_workers=max(1, IMPORT_CONCURRENCY), thread_name_prefix="wl-import") as pool:
+        for sym, info in zip(pending, pool.map(_validate, pending)):
+            infos[sym] = info
+            if progress:
+                progress(len(infos), len(pending))
+
+    new_rows = []
+    signals = []
+    for r in results:
+        sym = r["symbol"]
+        if r["status"] is not None:
+            continue
+        if sym in existing:
+            r.update(status="exists", name=existing[sym])
+            continue
+        info = infos[sym]
+        if not info.get("valid"):
+            r["status"] = "error" if info.get("error") else "invalid"
+            if info.get("error"):
+                r["error"] = info["error"]
+            continue
+        r.update(status="added", name=wanted[sym] or info.get("name") or sym)
+        new_rows.append({"symbol": sym, "name": r["name"]})
+        if info.get("signals"):
+            signals.append((sym, info["signals"]))
+
+    if new_rows:
+        db = SessionLocal()
+        try:
+            max_order = db.execute(select(func.max(WatchItem.display_order))).scalar() or 0
+            for i, row in enumerate(new_rows, start=1):
+                row["display_order"] = max_order + i
+            # 验证期间可能有单个添加的同名代码，冲突时保留已有的行并记为 exists
+            inserted = insert_missing(db, WatchItem, new_rows, "symbol")
+            raced = dict(db.execute(
+                select(WatchItem.symbol, WatchItem.name)
+                .where(WatchItem.symbol.in_([row["symbol"] for row in new_rows if row["symbol"] not in inserted]))
+            ).all())
+            signals = [(sym, data) for sym, data in signals if sym in inserted]
+            store_signals(db, signals, load_stored_signals(db, [sym for sym, _ in signals]))
+            db.commit()
+        finally:
+            db.close()
+        for r in results:
+            if r["status"] == "added" and r["symbol"] in raced:
+                r.update(status="exists", name=raced[r["symbol"]])
+        for sym, _ in signals:
+            invalidate_signal(sym)
+            data = get_cached_signal(sym)
+            if data:
+                bus.publish("signal", sym, data)
+
+    return results
+
+# ---- 后台导入任务 ----
+# 验证要逐个访问上游并受限流控制，大文件需要很久：导入在后台线程执行，客户端轮询任务状态。
+# 同一时间只跑一个导入任务，其余排队（它们共享同一个上游令牌桶）
+_job_pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="wl-import-job")
+# job_id -> 任务状态，结束后保留 IMPORT_JOB_TTL 秒
+_jobs = TTLCache(1000, IMPORT_JOB_TTL, name="import_jobs")
+_jobs_lock = threading.Lock()
+
+def _update_job(job: Dict[str, Any], **fields):
+    with _jobs_lock:
+        job.update(fields)
+
+def _run_import(job: Dict[str, Any], entries: List[Entry]):
+    _update_job(job, status="running", started_at=time.time())
+    try:
+        results = import_symbols(entries, lambda done, total: _update_job(job, validated=done, to_validate=total))
+    except Exception as e:
+        logger.error(f"Watchlist import {job['id']} failed: {e}")
+        _update_job(job, status="failed", error=str(e), finished_at=time.time())
+        return
+    summary: Dict[str, int] = {}
+    for r in results:
+        summary[r["status"]] = summary.get(r["status"], 0) + 1
+    _update_job(job, status="done", summary=summary, results=results, finished_at=time.time())
+    logger.info(f"Watchlist import {job['id']} finished: {summary}")
+
+def start_import(entries: List[Entry]) -> Dict[str, Any]:
+    """提交后台导入任务，立即返回任务状态"""
+    job = {
+        "id": secrets.token_hex(8), "status": "queued", "total": len(entries),
+        "validated": 0, "to_validate": None, "summary": None, "results": None, "error": None,
+        "created_at": time.time(), "started_at": None, "finished_at": None,
+    }
+    # 排队和运行期间不能过期，结束后再按 IMPORT_JOB_TTL 计算
+    _jobs.set(job["id"], job, ttl=float("inf"))
+    try:
+        future = _job_pool.submit(_run_import, job, entries)
+    except RuntimeError:
+        _jobs.pop(job["id"])
+        raise
+    future.add_done_callback(lambda _: _jobs.set(job["id"], job))
+    return get_import_job(job["id"])
+
+def get_import_job(job_id: str) -> Optional[Dict[str, Any]]:
+    job = _jobs.get(job_id)
+    if job is None:
+        return None
+    with _jobs_lock:
+        return dict(job)
+
+def shutdown_imports():
+    _job_pool.shutdown(wait=False, cancel_futures=True)
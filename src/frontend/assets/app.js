@@ -1,4 +1,6 @@
 const API = location.origin; // 前后端一体化，同一端口
+// 批量接口单次允许的最大股票数，与后端的 MAX_BULK_SYMBOLS 一致
+const MAX_BULK_SYMBOLS = 500;
 const tbody = document.getElementById('tbody');
 const modal = document.getElementById('modal');
 const closeBtn = document.getElementById('modal-close');
@@ -11,15 +13,129 @@ async function jpost(path, data) {
   const r = await fetch(`${API}${path}`, {method:'POST', headers:{'Content-Type':'application/json'}, body:JSON.stringify(data)});
   return r.json();
 }
+// 以二进制格式获取图表数据（格式见后端 services/chart_codec.py），解码为 [{t, p}]
+async function getChart(symbol, query) {
+  const r = await fetch(`${API}/api/chart/${symbol}?${query}&format=binary`);
+  if (!r.ok) throw new Error(`chart ${symbol}: ${r.status}`);
+  const buf = await r.arrayBuffer();
+  const view = new DataView(buf);
+  const n = view.getUint32(4, true);
+  const dt = new Uint32Array(buf, 16, n);
+  const prices = new Float32Array(buf, 16 + 4 * n, n);
+  const points = new Array(n);
+  let t = view.getFloat64(8, true);
+  for (let i = 0; i < n; i++) {
+    t += dt[i] * 1000;
+    points[i] = { t, p: prices[i] };
+  }
+  return { symbol, points };
+}
 async function jdel(path)  { const r = await fetch(`${API}${path}`, {method:'DELETE'}); return r.json(); }
 
 function pctClass(v){ if(v == null) return ''; return v>=0 ? 'up' : 'down'; }
 
+function renderQuote(tr, q) {
+  tr.querySelector('.price').textContent = q.price ? `$${q.price}` : '-';
+  const changeCell = tr.querySelector('.chg');
+  if (q.change !== null) {
+    changeCell.innerHTML = `<span class="${pctClass(q.change)}">${q.change > 0 ? '+' : ''}${q.change}%</span>`;
+  } else {
+    changeCell.textContent = '-';
+  }
+  tr.querySelector('.volume').textContent = q.volume ? formatVolume(q.volume) : '-';
+}
+
+// 批量获取所有行的报价，每 MAX_BULK_SYMBOLS 个一个请求
+async function loadQuotes(rowsBySymbol) {
+  const symbols = Object.keys(rowsBySymbol);
+  const batches = [];
+  for (let i = 0; i < symbols.length; i += MAX_BULK_SYMBOLS) {
+    batches.push(symbols.slice(i, i + MAX_BULK_SYMBOLS));
+  }
+  await Promise.all(batches.map(async (batch) => {
+    const quotes = await jget(`/api/quotes?symbols=${encodeURIComponent(batch.join(','))}`);
+    for (const q of quotes) {
+      const tr = rowsBySymbol[q.symbol];
+      if (tr) renderQuote(tr, q);
+    }
+  }));
+}
+
+function drawSpark(canvas, points) {
+  const ctx = canvas.getContext('2d');
+  if (!points || points.length === 0) return;
+  const labels = points.map(p=>p.t);
+  const data = points.map(p=>p.p);
+  new Chart(ctx, {
+    type:'line',
+    data:{ labels, datasets:[{ data, borderColor:'#4CAF50', borderWidth:1, pointRadius:0, tension:0.3, fill:false }]},
+    options:{ responsive:false, plugins:{legend:{display:false}}, scales:{x:{display:false}, y:{display:false}} }
+  });
+}
+
+function renderAB(tr, ab) {
+  const suggestionSpan = tr.querySelector('.suggestion');
+  const historyDiv = tr.querySelector('.signals-history');
+  
+  // 显示当前建议
+  if (ab.suggestion) {
+    suggestionSpan.innerHTML = `<span class="badge ${getBadgeClass(ab.suggestion)}">${ab.suggestion}</span>`;
+  } else {
+    suggestionSpan.textContent = '无信号';
+  }
+  
+  // 显示历史信号
+  if (ab.signal_history && ab.signal_history.length > 0) {
+    const historyHtml = ab.signal_history.slice(0, 3).map(sig => 
+      `<small class="signal-item">${sig.date} ${sig.signal}</small>`
+    ).join('');
+    historyDiv.innerHTML = historyHtml;
+  }
+}
+
+// 实时推送：订阅当前列表的报价和 AB 信号变更（后端 /api/stream）
+let liveRows = {};
+let stream = null;
+let streamKey = '';
+
+function connectStream(symbols) {
+  // 超过后端单次允许的股票数时订阅全部（后端会返回 400，EventSource 不会重连），
+  // 不在列表里的股票的事件会被忽略
+  const all = symbols.length > MAX_BULK_SYMBOLS;
+  const key = all ? '*' : symbols.slice().sort().join(',');
+  if (stream && key === streamKey && stream.readyState !== EventSource.CLOSED) return;
+  if (stream) stream.close();
+  stream = null;
+  streamKey = key;
+  if (!key || !window.EventSource) return;
+  stream = new EventSource(all ? `${API}/api/stream` : `${API}/api/stream?symbols=${encodeURIComponent(key)}`);
+  stream.addEventListener('quote', (e) => {
+    const q = JSON.parse(e.data);
+    const tr = liveRows[q.symbol];
+    if (tr) renderQuote(tr, q);
+  });
+  stream.addEventListener('signal', (e) => {
+    const ab = JSON.parse(e.data);
+    const tr = liveRows[ab.symbol];
+    if (tr) renderAB(tr, ab);
+  });
+  // 断线后 EventSource 会自动重连，期间由定时轮询兜底
+  stream.onerror = () => console.warn('Live stream disconnected, falling back to polling');
+}
+
+function streamConnected() {
+  return stream !== null && stream.readyState === EventSource.OPEN;
+}
+
 async function loadWatch() {
-  const list = await jget('/api/watchlist');
+  // 一次请求拿到整个监控列表及其缓存数据
+  const rows = await jget('/api/dashboard');
   tbody.innerHTML = '';
-  for (const item of list) {
+  liveRows = {};
+  const missingQuotes = {};
+  for (const item of rows) {
     const tr = document.createElement('tr');
+    liveRows[item.symbol] = tr;
     tr.innerHTML = `
       <td class="symbol-cell">
         <div class="symbol-info">
@@ -43,70 +159,49 @@ async function loadWatch() {
     `;
     tbody.appendChild(tr);
 
-    // 价格 + 涨跌 + 成交量
-    jget(`/api/quote/${item.symbol}`).then(q => {
-      tr.querySelector('.price').textContent = q.price ? `$${q.price}` : '-';
-      const changeCell = tr.querySelector('.chg');
-      if (q.change !== null) {
-        changeCell.innerHTML = `<span class="${pctClass(q.change)}">${q.change > 0 ? '+' : ''}${q.change}%</span>`;
-      } else {
-        changeCell.textContent = '-';
+    // 点击行打开详情
+    tr.style.cursor = 'pointer';
+    tr.addEventListener('click', (e) => {
+      if (!e.target.classList.contains('btn-remove')) {
+        openModal(item.symbol);
       }
-      tr.querySelector('.volume').textContent = q.volume ? formatVolume(q.volume) : '-';
-    }).catch(() => {
-      tr.querySelector('.price').textContent = '错误';
     });
 
-    // 迷你曲线
+    // 价格 + 涨跌 + 成交量（未缓存的稍后批量获取）
+    if (item.quote) {
+      renderQuote(tr, item.quote);
+    } else {
+      missingQuotes[item.symbol] = tr;
+    }
+
+    // 迷你曲线（未缓存时单独请求）
     const canvas = tr.querySelector('.spark');
-    const ctx = canvas.getContext('2d');
-    jget(`/api/chart/${item.symbol}?period=1d&interval=5m`).then(ch => {
-      if (ch.points && ch.points.length > 0) {
-        const labels = ch.points.map(p=>p.t);
-        const data = ch.points.map(p=>p.p);
-        new Chart(ctx, {
-          type:'line',
-          data:{ labels, datasets:[{ data, borderColor:'#4CAF50', borderWidth:1, pointRadius:0, tension:0.3, fill:false }]},
-          options:{ responsive:false, plugins:{legend:{display:false}}, scales:{x:{display:false}, y:{display:false}} }
-        });
-      }
-    }).catch(() => {
-      // 图表加载失败，显示占位符
-      ctx.fillStyle = '#ddd';
-      ctx.fillRect(0, 0, canvas.width, canvas.height);
-    });
+    if (item.sparkline) {
+      drawSpark(canvas, item.sparkline);
+    } else {
+      getChart(item.symbol, 'period=1d&interval=5m&max_points=100').then(ch => drawSpark(canvas, ch.points)).catch(() => {
+        // 图表加载失败，显示占位符
+        const ctx = canvas.getContext('2d');
+        ctx.fillStyle = '#ddd';
+        ctx.fillRect(0, 0, canvas.width, canvas.height);
+      });
+    }
 
-    // AB 信号
-    jget(`/api/ab/${item.symbol}`).then(ab => {
-      const suggestionSpan = tr.querySelector('.suggestion');
-      const historyDiv = tr.querySelector('.signals-history');
-      
-      // 显示当前建议
-      if (ab.suggestion) {
-        suggestionSpan.innerHTML = `<span class="badge ${getBadgeClass(ab.suggestion)}">${ab.suggestion}</span>`;
-      } else {
-        suggestionSpan.textContent = '无信号';
-      }
-      
-      // 显示历史信号
-      if (ab.signal_history && ab.signal_history.length > 0) {
-        const historyHtml = ab.signal_history.slice(0, 3).map(sig => 
-          `<small class="signal-item">${sig.date} ${sig.signal}</small>`
-        ).join('');
-        historyDiv.innerHTML = historyHtml;
-      }
-      
-      // 点击行打开详情
-      tr.style.cursor = 'pointer';
-      tr.addEventListener('click', (e) => {
-        if (!e.target.classList.contains('btn-remove')) {
-          openModal(item.symbol);
-        }
+    // AB 信号（未缓存时单独请求）
+    if (item.ab) {
+      renderAB(tr, item.ab);
+    } else {
+      jget(`/api/ab/${item.symbol}`).then(ab => renderAB(tr, ab)).catch(() => {
+        tr.querySelector('.suggestion').textContent = '加载失败';
       });
-    }).catch(() => {
-      tr.querySelector('.suggestion').textContent = '加载失败';
-    });
+    }
   }
+
+  loadQuotes(missingQuotes).catch(() => {
+    for (const tr of Object.values(missingQuotes)) tr.querySelector('.price').textContent = '错误';
+  });
+
+  connectStream(Object.keys(liveRows));
 }
 
 function formatVolume(volume) {
@@ -138,30 +233,17 @@ async function removeStock(symbol) {
 }
 
 async function refreshPricesOnly() {
-  const rows = tbody.querySelectorAll('tr');
-  
-  for (const row of rows) {
+  const rowsBySymbol = {};
+  for (const row of tbody.querySelectorAll('tr')) {
     const symbolElement = row.querySelector('.symbol-info b');
-    if (!symbolElement) continue;
-    
-    const symbol = symbolElement.textContent;
-    
-    try {
-      // 只更新价格数据，不重新加载图表
-      const quote = await jget(`/api/quote/${symbol}`);
-      
-      row.querySelector('.price').textContent = quote.price ? `$${quote.price}` : '-';
-      const changeCell = row.querySelector('.chg');
-      if (quote.change !== null) {
-        changeCell.innerHTML = `<span class="${pctClass(quote.change)}">${quote.change > 0 ? '+' : ''}${quote.change}%</span>`;
-      } else {
-        changeCell.textContent = '-';
-      }
-      row.querySelector('.volume').textContent = quote.volume ? formatVolume(quote.volume) : '-';
-      
-    } catch (error) {
-      console.warn(`Failed to refresh price for ${symbol}:`, error);
-    }
+    if (symbolElement) rowsBySymbol[symbolElement.textContent] = row;
+  }
+  
+  try {
+    // 只更新价格数据，不重新加载图表
+    await loadQuotes(rowsBySymbol);
+  } catch (error) {
+    console.warn('Failed to refresh prices:', error);
   }
 }
 
@@ -169,7 +251,7 @@ async function openModal(symbol){
   const [q, ab, ch] = await Promise.all([
     jget(`/api/quote/${symbol}`),
     jget(`/api/ab/${symbol}`),
-    jget(`/api/chart/${symbol}?period=5d&interval=15m`)
+    getChart(symbol, 'period=5d&interval=15m')
   ]);
   document.getElementById('m-title').textContent = symbol;
   document.getElementById('m-quote').innerHTML = `Price: <b>${q.price ?? '-'}</b> <span class="${pctClass(q.change)}">${q.change ?? '-'}%</span>`;
@@ -205,8 +287,9 @@ document.getElementById('add-form').addEventListener('submit', async (e)=>{
 // 初次加载
 loadWatch();
 
-// 价格数据每5分钟刷新一次（配合后端缓存）
+// 实时推送断开时，价格数据每5分钟轮询一次（配合后端缓存）
 setInterval(() => {
+  if (streamConnected()) return;
   console.log('Refreshing price data...');
   refreshPricesOnly();
 }, 5 * 60 * 1000);